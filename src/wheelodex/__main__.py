@@ -14,8 +14,15 @@ from sqlalchemy import CursorResult, inspect
 from . import __version__
 from .app import create_app, emit_json_log
 from .dbutil import dbcontext, purge_old_versions
-from .models import EntryPointGroup, OrphanWheel, PyPISerial, Wheel, db
-from .process import process_queue
+from .models import (
+    QUEUE_ORDERS,
+    EntryPointGroup,
+    OrphanWheel,
+    PyPISerial,
+    Wheel,
+    db,
+)
+from .process import process_queue, reprocess
 from .pypi_api import PyPIAPI
 from .scan import scan_changelog, scan_pypi
 
@@ -87,24 +94,251 @@ def scan_changelog_cmd() -> None:
         scan_changelog(serial)
 
 
+def validate_order(
+    _ctx: click.Context, _param: click.Parameter, value: str | None
+) -> list[str] | None:
+    if value is None:
+        return None
+    order = [k.strip() for k in value.split(",") if k.strip()]
+    for k in order:
+        if k not in QUEUE_ORDERS:
+            raise click.BadParameter(
+                f"{k!r} is not one of: {', '.join(QUEUE_ORDERS)}"
+            )
+    return order
+
+
 @main.command("process-queue")
 @click.option(
     "-S", "--max-wheel-size", type=int, help="Maximum size of wheels to process"
 )
-def process_queue_cmd(max_wheel_size: int | None) -> None:
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of wheels to download & analyze concurrently",
+    show_default=True,
+)
+@click.option(
+    "-R",
+    "--remote-oversized",
+    is_flag=True,
+    help="Inspect oversized wheels remotely instead of skipping them",
+)
+@click.option(
+    "--commit-every",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Maximum number of wheels to store per transaction",
+    show_default=True,
+)
+@click.option(
+    "--commit-interval",
+    type=click.FloatRange(min=0, min_open=True),
+    metavar="SECONDS",
+    help="Maximum number of seconds between commits",
+)
+@click.option(
+    "-O",
+    "--order",
+    callback=validate_order,
+    help=(
+        "Comma-separated sort keys to prioritize the queue by"
+        f" (choices: {', '.join(QUEUE_ORDERS)}; default: WHEELODEX_QUEUE_ORDER)"
+    ),
+)
+@click.option(
+    "--max-duration",
+    type=click.FloatRange(min=0, min_open=True),
+    metavar="SECONDS",
+    help="Stop starting new wheels after this many seconds",
+)
+@click.option(
+    "--max-bytes",
+    type=click.IntRange(min=1),
+    help="Stop starting new wheels after downloading this many bytes",
+)
+def process_queue_cmd(
+    max_wheel_size: int | None,
+    workers: int,
+    remote_oversized: bool,
+    commit_every: int,
+    commit_interval: float | None,
+    order: list[str] | None,
+    max_duration: float | None,
+    max_bytes: int | None,
+) -> None:
     """
     Analyze new wheels.
 
     This command downloads & analyzes wheels that have been registered but not
     analyzed yet and adds their data to the database.  Only wheels for the
     latest nonempty version of each project are analyzed.
+
+    With ``--workers N``, wheels are downloaded by N threads and analyzed by N
+    processes at once, while the database is only written to by the main
+    thread.
+
+    With ``--remote-oversized``, wheels larger than the maximum wheel size are
+    inspected in place using HTTP range requests to fetch just their
+    ``*.dist-info`` directories; the contents of such wheels are not verified
+    against their RECORDs.
+
+    By default, each wheel's data is committed to the database individually.
+    With ``--commit-every N`` and/or ``--commit-interval SECONDS``, the data
+    is instead committed in batches of up to N wheels and/or at least every
+    SECONDS seconds.
+
+    Wheels are processed in order of priority as determined by ``--order`` or
+    the ``WHEELODEX_QUEUE_ORDER`` config option.  With ``--max-duration``
+    and/or ``--max-bytes``, the command stops starting new wheels once the
+    given time or download budget is used up, leaving the rest of the queue
+    for the next run.
     """
     if max_wheel_size is None:
         # Setting the option's default to the below expression or a
         # lambdafication thereof doesn't work:
         max_wheel_size = current_app.config.get("WHEELODEX_MAX_WHEEL_SIZE")
     with dbcontext():
-        process_queue(max_wheel_size=max_wheel_size)
+        process_queue(
+            max_wheel_size=max_wheel_size,
+            workers=workers,
+            remote_oversized=remote_oversized,
+            commit_every=commit_every,
+            commit_interval=commit_interval,
+            order=order,
+            max_duration=max_duration,
+            max_bytes=max_bytes,
+        )
+
+
+@main.command("process-metadata")
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of wheels to fetch core metadata for concurrently",
+    show_default=True,
+)
+@click.option(
+    "--commit-every",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Maximum number of wheels to store per transaction",
+    show_default=True,
+)
+@click.option(
+    "--commit-interval",
+    type=click.FloatRange(min=0, min_open=True),
+    metavar="SECONDS",
+    help="Maximum number of seconds between commits",
+)
+def process_metadata_cmd(
+    workers: int, commit_every: int, commit_interval: float | None
+) -> None:
+    """
+    Analyze new wheels' core metadata.
+
+    This command fetches & analyzes the PEP 658 core metadata files of wheels
+    that have been registered but not analyzed yet, populating their
+    dependencies, keywords, and project summaries without downloading the
+    wheels themselves.  Such wheels remain in the queue for `process-queue`,
+    which replaces the partial data once the full wheel is analyzed.  Wheels
+    whose core metadata files are missing or can't be analyzed are marked so
+    that later runs skip them; they are left for `process-queue` as well.
+    """
+    with dbcontext():
+        process_queue(
+            workers=workers,
+            metadata_only=True,
+            commit_every=commit_every,
+            commit_interval=commit_interval,
+        )
+
+
+@main.command("reprocess")
+@click.option(
+    "--before",
+    metavar="VERSION",
+    help="Reprocess data from wheel-inspect versions older than this"
+    " (default: the installed version)",
+)
+@click.option(
+    "--after",
+    metavar="VERSION",
+    help="Only reprocess data from wheel-inspect versions this new or newer",
+)
+@click.option(
+    "-S", "--max-wheel-size", type=int, help="Maximum size of wheels to process"
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of wheels to download & analyze concurrently",
+    show_default=True,
+)
+@click.option(
+    "-R",
+    "--remote-oversized",
+    is_flag=True,
+    help="Inspect oversized wheels remotely instead of skipping them",
+)
+@click.option(
+    "-B",
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=1000,
+    help="Number of wheels to select from the database at a time",
+    show_default=True,
+)
+@click.option(
+    "--commit-every",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Maximum number of wheels to store per transaction",
+    show_default=True,
+)
+@click.option(
+    "--commit-interval",
+    type=click.FloatRange(min=0, min_open=True),
+    metavar="SECONDS",
+    help="Maximum number of seconds between commits",
+)
+def reprocess_cmd(
+    before: str | None,
+    after: str | None,
+    max_wheel_size: int | None,
+    workers: int,
+    remote_oversized: bool,
+    batch_size: int,
+    commit_every: int,
+    commit_interval: float | None,
+) -> None:
+    """
+    Re-analyze wheels with stale data.
+
+    This command re-downloads & re-analyzes wheels whose data was produced by
+    an older version of wheel-inspect than the one installed (or than the
+    version given with ``--before``) and replaces their data with the new
+    results.  Wheels are processed in batches in order of database ID.
+    """
+    if max_wheel_size is None:
+        max_wheel_size = current_app.config.get("WHEELODEX_MAX_WHEEL_SIZE")
+    with dbcontext():
+        reprocess(
+            before=before,
+            after=after,
+            max_wheel_size=max_wheel_size,
+            workers=workers,
+            remote_oversized=remote_oversized,
+            batch_size=batch_size,
+            commit_every=commit_every,
+            commit_interval=commit_interval,
+        )
 
 
 @main.command()
@@ -128,18 +362,14 @@ def dump(dump_all: bool, outfile: str) -> None:
     with dbcontext():
         outfile %= {"serial": PyPISerial.get()}
         with click.open_file(outfile, "w", encoding="utf-8") as fp:
-            q = db.select(Wheel)
-            if not dump_all:
-                q = q.filter(Wheel.data.has())
-            # Dumping in pages gives a needed efficiency boost:
-            page = db.paginate(q, page=1, per_page=100)
-            while True:
-                for whl in page:
-                    click.echo(json.dumps(whl.as_json()), file=fp)
-                if page.has_next:
-                    page = page.next()
-                else:
-                    break
+            for chunk in Wheel.dump_chunks(dump_all=dump_all):
+                for whl in chunk:
+                    # `click.echo()` flushes after every line, which is too
+                    # slow here.
+                    fp.write(json.dumps(whl.as_json()) + "\n")
+                # Nothing is modified, so the chunk's objects can be dropped
+                # from the session to keep memory usage flat:
+                db.session.expunge_all()
 
 
 @main.command()
@@ -5,12 +5,26 @@ from pathlib import Path
 from typing import Any
 from flask import Flask, current_app
 from flask_migrate import Migrate
+from sqlalchemy import make_url
 from . import __version__
 
 DEFAULT_CONFIG = {
     "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
     "SQLALCHEMY_TRACK_MODIFICATIONS": False,
     "WHEELODEX_MAX_WHEEL_SIZE": None,
+    "WHEELODEX_INMEMORY_WHEEL_SIZE": 8 * 1024 * 1024,  # 8 MiB
+    "WHEELODEX_WHEEL_CACHE_DIR": None,
+    "WHEELODEX_WHEEL_CACHE_SIZE": 10 * 1024 * 1024 * 1024,  # 10 GiB
+    "WHEELODEX_QUEUE_CHUNK_SIZE": 1000,
+    "WHEELODEX_QUEUE_ORDER": ["rdepends", "recent", "size"],
+    "WHEELODEX_MAX_RETRIES": 5,
+    "WHEELODEX_RETRY_BACKOFF": 60 * 60,  # 1 hour
+    "WHEELODEX_DOWNLOAD_BANDWIDTH": None,
+    "WHEELODEX_LEASE_DURATION": 60 * 60,  # 1 hour
+    "WHEELODEX_INSPECT_MEMORY_LIMIT": 2 * 1024 * 1024 * 1024,  # 2 GiB
+    "WHEELODEX_INSPECT_CPU_LIMIT": 60 * 60,  # 1 hour per process
+    "WHEELODEX_INSPECT_TIMEOUT": 10 * 60,  # 10 minutes per wheel
+    "WHEELODEX_INSPECT_MAX_TASKS": 100,
     "WHEELODEX_ENTRY_POINTS_PER_PAGE": 100,
     "WHEELODEX_ENTRY_POINT_GROUPS_PER_PAGE": 100,
     "WHEELODEX_RDEPENDS_PER_PAGE": 100,
@@ -20,6 +34,7 @@ DEFAULT_CONFIG = {
     "WHEELODEX_FILE_SEARCH_RESULTS_PER_WHEEL": 5,
     "WHEELODEX_RECENT_WHEELS_QTY": 100,
     "WHEELODEX_STATS_LOG_DIR": None,
+    "WHEELODEX_PROCESS_TRACE": False,
     "WHEELODEX_RDEPENDS_LEADERS_QTY": 100,
 }
 
@@ -30,8 +45,14 @@ def create_app(**kwargs: Any) -> Flask:
     if "WHEELODEX_CONFIG" in os.environ:
         app.config.from_envvar("WHEELODEX_CONFIG")
     app.config.update(kwargs)
-    from .models import db
+    from .models import UPSERT_DIALECTS, db
 
+    backend = make_url(app.config["SQLALCHEMY_DATABASE_URI"]).get_backend_name()
+    if backend not in UPSERT_DIALECTS:
+        raise ValueError(
+            f"Unsupported database backend {backend!r}; wheelodex requires"
+            " PostgreSQL or SQLite"
+        )
     db.init_app(app)
     Migrate(app, db, directory=str(Path(__file__).with_name("migrations")))
     from .views import web
@@ -14,6 +14,7 @@ from flask_sqlalchemy.session import Session
 from sqlalchemy.orm import scoped_session, with_parent
 from .app import emit_json_log
 from .models import OrphanWheel, Project, Version, Wheel, WheelData, db
+from .util import InspectionMode
 
 log = logging.getLogger(__name__)
 
@@ -44,6 +45,8 @@ def remove_wheel(filename: str) -> None:
     p = Project.get_or_none(filename.split("-")[0])
     if p is not None:
         p.update_has_wheels()
+        p.update_latest()
+        p.update_dependencies()
 
 
 def purge_old_versions() -> None:
@@ -51,6 +54,8 @@ def purge_old_versions() -> None:
     For each project with more than one version, keep (a) the latest version if
     it has orphan wheels, (b) the latest version with wheels registered, and
     (c) the latest version with wheel data, and delete all other versions.
+    Data from inspecting only a wheel's core metadata does not count for (c),
+    as it will be replaced once the wheel is fully inspected.
     """
     log.info("BEGIN purge_old_versions")
     start_time = last_commit = datetime.now(timezone.utc)
@@ -60,17 +65,18 @@ def purge_old_versions() -> None:
         for p in list(
             db.session.scalars(
                 db.select(Project)
-                .join(Version)
+                .join(Project.versions)
                 .group_by(Project)
                 .having(db.func.count(Version.id) > 1)
             )
         ):
             seen_latest = False
             latest_wheel = latest_data = None
+            purged_before = purged
             for v, vwheels, vdata, vorphan in db.session.execute(
                 # This queries the versions of project `p`, along with the number
-                # of wheels, number of wheels with data, and number of orphan
-                # wheels each version has:
+                # of wheels, number of wheels with full data, and number of
+                # orphan wheels each version has:
                 db.select(
                     Version,
                     db.func.count(Wheel.id),
@@ -78,11 +84,17 @@ def purge_old_versions() -> None:
                     db.func.count(OrphanWheel.id),
                 )
                 .join_from(Version, Wheel, isouter=True)
-                .join_from(Wheel, WheelData, isouter=True)
+                .join_from(
+                    Wheel,
+                    WheelData,
+                    (WheelData.wheel_id == Wheel.id)
+                    & (WheelData.inspection != InspectionMode.METADATA),
+                    isouter=True,
+                )
                 .join_from(Version, OrphanWheel, isouter=True)
                 .where(with_parent(p, Project.versions))
                 .group_by(Version)
-                .order_by(Version.ordering.desc())
+                .order_by(Version.sort_key.desc())
             ):
                 keep = False
                 if not seen_latest and vorphan:
@@ -120,6 +132,9 @@ def purge_old_versions() -> None:
                     )
                     db.session.delete(v)
                     purged += 1
+            if purged > purged_before:
+                p.update_latest()
+                p.update_dependencies()
             if datetime.now(timezone.utc) - last_commit >= timedelta(hours=1):
                 log.info("Committing ...")
                 db.session.commit()
@@ -0,0 +1,43 @@
+"""
+Add WheelData.inspection
+
+Revision ID: 0ef542eb08db
+Revises: ce07a6a94af5
+Create Date: 2026-10-16 12:00:00.000000+00:00
+"""
+
+from __future__ import annotations
+from collections.abc import Sequence
+from alembic import op
+import sqlalchemy as sa
+
+# Revision identifiers, used by Alembic:
+revision: str = "0ef542eb08db"
+down_revision: str | None = "ce07a6a94af5"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+schema = sa.MetaData()
+
+wheel_data = sa.Table(
+    "wheel_data",
+    schema,
+    sa.Column("id", sa.Integer, primary_key=True, nullable=False),
+    sa.Column("inspection", sa.Unicode(16), nullable=True),
+)
+
+
+def upgrade() -> None:
+    op.add_column("wheel_data", sa.Column("inspection", sa.Unicode(16), nullable=True))
+    conn = op.get_bind()
+    # All data stored before this migration came from full downloads:
+    conn.execute(wheel_data.update().values(inspection="full"))
+    with op.batch_alter_table("wheel_data", schema=None) as batch_op:
+        batch_op.alter_column(
+            "inspection", existing_type=sa.Unicode(16), nullable=False
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("wheel_data", schema=None) as batch_op:
+        batch_op.drop_column("inspection")
@@ -0,0 +1,39 @@
+"""
+Add Wheel.retries and Wheel.retry_after
+
+Revision ID: 0ad0d5732005
+Revises: 0ef542eb08db
+Create Date: 2026-10-16 18:00:00.000000+00:00
+"""
+
+from __future__ import annotations
+from collections.abc import Sequence
+from alembic import op
+import sqlalchemy as sa
+
+# Revision identifiers, used by Alembic:
+revision: str = "0ad0d5732005"
+down_revision: str | None = "0ef542eb08db"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "wheels",
+        sa.Column("retries", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "wheels",
+        sa.Column("retry_after", sa.DateTime(timezone=True), nullable=True),
+    )
+    with op.batch_alter_table("wheels", schema=None) as batch_op:
+        batch_op.alter_column(
+            "retries", existing_type=sa.Integer(), server_default=None
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("wheels", schema=None) as batch_op:
+        batch_op.drop_column("retry_after")
+        batch_op.drop_column("retries")
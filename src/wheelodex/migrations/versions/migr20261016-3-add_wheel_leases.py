@@ -0,0 +1,34 @@
+"""
+Add Wheel.leased_by and Wheel.lease_expires
+
+Revision ID: 5fe7e47b49a6
+Revises: 0ad0d5732005
+Create Date: 2026-10-16 19:00:00.000000+00:00
+"""
+
+from __future__ import annotations
+from collections.abc import Sequence
+from alembic import op
+import sqlalchemy as sa
+
+# Revision identifiers, used by Alembic:
+revision: str = "5fe7e47b49a6"
+down_revision: str | None = "0ad0d5732005"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column("wheels", sa.Column("leased_by", sa.Unicode(255), nullable=True))
+    op.add_column(
+        "wheels",
+        sa.Column("lease_expires", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("wheels_leased_by_idx", "wheels", ["leased_by"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("wheels_leased_by_idx", table_name="wheels")
+    with op.batch_alter_table("wheels", schema=None) as batch_op:
+        batch_op.drop_column("lease_expires")
+        batch_op.drop_column("leased_by")
@@ -0,0 +1,99 @@
+"""
+Replace Version.ordering with Version.sort_key
+
+Revision ID: 3c1e9a7f62d4
+Revises: 5fe7e47b49a6
+Create Date: 2026-10-16 20:00:00.000000+00:00
+"""
+
+from __future__ import annotations
+from collections.abc import Sequence
+from alembic import op
+from packaging.version import InvalidVersion
+import sqlalchemy as sa
+from wheelodex.util import version_sort_bytes
+
+# Revision identifiers, used by Alembic:
+revision: str = "3c1e9a7f62d4"
+down_revision: str | None = "5fe7e47b49a6"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+BATCH_SIZE = 10000
+
+schema = sa.MetaData()
+
+version = sa.Table(
+    "versions",
+    schema,
+    sa.Column("id", sa.Integer, primary_key=True, nullable=False),
+    sa.Column("project_id", sa.Integer, nullable=False),
+    sa.Column("name", sa.Unicode(2048), nullable=False),
+    sa.Column("sort_key", sa.LargeBinary, nullable=True),
+    sa.Column("ordering", sa.Integer, nullable=False, default=0),
+)
+
+
+def sort_key(name: str) -> bytes:
+    try:
+        return version_sort_bytes(name)
+    except InvalidVersion:
+        # Legacy versions from before packaging dropped support for them sort
+        # below everything else.
+        return b""
+
+
+def upgrade() -> None:
+    op.add_column("versions", sa.Column("sort_key", sa.LargeBinary(), nullable=True))
+    conn = op.get_bind()
+    last = 0
+    while True:
+        rows = conn.execute(
+            sa.select(version.c.id, version.c.name)
+            .where(version.c.id > last)
+            .order_by(version.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            version.update()
+            .where(version.c.id == sa.bindparam("vid"))
+            .values(sort_key=sa.bindparam("key")),
+            [{"vid": vid, "key": sort_key(name)} for vid, name in rows],
+        )
+        last = rows[-1][0]
+    with op.batch_alter_table("versions", schema=None) as batch_op:
+        batch_op.alter_column(
+            "sort_key", existing_type=sa.LargeBinary(), nullable=False
+        )
+        batch_op.drop_column("ordering")
+    op.create_index(
+        "versions_project_sort_key_idx",
+        "versions",
+        ["project_id", "sort_key"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("versions_project_sort_key_idx", table_name="versions")
+    op.add_column(
+        "versions",
+        sa.Column("ordering", sa.Integer(), nullable=False, server_default="0"),
+    )
+    lower = version.alias("lower")
+    op.execute(
+        version.update().values(
+            ordering=sa.select(sa.func.count())
+            .select_from(lower)
+            .where(lower.c.project_id == version.c.project_id)
+            .where(lower.c.sort_key < version.c.sort_key)
+            .scalar_subquery()
+        )
+    )
+    with op.batch_alter_table("versions", schema=None) as batch_op:
+        batch_op.alter_column(
+            "ordering", existing_type=sa.Integer(), server_default=None
+        )
+        batch_op.drop_column("sort_key")
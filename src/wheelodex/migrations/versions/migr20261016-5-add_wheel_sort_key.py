@@ -0,0 +1,89 @@
+"""
+Replace Wheel.ordering with Wheel.sort_key
+
+Revision ID: d2ed3f9037ff
+Revises: 3c1e9a7f62d4
+Create Date: 2026-10-16 21:00:00.000000+00:00
+"""
+
+from __future__ import annotations
+from collections.abc import Sequence
+from alembic import op
+import sqlalchemy as sa
+from wheelodex.wheel_sort import wheel_sort_bytes
+
+# Revision identifiers, used by Alembic:
+revision: str = "d2ed3f9037ff"
+down_revision: str | None = "3c1e9a7f62d4"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+BATCH_SIZE = 10000
+
+schema = sa.MetaData()
+
+wheel = sa.Table(
+    "wheels",
+    schema,
+    sa.Column("id", sa.Integer, primary_key=True, nullable=False),
+    sa.Column("filename", sa.Unicode(2048), nullable=False, unique=True),
+    sa.Column("version_id", sa.Integer, nullable=False),
+    sa.Column("sort_key", sa.LargeBinary, nullable=True),
+    sa.Column("ordering", sa.Integer, nullable=False, default=0),
+)
+
+
+def upgrade() -> None:
+    op.add_column("wheels", sa.Column("sort_key", sa.LargeBinary(), nullable=True))
+    conn = op.get_bind()
+    last = 0
+    while True:
+        rows = conn.execute(
+            sa.select(wheel.c.id, wheel.c.filename)
+            .where(wheel.c.id > last)
+            .order_by(wheel.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            wheel.update()
+            .where(wheel.c.id == sa.bindparam("wid"))
+            .values(sort_key=sa.bindparam("key")),
+            [{"wid": wid, "key": wheel_sort_bytes(fname)} for wid, fname in rows],
+        )
+        last = rows[-1][0]
+    with op.batch_alter_table("wheels", schema=None) as batch_op:
+        batch_op.alter_column(
+            "sort_key", existing_type=sa.LargeBinary(), nullable=False
+        )
+        batch_op.drop_column("ordering")
+    op.create_index(
+        "wheels_version_sort_key_idx",
+        "wheels",
+        ["version_id", "sort_key"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("wheels_version_sort_key_idx", table_name="wheels")
+    op.add_column(
+        "wheels",
+        sa.Column("ordering", sa.Integer(), nullable=False, server_default="0"),
+    )
+    lower = wheel.alias("lower")
+    op.execute(
+        wheel.update().values(
+            ordering=sa.select(sa.func.count())
+            .select_from(lower)
+            .where(lower.c.version_id == wheel.c.version_id)
+            .where(lower.c.sort_key < wheel.c.sort_key)
+            .scalar_subquery()
+        )
+    )
+    with op.batch_alter_table("wheels", schema=None) as batch_op:
+        batch_op.alter_column(
+            "ordering", existing_type=sa.Integer(), server_default=None
+        )
+        batch_op.drop_column("sort_key")
@@ -0,0 +1,103 @@
+"""
+Add Project.latest_version_id and Project.preferred_wheel_id
+
+Revision ID: 8b41f06ac2e5
+Revises: d2ed3f9037ff
+Create Date: 2026-10-16 22:00:00.000000+00:00
+"""
+
+from __future__ import annotations
+from collections.abc import Sequence
+from alembic import op
+import sqlalchemy as sa
+
+# Revision identifiers, used by Alembic:
+revision: str = "8b41f06ac2e5"
+down_revision: str | None = "d2ed3f9037ff"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+schema = sa.MetaData()
+
+project = sa.Table(
+    "projects",
+    schema,
+    sa.Column("id", sa.Integer, primary_key=True, nullable=False),
+    sa.Column("latest_version_id", sa.Integer, nullable=True),
+    sa.Column("preferred_wheel_id", sa.Integer, nullable=True),
+)
+
+version = sa.Table(
+    "versions",
+    schema,
+    sa.Column("id", sa.Integer, primary_key=True, nullable=False),
+    sa.Column("project_id", sa.Integer, nullable=False),
+    sa.Column("sort_key", sa.LargeBinary, nullable=False),
+)
+
+wheel = sa.Table(
+    "wheels",
+    schema,
+    sa.Column("id", sa.Integer, primary_key=True, nullable=False),
+    sa.Column("version_id", sa.Integer, nullable=False),
+    sa.Column("sort_key", sa.LargeBinary, nullable=False),
+)
+
+wheel_data = sa.Table(
+    "wheel_data",
+    schema,
+    sa.Column("id", sa.Integer, primary_key=True, nullable=False),
+    sa.Column("wheel_id", sa.Integer, nullable=False),
+    sa.Column("inspection", sa.Unicode(16), nullable=False),
+)
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("projects", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("latest_version_id", sa.Integer(), nullable=True))
+        batch_op.add_column(
+            sa.Column("preferred_wheel_id", sa.Integer(), nullable=True)
+        )
+        batch_op.create_foreign_key(
+            "projects_latest_version_id_fkey",
+            "versions",
+            ["latest_version_id"],
+            ["id"],
+            ondelete="SET NULL",
+            use_alter=True,
+        )
+        batch_op.create_foreign_key(
+            "projects_preferred_wheel_id_fkey",
+            "wheels",
+            ["preferred_wheel_id"],
+            ["id"],
+            ondelete="SET NULL",
+            use_alter=True,
+        )
+    op.execute(
+        project.update().values(
+            latest_version_id=sa.select(version.c.id)
+            .where(version.c.project_id == project.c.id)
+            .order_by(version.c.sort_key.desc())
+            .limit(1)
+            .scalar_subquery(),
+            preferred_wheel_id=sa.select(wheel.c.id)
+            .join(version, wheel.c.version_id == version.c.id)
+            .join(wheel_data, wheel_data.c.wheel_id == wheel.c.id)
+            .where(version.c.project_id == project.c.id)
+            .where(wheel_data.c.inspection != "metadata")
+            .order_by(version.c.sort_key.desc(), wheel.c.sort_key.desc())
+            .limit(1)
+            .scalar_subquery(),
+        )
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("projects", schema=None) as batch_op:
+        batch_op.drop_constraint(
+            "projects_preferred_wheel_id_fkey", type_="foreignkey"
+        )
+        batch_op.drop_constraint("projects_latest_version_id_fkey", type_="foreignkey")
+        batch_op.drop_column("preferred_wheel_id")
+        batch_op.drop_column("latest_version_id")
@@ -0,0 +1,44 @@
+"""
+Store WheelData.raw_data as JSONB on PostgreSQL
+
+Revision ID: 4e7d2b90c1a8
+Revises: 8b41f06ac2e5
+Create Date: 2026-10-16 23:00:00.000000+00:00
+"""
+
+from __future__ import annotations
+from collections.abc import Sequence
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+# Revision identifiers, used by Alembic:
+revision: str = "4e7d2b90c1a8"
+down_revision: str | None = "8b41f06ac2e5"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # Other databases continue to use plain JSON.
+    if op.get_bind().dialect.name == "postgresql":
+        op.alter_column(
+            "wheel_data",
+            "raw_data",
+            type_=JSONB(),
+            existing_type=sa.JSON(),
+            existing_nullable=False,
+            postgresql_using="raw_data::jsonb",
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.alter_column(
+            "wheel_data",
+            "raw_data",
+            type_=sa.JSON(),
+            existing_type=JSONB(),
+            existing_nullable=False,
+            postgresql_using="raw_data::json",
+        )
@@ -0,0 +1,103 @@
+"""
+Add project_dependencies table and Project.rdepends_qty
+
+Revision ID: a93c5e1f7b26
+Revises: 4e7d2b90c1a8
+Create Date: 2026-10-16 23:30:00.000000+00:00
+"""
+
+from __future__ import annotations
+from collections.abc import Sequence
+from alembic import op
+import sqlalchemy as sa
+
+# Revision identifiers, used by Alembic:
+revision: str = "a93c5e1f7b26"
+down_revision: str | None = "4e7d2b90c1a8"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+schema = sa.MetaData()
+
+project = sa.Table(
+    "projects",
+    schema,
+    sa.Column("id", sa.Integer, primary_key=True, nullable=False),
+    sa.Column("rdepends_qty", sa.Integer, nullable=False),
+)
+
+dependency_tbl = sa.Table(
+    "dependency_tbl",
+    schema,
+    sa.Column("wheel_data_id", sa.Integer, primary_key=True, nullable=False),
+    sa.Column("project_id", sa.Integer, primary_key=True, nullable=False),
+    sa.Column("source_project_id", sa.Integer, nullable=False),
+)
+
+project_dependencies = sa.Table(
+    "project_dependencies",
+    schema,
+    sa.Column("project_id", sa.Integer, primary_key=True, nullable=False),
+    sa.Column("source_project_id", sa.Integer, primary_key=True, nullable=False),
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "project_dependencies",
+        sa.Column("project_id", sa.Integer(), nullable=False),
+        sa.Column("source_project_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["project_id"], ["projects.id"], ondelete="RESTRICT"),
+        sa.ForeignKeyConstraint(
+            ["source_project_id"], ["projects.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("project_id", "source_project_id"),
+    )
+    op.create_index(
+        "project_dependencies_source_project_id_idx",
+        "project_dependencies",
+        ["source_project_id"],
+        unique=False,
+    )
+    op.add_column(
+        "projects",
+        sa.Column("rdepends_qty", sa.Integer(), nullable=False, server_default="0"),
+    )
+    with op.batch_alter_table("projects", schema=None) as batch_op:
+        batch_op.alter_column(
+            "rdepends_qty", existing_type=sa.Integer(), server_default=None
+        )
+    op.execute(
+        project_dependencies.insert().from_select(
+            ["project_id", "source_project_id"],
+            sa.select(
+                dependency_tbl.c.project_id, dependency_tbl.c.source_project_id
+            ).distinct(),
+        )
+    )
+    op.execute(
+        project.update()
+        .values(
+            rdepends_qty=sa.select(sa.func.count())
+            .select_from(project_dependencies)
+            .where(project_dependencies.c.project_id == project.c.id)
+            .scalar_subquery()
+        )
+        .where(
+            project.c.id.in_(sa.select(project_dependencies.c.project_id).distinct())
+        )
+    )
+    op.create_index(
+        "projects_rdepends_qty_idx", "projects", ["rdepends_qty"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("projects_rdepends_qty_idx", table_name="projects")
+    with op.batch_alter_table("projects", schema=None) as batch_op:
+        batch_op.drop_column("rdepends_qty")
+    op.drop_index(
+        "project_dependencies_source_project_id_idx",
+        table_name="project_dependencies",
+    )
+    op.drop_table("project_dependencies")
@@ -0,0 +1,39 @@
+"""
+Add Wheel.metadata_unavailable
+
+Revision ID: 6b1e4c0f9d37
+Revises: a93c5e1f7b26
+Create Date: 2026-10-16 23:45:00.000000+00:00
+"""
+
+from __future__ import annotations
+from collections.abc import Sequence
+from alembic import op
+import sqlalchemy as sa
+
+# Revision identifiers, used by Alembic:
+revision: str = "6b1e4c0f9d37"
+down_revision: str | None = "a93c5e1f7b26"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "wheels",
+        sa.Column(
+            "metadata_unavailable",
+            sa.Boolean(),
+            nullable=False,
+            server_default=sa.false(),
+        ),
+    )
+    with op.batch_alter_table("wheels", schema=None) as batch_op:
+        batch_op.alter_column(
+            "metadata_unavailable", existing_type=sa.Boolean(), server_default=None
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("wheels", schema=None) as batch_op:
+        batch_op.drop_column("metadata_unavailable")
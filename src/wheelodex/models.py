@@ -1,26 +1,37 @@
 """Database classes"""
 
 from __future__ import annotations
-from collections.abc import Sequence
-from datetime import datetime, timezone
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from datetime import datetime, timedelta, timezone
 from itertools import groupby
-from typing import TYPE_CHECKING, Annotated, Any, cast
+from typing import TYPE_CHECKING, Annotated, Any, TypeVar, cast
 from flask_sqlalchemy import SQLAlchemy
 from packaging.utils import canonicalize_name as normalize
 from packaging.utils import canonicalize_version as normversion
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
     MappedAsDataclass,
+    Session,
+    aliased,
+    joinedload,
     mapped_column,
     registry,
     relationship,
+    selectinload,
 )
 from wheel_inspect import __version__ as wheel_inspect_version
 from . import __version__
-from .util import JsonWheel, JsonWheelMeta, JsonWheelPyPI, version_sort_key
-from .wheel_sort import wheel_sort_key
+from .util import (
+    InspectionMode,
+    JsonWheel,
+    json_datetime,
+    version_sort_bytes,
+)
+from .wheel_sort import wheel_sort_bytes
 
 
 # <https://mike.depalatis.net/blog/sqlalchemy-timestamps.html>
@@ -43,6 +54,10 @@ class Base(DeclarativeBase):
 PKey = Annotated[int, mapped_column(primary_key=True)]
 Str2048 = Annotated[str, mapped_column(sa.Unicode(2048))]
 
+# On PostgreSQL, store JSON as JSONB, which takes less space than the JSON
+# text and is compressed when large.
+JsonData = sa.JSON().with_variant(JSONB(), "postgresql")
+
 db = SQLAlchemy(model_class=Base)
 
 # <https://github.com/pallets-eco/flask-sqlalchemy/issues/1186>
@@ -52,6 +67,24 @@ else:
     Model = db.Model
 
 
+#: The database backends supported by wheelodex, mapped to the functions for
+#: constructing their ``INSERT ... ON CONFLICT`` statements.  `create_app()`
+#: refuses to configure any other backend.
+UPSERT_DIALECTS: dict[str, Callable[[Any], postgresql.Insert | sqlite.Insert]] = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def upsert(model: type[Any]) -> postgresql.Insert | sqlite.Insert:
+    """
+    Returns an ``INSERT`` statement for ``model`` that supports the ``ON
+    CONFLICT`` clause via ``on_conflict_do_nothing()`` &
+    ``on_conflict_do_update()``
+    """
+    return UPSERT_DIALECTS[db.session.get_bind().dialect.name](model)
+
+
 class PyPISerial(MappedAsDataclass, Model):
     """
     A table for storing the serial ID of the last PyPI event seen.  There
@@ -115,10 +148,48 @@ class Project(MappedAsDataclass, Model):
         back_populates="project",
         cascade="all, delete-orphan",
         passive_deletes=True,
+        foreign_keys="Version.project_id",
         init=False,
     )
     #: Whether this project has any wheels known to the database
     has_wheels: Mapped[bool] = mapped_column(default=False)
+    #: The number of projects that depend on this project, i.e., the number of
+    #: `ProjectDependency` edges pointing to it.  This is kept up to date by
+    #: `add_dependencies()` and `update_dependencies()`, and so it changes as
+    #: the processing queue is worked through.
+    rdepends_qty: Mapped[int] = mapped_column(default=0, init=False)
+    latest_version_id: Mapped[int | None] = mapped_column(
+        sa.ForeignKey("versions.id", ondelete="SET NULL", use_alter=True),
+        default=None,
+        init=False,
+    )
+    #: The `Version` for this `Project` with the highest ``sort_key`` value,
+    #: or `None` if there are no `Version`\\s.  This is kept up to date by
+    #: `ensure_version()`, `remove_version()`, and `update_latest()`.
+    latest_version: Mapped[Version | None] = relationship(
+        foreign_keys=[latest_version_id],
+        post_update=True,
+        init=False,
+        repr=False,
+        compare=False,
+    )
+    preferred_wheel_id: Mapped[int | None] = mapped_column(
+        sa.ForeignKey("wheels.id", ondelete="SET NULL", use_alter=True),
+        default=None,
+        init=False,
+    )
+    #: The project's "preferred wheel": the most preferred wheel with data for
+    #: the latest version that has any wheels with data.  Data from inspecting
+    #: only a wheel's core metadata (`InspectionMode.METADATA`) lacks the
+    #: wheel's files & modules and so is not counted.  This is kept up to date
+    #: by `Wheel.set_data()`, `remove_version()`, and `update_latest()`.
+    preferred_wheel: Mapped[Wheel | None] = relationship(
+        foreign_keys=[preferred_wheel_id],
+        post_update=True,
+        init=False,
+        repr=False,
+        compare=False,
+    )
 
     @classmethod
     def ensure(cls, name: str) -> Project:
@@ -126,13 +197,21 @@ class Project(MappedAsDataclass, Model):
         Construct a `Project` with the given name and return it.  If such a
         project already exists, return that one instead.
         """
-        proj = db.session.scalars(
-            db.select(cls).filter_by(name=normalize(name))
-        ).one_or_none()
-        if proj is None:
-            proj = cls(name=normalize(name), display_name=name)
-            db.session.add(proj)
-        return proj
+        return cls.ensure_many([name])[normalize(name)]
+
+    @classmethod
+    def ensure_many(cls, names: Iterable[str]) -> dict[str, Project]:
+        """
+        Like `ensure()`, but for multiple project names at once, looking up all
+        of the projects not already seen in the current transaction in a
+        single query.  Returns a `dict` mapping the normalized forms of the
+        names to their `Project`\\s.  If multiple names normalize to the same
+        name for a new project, the first is used as its display name.
+        """
+        new: dict[str, dict[str, Any]] = {}
+        for n in names:
+            new.setdefault(normalize(n), {"name": normalize(n), "display_name": n})
+        return ensure_named(cls, new)
 
     @classmethod
     def get_or_none(cls, name: str) -> Project | None:
@@ -145,51 +224,58 @@ class Project(MappedAsDataclass, Model):
         ).one_or_none()
 
     @property
-    def latest_version(self) -> Version | None:
+    def best_wheel(self) -> Wheel | None:
         """
-        The `Version` for this `Project` with the highest ``ordering`` value,
-        or `None` if there are no `Version`\\s
+        The project's preferred wheel, if it exists (i.e., if any of the
+        project's wheels have data); otherwise, the most preferred wheel for the
+        latest version with wheels
         """
+        if self.preferred_wheel is not None:
+            return self.preferred_wheel
         return db.session.scalars(
-            db.select(Version)
-            .filter_by(project=self)
-            .order_by(Version.ordering.desc())
+            db.select(Wheel)
+            .join(Wheel.version)
+            .filter(Version.project == self)
+            .order_by(Version.sort_key.desc())
+            .order_by(Wheel.sort_key.desc())
             .limit(1)
         ).first()
 
-    @property
-    def preferred_wheel(self) -> Wheel | None:
+    def update_latest(self) -> None:
         """
-        The project's "preferred wheel": the highest-ordered wheel with data
-        for the highest-ordered version
+        Recompute the project's ``latest_version`` and ``preferred_wheel``
+        from scratch.  This must be called after deleting any of the project's
+        versions or wheels by means other than `remove_version()`.
         """
-        return db.session.scalars(
+        self.latest_version = db.session.scalars(
+            db.select(Version)
+            .filter_by(project=self)
+            .order_by(Version.sort_key.desc())
+            .limit(1)
+        ).first()
+        self.preferred_wheel = db.session.scalars(
             db.select(Wheel)
-            .join(Version)
+            .join(Wheel.version)
             .filter(Version.project == self)
-            .filter(Wheel.data.has())
-            .order_by(Version.ordering.desc())
-            .order_by(Wheel.ordering.desc())
+            .filter(Wheel.data.has(WheelData.inspection != InspectionMode.METADATA))
+            .order_by(Version.sort_key.desc())
+            .order_by(Wheel.sort_key.desc())
             .limit(1)
         ).first()
 
-    @property
-    def best_wheel(self) -> Wheel | None:
+    def note_wheel_data(self, whl: Wheel) -> None:
         """
-        The project's preferred wheel, if it exists (i.e., if any of the
-        project's wheels have data); otherwise, the highest-ordered wheel for
-        the highest-ordered version
+        Update the project's ``preferred_wheel`` to account for ``whl`` (one
+        of the project's wheels) having gained data
         """
-        return db.session.scalars(
-            db.select(Wheel)
-            .join(Version)
-            .filter(Version.project == self)
-            .outerjoin(WheelData)
-            .order_by(WheelData.id.isnot(None).desc())
-            .order_by(Version.ordering.desc())
-            .order_by(Wheel.ordering.desc())
-            .limit(1)
-        ).first()
+        if whl.data is None or whl.data.inspection is InspectionMode.METADATA:
+            return
+        pref = self.preferred_wheel
+        if pref is None or (whl.version.sort_key, whl.sort_key) > (
+            pref.version.sort_key,
+            pref.sort_key,
+        ):
+            self.preferred_wheel = whl
 
     def versions_wheels_grid(self) -> list[tuple[str, list[tuple[Wheel, bool]]]]:
         """
@@ -198,8 +284,8 @@ class Project(MappedAsDataclass, Model):
         element is a `Version`'s ``display_name`` and the second element is a
         list of ``(Wheel, bool)`` pairs listing the wheels for that version and
         whether they have data.  The versions are ordered from highest
-        ``ordering`` to lowest, and the `Wheel`\\s within each version are
-        ordered from highest ``ordering`` to lowest.  Versions that do not have
+        ``sort_key`` to lowest, and the `Wheel`\\s within each version are
+        ordered from highest ``sort_key`` to lowest.  Versions that do not have
         wheels are ignored.
         """
         q = db.session.execute(
@@ -207,8 +293,8 @@ class Project(MappedAsDataclass, Model):
             .join(Wheel, Version.wheels)
             .outerjoin(WheelData)
             .filter(Version.project == self)
-            .order_by(Version.ordering.desc())
-            .order_by(Wheel.ordering.desc())
+            .order_by(Version.sort_key.desc())
+            .order_by(Wheel.sort_key.desc())
         )
         results = []
         for v, ws in groupby(q, lambda r: r[0]):
@@ -229,30 +315,98 @@ class Project(MappedAsDataclass, Model):
         Returns a query object that returns all `Project`\\s that depend on
         this `Project`, ordered by name.
         """
-        subq = (
-            db.select(Project.id.distinct().label("id"))
-            .join(
-                DependencyRelation, Project.id == DependencyRelation.source_project_id
-            )
-            .where(DependencyRelation.project_id == self.id)
-            .subquery()
-        )
         return cast(
             sa.Select,
             db.select(Project)
-            .join(subq, Project.id == subq.c.id)
+            .join(ProjectDependency, Project.id == ProjectDependency.source_project_id)
+            .where(ProjectDependency.project_id == self.id)
             .order_by(Project.name.asc()),
         )
 
     def rdepends_count(self) -> int:
         """Returns the number of `Project`\\s that depend on this `Project`"""
-        r = db.session.scalar(
-            db.select(
-                db.func.count(DependencyRelation.source_project_id.distinct())
-            ).where(DependencyRelation.project_id == self.id)
+        return self.rdepends_qty
+
+    def add_dependencies(self, projects: Iterable[Project]) -> None:
+        """
+        Record in the project dependency graph that this project depends on
+        each of ``projects``, adding only the edges that don't already exist
+        """
+        ids = {p.id for p in projects}
+        if ids:
+            ids.difference_update(
+                db.session.scalars(
+                    db.select(ProjectDependency.project_id)
+                    .where(ProjectDependency.source_project_id == self.id)
+                    .where(ProjectDependency.project_id.in_(ids))
+                )
+            )
+            self.change_dependencies(added=ids, removed=set())
+
+    def update_dependencies(self) -> None:
+        """
+        Recompute this project's edges in the project dependency graph from
+        the `DependencyRelation`\\s of its wheels.  This must be called after
+        deleting any of the project's `WheelData`\\s, whether directly or by
+        deleting their wheels or versions.
+        """
+        current = set(
+            db.session.scalars(
+                db.select(ProjectDependency.project_id).where(
+                    ProjectDependency.source_project_id == self.id
+                )
+            )
+        )
+        actual = set(
+            db.session.scalars(
+                db.select(DependencyRelation.project_id)
+                .where(DependencyRelation.source_project_id == self.id)
+                .distinct()
+            )
         )
-        assert isinstance(r, int)
-        return r
+        self.change_dependencies(added=actual - current, removed=current - actual)
+
+    def change_dependencies(self, added: set[int], removed: set[int]) -> None:
+        """
+        Add edges from this project to the projects with IDs in ``added`` and
+        remove its edges to the projects with IDs in ``removed``, adjusting
+        the targets' ``rdepends_qty`` values to match
+        """
+        # Only the edges actually inserted or deleted by this transaction (as
+        # opposed to a concurrent one) are counted.
+        if added:
+            added = set(
+                db.session.scalars(
+                    upsert(ProjectDependency)
+                    .on_conflict_do_nothing()
+                    .returning(ProjectDependency.project_id),
+                    [
+                        {"source_project_id": self.id, "project_id": pid}
+                        for pid in added
+                    ],
+                )
+            )
+        if added:
+            db.session.execute(
+                db.update(Project)
+                .where(Project.id.in_(added))
+                .values(rdepends_qty=Project.rdepends_qty + 1)
+            )
+        if removed:
+            removed = set(
+                db.session.scalars(
+                    db.delete(ProjectDependency)
+                    .where(ProjectDependency.source_project_id == self.id)
+                    .where(ProjectDependency.project_id.in_(removed))
+                    .returning(ProjectDependency.project_id)
+                )
+            )
+        if removed:
+            db.session.execute(
+                db.update(Project)
+                .where(Project.id.in_(removed))
+                .values(rdepends_qty=Project.rdepends_qty - 1)
+            )
 
     def remove(self) -> None:
         """
@@ -262,27 +416,37 @@ class Project(MappedAsDataclass, Model):
         """
         db.session.execute(db.delete(Version).where(Version.project == self))
         self.has_wheels = False
+        self.latest_version = None
+        self.preferred_wheel = None
+        self.update_dependencies()
 
     def ensure_version(self, version: str) -> Version:
         """
         Create a `Version` for the `Project` with the given version string and
-        return it; the ``ordering`` values for the project's `Version`\\s are
-        updated as well.  If there already exists a version with the same
-        details, do nothing and return that instead.
+        return it.  If there already exists a version with the same details, do
+        nothing and return that instead.
         """
         vnorm = normversion(version)
         v = db.session.scalars(
-            db.select(Version).filter_by(project=self, name=vnorm)
+            upsert(Version)
+            .values(
+                project_id=self.id,
+                name=vnorm,
+                display_name=version,
+                sort_key=version_sort_bytes(version),
+            )
+            .on_conflict_do_nothing()
+            .returning(Version)
         ).one_or_none()
         if v is None:
-            v = Version(project=self, name=vnorm, display_name=version)
-            db.session.add(v)
-            for i, u in enumerate(
-                ### TODO: Is `self.versions` safe to use when some of its
-                ### elements may have been deleted earlier in the transaction?
-                sorted(self.versions, key=lambda x: version_sort_key(x.name))
-            ):
-                u.ordering = i
+            v = db.session.scalars(
+                db.select(Version).filter_by(project=self, name=vnorm)
+            ).one()
+        else:
+            db.session.expire(self, ["versions"])
+            latest = self.latest_version
+            if latest is None or v.sort_key > latest.sort_key:
+                self.latest_version = v
         return v
 
     def get_version_or_none(self, version: str) -> Version | None:
@@ -305,6 +469,11 @@ class Project(MappedAsDataclass, Model):
             .where(Version.name == normversion(version))
         )
         self.update_has_wheels()
+        self.update_latest()
+        self.update_dependencies()
+
+
+sa.Index("projects_rdepends_qty_idx", Project.rdepends_qty)
 
 
 class Version(MappedAsDataclass, Model):
@@ -318,22 +487,23 @@ class Version(MappedAsDataclass, Model):
         sa.ForeignKey("projects.id", ondelete="CASCADE"),
         init=False,
     )
-    project: Mapped[Project] = relationship(back_populates="versions")
+    project: Mapped[Project] = relationship(
+        back_populates="versions", foreign_keys=[project_id]
+    )
     #: The normalized version string
     name: Mapped[Str2048]
     #: The preferred non-normalized version string
     display_name: Mapped[Str2048]
+    #: The version's `version_sort_bytes()` key.  Sorting a project's versions
+    #: by this column puts them in PEP 440 order with prereleases at the
+    #: bottom, so the latest version has the highest key.
+    sort_key: Mapped[bytes] = mapped_column(sa.LargeBinary)
     wheels: Mapped[list[Wheel]] = relationship(
         back_populates="version",
         cascade="all, delete-orphan",
         passive_deletes=True,
         init=False,
     )
-    #: The index of this version when all versions for the project are sorted
-    #: in PEP 440 order with prereleases at the bottom.  (The latest version
-    #: has the highest `ordering` value.)  This column is set every time a new
-    #: version is added to the project with `Project.ensure_version()`.
-    ordering: Mapped[int] = mapped_column(default=0)
 
     def ensure_wheel(
         self,
@@ -346,35 +516,38 @@ class Version(MappedAsDataclass, Model):
         uploaded: datetime,
     ) -> Wheel:
         """
-        Registers a wheel for the `Version` and updates the ``ordering`` values
-        for the `Version`'s `Wheel`\\s.  The new `Wheel` object is returned.
+        Registers a wheel for the `Version` and returns the new `Wheel` object.
         If a wheel with the given filename is already registered, no change is
         made to the database, and the already-registered wheel is returned.
         """
         whl = db.session.scalars(
-            db.select(Wheel).filter_by(filename=filename)
-        ).one_or_none()
-        if whl is None:
-            whl = Wheel(
-                version=self,
+            upsert(Wheel)
+            .values(
+                version_id=self.id,
                 filename=filename,
                 url=url,
                 size=size,
                 md5=md5,
                 sha256=sha256,
                 uploaded=uploaded,
+                sort_key=wheel_sort_bytes(filename),
             )
-            db.session.add(whl)
-            for i, w in enumerate(
-                ### TODO: Is `self.wheels` safe to use when some of its
-                ### elements may have been deleted earlier in the transaction?
-                sorted(self.wheels, key=lambda x: wheel_sort_key(x.filename))
-            ):
-                w.ordering = i
+            .on_conflict_do_nothing()
+            .returning(Wheel)
+        ).one_or_none()
+        if whl is None:
+            whl = db.session.scalars(
+                db.select(Wheel).filter_by(filename=filename)
+            ).one()
+        else:
+            db.session.expire(self, ["wheels"])
             self.project.has_wheels = True
         return whl
 
 
+sa.Index("versions_project_sort_key_idx", Version.project_id, Version.sort_key)
+
+
 class Wheel(MappedAsDataclass, Model):
     """A wheel belonging to a `Version`"""
 
@@ -392,6 +565,9 @@ class Wheel(MappedAsDataclass, Model):
     md5: Mapped[str] = mapped_column(sa.Unicode(32))
     sha256: Mapped[str] = mapped_column(sa.Unicode(64))
     uploaded: Mapped[datetime]
+    #: The wheel's `wheel_sort_bytes()` key.  Sorting a version's wheels by
+    #: this column puts the most preferred wheel last.
+    sort_key: Mapped[bytes] = mapped_column(sa.LargeBinary)
     errors: Mapped[list[ProcessingError]] = relationship(
         back_populates="wheel",
         cascade="all, delete-orphan",
@@ -404,27 +580,51 @@ class Wheel(MappedAsDataclass, Model):
         passive_deletes=True,
         default=None,
     )
-    #: The index of this wheel when all wheels for the version are sorted by
-    #: applying `wheel_sort_key()` to their filenames.  This column is set
-    #: every time a new wheel is added to the version with `ensure_wheel()`.
-    ordering: Mapped[int] = mapped_column(default=0)
+    #: The number of consecutive transient failures encountered while
+    #: processing this wheel
+    retries: Mapped[int] = mapped_column(default=0)
+    #: If set, the wheel is not to be processed again before this time
+    retry_after: Mapped[datetime | None] = mapped_column(default=None)
+    #: Whether the wheel's core metadata file is missing or could not be
+    #: inspected, in which case it is left out of the core metadata queue
+    metadata_unavailable: Mapped[bool] = mapped_column(default=False)
+    #: The identifier of the `process_queue()` run that has claimed this wheel
+    #: for processing, if any
+    leased_by: Mapped[str | None] = mapped_column(sa.Unicode(255), default=None)
+    #: The time at which the claim in ``leased_by`` expires, after which the
+    #: wheel may be claimed by another run
+    lease_expires: Mapped[datetime | None] = mapped_column(default=None)
 
     @property
     def project(self) -> Project:
         """The `Project` to which the wheel belongs"""
         return self.version.project
 
-    def set_data(self, raw_data: dict) -> None:
+    def set_data(
+        self, raw_data: dict, inspection: InspectionMode = InspectionMode.FULL
+    ) -> None:
         """
         Use the results of a call to `inspect_wheel()` to populate this wheel's
-        `WheelData`
+        `WheelData`, replacing any existing data.  ``inspection`` records how
+        the wheel was inspected.
         """
-        ### TODO: This errors if `self.data` is already non-None (because then
-        ### there are temporarily two WheelData objects with the same
-        ### `wheel_id`).  Fix this.
-        self.data = WheelData.from_raw_data(raw_data)
+        replacing = self.data is not None
+        if self.data is not None:
+            # The old WheelData has to be deleted from the database before the
+            # new one is inserted, as they share a unique `wheel_id`.
+            db.session.delete(self.data)
+            db.session.flush()
+        self.data = WheelData.from_raw_data(raw_data, inspection=inspection)
+        db.session.flush()
+        self.data.insert_related(raw_data)
+        if replacing:
+            # Drop any edges that only the old data supported:
+            self.project.update_dependencies()
+        self.project.note_wheel_data(self)
         summary = raw_data["dist_info"].get("metadata", {}).get("summary")
         self.project.summary = summary[:2048] if summary is not None else None
+        self.retries = 0
+        self.retry_after = None
 
     def add_error(self, errmsg: str) -> None:
         """
@@ -439,36 +639,62 @@ class Wheel(MappedAsDataclass, Model):
             )
         )
 
+    def note_metadata_unavailable(self) -> None:
+        """
+        Record that this wheel's core metadata file is missing or could not be
+        inspected.  This takes the wheel out of the core metadata queue but
+        not out of the queue for full processing, and so its count of
+        transient failures is reset for the latter's benefit.
+        """
+        self.metadata_unavailable = True
+        self.retries = 0
+        self.retry_after = None
+
+    def schedule_retry(self, delay: timedelta) -> None:
+        """
+        Record a transient failure in processing this wheel and exclude it from
+        the processing queue until ``delay`` has passed
+        """
+        self.retries += 1
+        self.retry_after = datetime.now(timezone.utc) + delay
+
     def as_json(self) -> dict:
         """
         Returns a JSONable representation (i.e., a `dict` composed entirely of
         primitive types that can be directly serialized to JSON) of the wheel
-        and its data, if any
-        """
-        pypi = JsonWheelPyPI(
-            filename=self.filename,
-            url=self.url,
-            project=self.project.display_name,
-            version=self.version.display_name,
-            size=self.size,
-            md5=self.md5,
-            sha256=self.sha256,
-            uploaded=self.uploaded,
-        )
+        and its data, if any.
+
+        The result is the same as dumping the corresponding `JsonWheel` in JSON
+        mode, but it is built directly, as this is called for every wheel by
+        ``wheelodex dump``.  To avoid a query per wheel, the wheel's
+        ``version``, ``version.project``, ``data``, ``data.raw_data``, and
+        ``errors`` should be eager-loaded.
+        """
         if self.data is not None:
             data = self.data.raw_data
-            meta = JsonWheelMeta(
-                processed=self.data.processed,
-                wheel_inspect_version=self.data.wheel_inspect_version,
-            )
+            meta = {
+                "processed": json_datetime(self.data.processed),
+                "wheel_inspect_version": self.data.wheel_inspect_version,
+                "inspection": self.data.inspection.value,
+            }
         else:
             data = None
             meta = None
-        r = JsonWheel(
-            pypi=pypi, data=data, wheelodex=meta, errored=bool(self.errors)
-        ).model_dump(mode="json")
-        assert isinstance(r, dict)
-        return r
+        return {
+            "pypi": {
+                "filename": self.filename,
+                "url": self.url,
+                "project": self.project.display_name,
+                "version": self.version.display_name,
+                "size": self.size,
+                "md5": self.md5,
+                "sha256": self.sha256,
+                "uploaded": json_datetime(self.uploaded),
+            },
+            "data": data,
+            "wheelodex": meta,
+            "errored": bool(self.errors),
+        }
 
     @classmethod
     def add_from_json(cls, data: dict) -> None:
@@ -487,44 +713,231 @@ class Wheel(MappedAsDataclass, Model):
             uploaded=about.pypi.uploaded,
         )
         if about.data is not None and whl.data is None:
-            whl.set_data(about.data)
+            assert about.wheelodex is not None
+            whl.set_data(about.data, inspection=about.wheelodex.inspection)
             assert whl.data is not None
-            assert about.wheelodex is not None  # type: ignore[unreachable]
-            whl.data.processed = about.wheelodex.processed
+            whl.data.processed = about.wheelodex.processed  # type: ignore[unreachable]
             whl.data.wheel_inspect_version = about.wheelodex.wheel_inspect_version
 
     @classmethod
-    def to_process(cls, max_wheel_size: int | None = None) -> Sequence[Wheel]:
+    def to_process(
+        cls, max_wheel_size: int | None = None, metadata: bool = False
+    ) -> Sequence[Wheel]:
         """
         Returns the "queue" of wheels to process: a list of all wheels with
         neither data nor errors for the latest nonempty (i.e., having wheels)
-        version of each project
+        version of each project.  Wheels for which only core metadata has been
+        inspected are included, while wheels whose retry time (see
+        `schedule_retry()`) has not yet arrived or that are currently claimed
+        by an unexpired lease (see `claim()`) are excluded.
 
         :param int max_wheel_size: If set, only wheels this size or smaller are
             returned
+        :param bool metadata: If true, return the queue for core metadata
+            inspection instead, which excludes wheels that have any data or
+            whose core metadata is unavailable (see
+            `note_metadata_unavailable()`)
+        """
+        q = cls._process_queue(max_wheel_size=max_wheel_size, metadata=metadata)
+        return db.session.scalars(q).all()
+
+    @classmethod
+    def to_process_chunks(
+        cls,
+        max_wheel_size: int | None = None,
+        metadata: bool = False,
+        chunk_size: int = 1000,
+        order: Sequence[str] = (),
+        lock: bool = False,
+    ) -> Iterator[Sequence[Wheel]]:
+        """
+        Like `to_process()`, but the queue is returned as an iterator of lists
+        of at most ``chunk_size`` wheels, with each list only fetched from the
+        database once the previous one has been consumed.  This keeps memory
+        usage flat regardless of the size of the queue.
+
+        The wheels are sorted by the keys named in ``order`` (see
+        `QUEUE_ORDERS`), with ties broken by increasing ID.  As processing a
+        wheel can change the keys of other wheels in the queue (e.g., by
+        adding to the ``rdepends_qty`` of the projects it depends on), each
+        chunk is fetched from the head of the queue as it stands at that point.
+        The caller must therefore take each chunk's wheels out of the queue,
+        either by processing them or by leasing them with `claim()`, before
+        fetching the next chunk; otherwise, the same wheels will be returned
+        again.
+
+        If ``lock`` is true, each chunk's rows are locked with ``SELECT ... FOR
+        UPDATE SKIP LOCKED`` (on databases that support it), so that the
+        caller can `claim()` them before committing without any other
+        transaction fetching the same wheels in the meantime.
         """
-        subq = (
-            db.select(Project.id, db.func.max(Version.ordering).label("max_order"))
-            .join(Version)
-            .join(Wheel)
-            .group_by(Project.id)
-            .subquery()
+        q = cls._process_queue(max_wheel_size=max_wheel_size, metadata=metadata)
+        q = q.order_by(
+            *(k.desc() if desc else k.asc() for k, desc in queue_sort_keys(order))
         )
+        q = q.limit(chunk_size)
+        if lock:
+            q = q.with_for_update(skip_locked=True, of=Wheel)
+        while True:
+            chunk = db.session.scalars(q).all()
+            if not chunk:
+                return
+            yield chunk
+
+    @classmethod
+    def dump_chunks(
+        cls, dump_all: bool = False, chunk_size: int = 1000
+    ) -> Iterator[Sequence[Wheel]]:
+        """
+        Returns an iterator of lists of at most ``chunk_size`` wheels, in order
+        of increasing ID, for output by ``wheelodex dump``.  Only wheels with
+        data are included unless ``dump_all`` is true.
+
+        Each chunk is fetched using the ID of the last wheel in the previous
+        chunk as a bound rather than with an ``OFFSET``, so that every chunk
+        takes the same time to fetch no matter how far into the table it is.
+        The relationships used by `as_json()` are eager-loaded.
+        """
         q = (
             db.select(Wheel)
-            .join(Version)
-            .join(Project)
-            .join(
-                subq, (Project.id == subq.c.id) & (Version.ordering == subq.c.max_order)
+            .options(
+                joinedload(Wheel.version).joinedload(Version.project),
+                selectinload(Wheel.data).undefer(WheelData.raw_data),
+                selectinload(Wheel.errors).load_only(ProcessingError.id),
+            )
+            .order_by(Wheel.id)
+            .limit(chunk_size)
+        )
+        if not dump_all:
+            q = q.filter(Wheel.data.has())
+        last = 0
+        while True:
+            chunk = db.session.scalars(q.filter(Wheel.id > last)).all()
+            if not chunk:
+                return
+            last = chunk[-1].id
+            yield chunk
+
+    @classmethod
+    def _process_queue(
+        cls, max_wheel_size: int | None, metadata: bool
+    ) -> sa.Select[Any]:
+        """Returns the query used by `to_process()` & `to_process_chunks()`"""
+        # Only wheels for the latest version of each project that has wheels
+        # are queued:
+        later = aliased(Version)
+        later_wheel = aliased(Wheel)
+        q: sa.Select[Any] = (
+            db.select(Wheel)
+            .join(Wheel.version)
+            .join(Version.project)
+            .filter(
+                ~db.exists()
+                .where(later.project_id == Version.project_id)
+                .where(later.sort_key > Version.sort_key)
+                .where(later_wheel.version_id == later.id)
             )
-            .filter(~Wheel.data.has())
             .filter(~Wheel.errors.any())
+            .filter(
+                Wheel.retry_after.is_(None)
+                | (Wheel.retry_after <= datetime.now(timezone.utc))
+            )
+            .filter(
+                Wheel.lease_expires.is_(None)
+                | (Wheel.lease_expires <= datetime.now(timezone.utc))
+            )
         )
+        if metadata:
+            q = q.filter(~Wheel.data.has()).filter(~Wheel.metadata_unavailable)
+        else:
+            q = q.filter(
+                ~Wheel.data.has(WheelData.inspection != InspectionMode.METADATA)
+            )
         if max_wheel_size is not None:
             q = q.filter(Wheel.size <= max_wheel_size)
+        return q
+
+    @staticmethod
+    def claim(ids: Sequence[int], owner: str, duration: timedelta) -> None:
+        """
+        Lease the wheels with the given IDs to ``owner`` for ``duration``,
+        overwriting any expired leases.  The session is not committed.
+        """
+        db.session.execute(
+            db.update(Wheel)
+            .where(Wheel.id.in_(ids))
+            .values(
+                leased_by=owner, lease_expires=datetime.now(timezone.utc) + duration
+            )
+        )
+
+    @staticmethod
+    def renew_leases(owner: str, duration: timedelta) -> int:
+        """
+        Extend all leases held by ``owner`` to expire ``duration`` from now,
+        and return the number of leases renewed.  The session is not committed.
+        """
+        r = db.session.execute(
+            db.update(Wheel)
+            .where(Wheel.leased_by == owner)
+            .values(lease_expires=datetime.now(timezone.utc) + duration)
+        )
+        assert isinstance(r, sa.CursorResult)
+        return r.rowcount
+
+    @staticmethod
+    def release_leases(owner: str) -> None:
+        """
+        Release all leases held by ``owner``.  The session is not committed.
+        """
+        db.session.execute(
+            db.update(Wheel)
+            .where(Wheel.leased_by == owner)
+            .values(leased_by=None, lease_expires=None)
+        )
+
+    def release_lease(self) -> None:
+        """Release any lease on this wheel"""
+        self.leased_by = None
+        self.lease_expires = None
+
+    @classmethod
+    def to_reprocess(
+        cls,
+        versions: Sequence[str],
+        max_wheel_size: int | None = None,
+        after_id: int = 0,
+        limit: int | None = None,
+    ) -> Sequence[Wheel]:
+        """
+        Returns the wheels with IDs greater than ``after_id`` whose data was
+        produced by one of the given wheel-inspect ``versions``, in order of
+        increasing ID.  Wheels for which only core metadata has been inspected
+        are excluded.
+
+        :param int max_wheel_size: If set, only wheels this size or smaller are
+            returned
+        :param int limit: If set, return at most this many wheels
+        """
+        q = (
+            db.select(Wheel)
+            .join(WheelData)
+            .filter(WheelData.wheel_inspect_version.in_(versions))
+            .filter(WheelData.inspection != InspectionMode.METADATA)
+            .filter(Wheel.id > after_id)
+            .order_by(Wheel.id)
+        )
+        if max_wheel_size is not None:
+            q = q.filter(Wheel.size <= max_wheel_size)
+        if limit is not None:
+            q = q.limit(limit)
         return db.session.scalars(q).all()
 
 
+sa.Index("wheels_leased_by_idx", Wheel.leased_by)
+sa.Index("wheels_version_sort_key_idx", Wheel.version_id, Wheel.sort_key)
+
+
 class ProcessingError(MappedAsDataclass, Model):
     """An error that occurred while processing a `Wheel` for data"""
 
@@ -566,6 +979,29 @@ class DependencyRelation(MappedAsDataclass, Model):
     )
 
 
+class ProjectDependency(MappedAsDataclass, Model):
+    """
+    An edge in the project dependency graph, recording that at least one of
+    the source project's wheels depends on the target project.  Unlike
+    `DependencyRelation`, there is only one row per pair of projects.
+    """
+
+    __tablename__ = "project_dependencies"
+
+    project_id: Mapped[PKey] = mapped_column(
+        sa.ForeignKey("projects.id", ondelete="RESTRICT")
+    )
+    source_project_id: Mapped[PKey] = mapped_column(
+        sa.ForeignKey("projects.id", ondelete="CASCADE")
+    )
+
+
+sa.Index(
+    "project_dependencies_source_project_id_idx",
+    ProjectDependency.source_project_id,
+)
+
+
 class WheelData(MappedAsDataclass, Model):
     """Information about a `Wheel` produced with `inspect_wheel()`"""
 
@@ -578,15 +1014,28 @@ class WheelData(MappedAsDataclass, Model):
         unique=True,
     )
     wheel: Mapped[Wheel] = relationship(back_populates="data", init=False)
-    raw_data: Mapped[Any] = mapped_column(sa.JSON, nullable=False)
+    #: The return value of `inspect_wheel()`.  As this is by far the largest
+    #: column in the database, it is only loaded when accessed.
+    raw_data: Mapped[Any] = mapped_column(JsonData, nullable=False, deferred=True)
     #: The time at which the raw data was extracted from the wheel and added to
     #: the database
     processed: Mapped[datetime]
     #: The version of wheel-inspect that produced the ``raw_data``
     wheel_inspect_version: Mapped[str] = mapped_column(sa.Unicode(32))
-    ### TODO: What are the right `cascade` and `passive_deletes` settings for
-    ### this relationship?
-    dependency_rels: Mapped[list[DependencyRelation]] = relationship()
+    #: How the wheel was inspected.  Data obtained by remote inspection of an
+    #: oversized wheel lacks RECORD verification, and its file size & digests
+    #: are those reported by PyPI.
+    inspection: Mapped[InspectionMode] = mapped_column(
+        sa.Enum(
+            InspectionMode,
+            native_enum=False,
+            length=16,
+            values_callable=lambda e: [m.value for m in e],
+        )
+    )
+    dependency_rels: Mapped[list[DependencyRelation]] = relationship(
+        cascade="all, delete-orphan", passive_deletes=True
+    )
     valid: Mapped[bool]
     entry_points: Mapped[list[EntryPoint]] = relationship(
         back_populates="wheel_data", cascade="all, delete-orphan", passive_deletes=True
@@ -605,45 +1054,149 @@ class WheelData(MappedAsDataclass, Model):
     def dependencies(self) -> list[Project]:
         return [rel.project for rel in self.dependency_rels]
 
+    @staticmethod
+    def inspect_versions() -> list[str]:
+        """
+        Returns the distinct `wheel_inspect_version` values in the database
+        """
+        return list(
+            db.session.scalars(db.select(WheelData.wheel_inspect_version).distinct())
+        )
+
     @classmethod
-    def from_raw_data(cls, raw_data: dict) -> WheelData:
+    def from_raw_data(
+        cls, raw_data: dict, inspection: InspectionMode = InspectionMode.FULL
+    ) -> WheelData:
+        """
+        Construct a new `WheelData` object from the return value of a call to
+        `inspect_wheel()`.  The related files, modules, keywords, entry points,
+        and dependencies are not constructed here; once the object has been
+        flushed to the database, they must be added with `insert_related()`.
+        """
+        return cls(
+            raw_data=raw_data,
+            processed=datetime.now(timezone.utc),
+            wheel_inspect_version=wheel_inspect_version,
+            inspection=inspection,
+            entry_points=[],
+            dependency_rels=[],
+            valid=raw_data["valid"],
+            keywords=[],
+            files=[],
+            modules=[],
+        )
+
+    def insert_related(self, raw_data: dict) -> None:
         """
-        Construct a new `WheelData` object, complete with related objects, from
-        the return value of a call to `inspect_wheel()`
+        Insert the rows for the files, modules, keywords, entry points, and
+        dependencies described by ``raw_data`` (the same value passed to
+        `from_raw_data()`) into their respective tables.  The rows are written
+        with one multi-row ``INSERT`` per table rather than by flushing an ORM
+        object per row, which matters for wheels with tens of thousands of
+        files.  The `WheelData` must already have been flushed.
         """
+        projects = Project.ensure_many(
+            [raw_data["project"], *raw_data["derived"]["dependencies"]]
+        )
+        project = projects[normalize(raw_data["project"])]
+        dependencies = [
+            projects[normalize(p)] for p in raw_data["derived"]["dependencies"]
+        ]
+        groups = EntryPointGroup.ensure_many(
+            raw_data["dist_info"].get("entry_points", {})
+        )
+        # Assign IDs to any new projects & groups:
+        db.session.flush()
         file_paths = {
             # Make this a set because some wheels have duplicate entries in
             # their RECORDs
             f["path"]
             for f in raw_data["dist_info"].get("record", [])
         }
-        project = Project.ensure(raw_data["project"])
-        return cls(
-            raw_data=raw_data,
-            processed=datetime.now(timezone.utc),
-            wheel_inspect_version=wheel_inspect_version,
-            entry_points=[
-                EntryPoint(group=grobj, name=e)
-                for group, eps in raw_data["dist_info"].get("entry_points", {}).items()
-                for grobj in [EntryPointGroup.ensure(group)]
-                for e in eps
-            ],
-            dependency_rels=[
-                DependencyRelation(
-                    project=Project.ensure(p),
-                    source_project_id=project.id,
-                )
-                for p in raw_data["derived"]["dependencies"]
-            ],
-            valid=raw_data["valid"],
-            keywords=[Keyword(name=k) for k in raw_data["derived"]["keywords"]],
-            files=[File(path=f) for f in file_paths],
-            modules=[Module(name=m) for m in raw_data["derived"]["modules"]],
+        rows: list[tuple[type[Model], list[dict[str, Any]]]] = [
+            (File, [{"wheel_data_id": self.id, "path": f} for f in file_paths]),
+            (
+                Module,
+                [
+                    {"wheel_data_id": self.id, "name": m}
+                    for m in raw_data["derived"]["modules"]
+                ],
+            ),
+            (
+                Keyword,
+                [
+                    {"wheel_data_id": self.id, "name": k}
+                    for k in raw_data["derived"]["keywords"]
+                ],
+            ),
+            (
+                EntryPoint,
+                [
+                    {"wheel_data_id": self.id, "group_id": groups[group].id, "name": e}
+                    for group, eps in raw_data["dist_info"]
+                    .get("entry_points", {})
+                    .items()
+                    for e in eps
+                ],
+            ),
+            (
+                DependencyRelation,
+                [
+                    {
+                        "wheel_data_id": self.id,
+                        "project_id": p.id,
+                        "source_project_id": project.id,
+                    }
+                    for p in dependencies
+                ],
+            ),
+        ]
+        for model, values in rows:
+            if values:
+                db.session.execute(db.insert(model), values)
+        project.add_dependencies(dependencies)
+        # The collections were initialized as empty in `from_raw_data()`;
+        # reload them from the database on next access.
+        db.session.expire(
+            self, ["files", "modules", "keywords", "entry_points", "dependency_rels"]
         )
 
 
 sa.Index("wheel_data_processed_idx", WheelData.processed.desc())
 
+#: The names of the sort keys that can be used to order the processing queue
+#: in `Wheel.to_process_chunks()`:
+#:
+#: ``rdepends``
+#:     number of reverse dependencies of the wheel's project (i.e., its
+#:     `Project.rdepends_qty`, which grows as the wheels of the projects that
+#:     depend on it are processed), highest first
+#: ``recent``
+#:     upload time, newest first
+#: ``size``
+#:     wheel size, smallest first
+QUEUE_ORDERS = ("rdepends", "recent", "size")
+
+
+def queue_sort_keys(order: Sequence[str]) -> list[tuple[sa.ColumnElement[Any], bool]]:
+    """
+    Given a sequence of `QUEUE_ORDERS` names, return a list of pairs of SQL
+    expressions on the processing queue query to sort by and whether to sort
+    them in descending order.  The last key is always `Wheel.id`.
+    """
+    keys: list[tuple[sa.ColumnElement[Any], bool]] = []
+    for name in order:
+        if name == "rdepends":
+            keys.append((Project.rdepends_qty.expression, True))
+        elif name == "recent":
+            keys.append((Wheel.uploaded.expression, True))
+        elif name == "size":
+            keys.append((Wheel.size.expression, False))
+        else:
+            raise ValueError(f"Invalid queue order: {name!r}")
+    keys.append((Wheel.id.expression, False))
+    return keys
+
 
 class EntryPointGroup(MappedAsDataclass, Model):
     """An entry point group"""
@@ -665,11 +1218,77 @@ class EntryPointGroup(MappedAsDataclass, Model):
         Construct an `EntryPointGroup` with the given name and return it.  If
         such a group already exists, return that one instead.
         """
-        epg = db.session.scalars(db.select(cls).filter_by(name=name)).one_or_none()
-        if epg is None:
-            epg = cls(name=name)
-            db.session.add(epg)
-        return epg
+        return cls.ensure_many([name])[name]
+
+    @classmethod
+    def ensure_many(cls, names: Iterable[str]) -> dict[str, EntryPointGroup]:
+        """
+        Like `ensure()`, but for multiple group names at once, looking up all
+        of the groups not already seen in the current transaction in a single
+        query.  Returns a `dict` mapping the names to their
+        `EntryPointGroup`\\s.
+        """
+        return ensure_named(cls, {n: {"name": n} for n in names})
+
+
+#: The key in `Session.info` under which `ensure_named()` caches objects
+ENSURE_CACHE_KEY = "wheelodex_ensure_cache"
+
+#: The maximum number of names to look up in a single query in
+#: `ensure_named()`
+ENSURE_BATCH_SIZE = 500
+
+N = TypeVar("N", Project, EntryPointGroup)
+
+
+def ensure_named(cls: type[N], new: dict[str, dict[str, Any]]) -> dict[str, N]:
+    """
+    Given a model class with a unique ``name`` column and a `dict` mapping
+    names to the keyword arguments with which to construct instances with
+    those names, return a `dict` mapping each name to the existing instance
+    with that name, inserting rows for names that don't exist yet.  Rows are
+    inserted with ``INSERT ... ON CONFLICT DO NOTHING``, so a name inserted by
+    a concurrent transaction is looked up rather than causing an error.
+
+    Instances are cached in the session for the remainder of the current
+    transaction, so that each name is only looked up once per transaction;
+    names not in the cache are looked up & inserted in batches of
+    `ENSURE_BATCH_SIZE`.
+    """
+    cache: dict[str, N] = db.session.info.setdefault(ENSURE_CACHE_KEY, {}).setdefault(
+        cls, {}
+    )
+
+    def lookup(names: list[str]) -> None:
+        for i in range(0, len(names), ENSURE_BATCH_SIZE):
+            batch = names[i : i + ENSURE_BATCH_SIZE]
+            for obj in db.session.scalars(db.select(cls).where(cls.name.in_(batch))):
+                cache[obj.name] = obj
+
+    lookup([name for name in new if name not in cache])
+    missing = [name for name in new if name not in cache]
+    for i in range(0, len(missing), ENSURE_BATCH_SIZE):
+        batch = missing[i : i + ENSURE_BATCH_SIZE]
+        for obj in db.session.scalars(
+            upsert(cls).on_conflict_do_nothing().returning(cls),
+            [new[name] for name in batch],
+        ):
+            cache[obj.name] = obj
+    # Names that weren't inserted were inserted by a concurrent transaction in
+    # the meantime:
+    lookup([name for name in missing if name not in cache])
+    return {name: cache[name] for name in new}
+
+
+@sa.event.listens_for(Session, "after_commit")
+@sa.event.listens_for(Session, "after_soft_rollback")
+def clear_ensure_cache(session: Session, *_args: Any) -> None:
+    """
+    Discard the objects cached by `ensure_named()` when the transaction is
+    committed or rolled back, including when rolling back to a savepoint
+    (which may have discarded some of the cached objects)
+    """
+    session.info.pop(ENSURE_CACHE_KEY, None)
 
 
 class EntryPoint(MappedAsDataclass, Model):
@@ -780,13 +1399,15 @@ class OrphanWheel(MappedAsDataclass, Model):
         filename has already been registered, update its ``uploaded`` timestamp
         and do nothing else.
         """
-        whl = db.session.scalars(
-            db.select(OrphanWheel).filter_by(filename=filename)
-        ).one_or_none()
-        if whl is None:
-            whl = OrphanWheel(version=version, filename=filename, uploaded=uploaded)
-            db.session.add(whl)
-        else:
-            # If they keep uploading the wheel, keep checking the JSON API for
-            # it.
-            whl.uploaded = uploaded
+        stmt = upsert(OrphanWheel).values(
+            version_id=version.id, filename=filename, uploaded=uploaded
+        )
+        # If they keep uploading the wheel, keep checking the JSON API for it.
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[OrphanWheel.filename],
+            set_={"uploaded": stmt.excluded.uploaded},
+        )
+        db.session.execute(
+            stmt.returning(OrphanWheel),
+            execution_options={"populate_existing": True},
+        )
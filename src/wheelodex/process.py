@@ -1,131 +1,1260 @@
 """Functions for downloading & analyzing wheels"""
 
 from __future__ import annotations
-from datetime import datetime, timezone
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import ExitStack, nullcontext
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta, timezone
+import hashlib
+from io import BytesIO
 import logging
+import os
 from pathlib import Path
+import socket
+import threading
 from tempfile import TemporaryDirectory
+from time import monotonic
 import traceback
-from typing import Any
+from typing import IO, Any
+from flask import current_app
+from packaging.version import InvalidVersion, Version
 import requests
-from wheel_inspect import inspect_wheel
+from wheel_inspect import __version__ as wheel_inspect_version
 from .app import emit_json_log
-from .models import Wheel, db
-from .util import USER_AGENT
+from .models import Wheel, WheelData, db
+from .sandbox import InspectorPool, SandboxLimits
+from .throttle import DownloadScheduler, is_throttling_status
+from .timing import StageStats, StageTimings
+from .util import USER_AGENT, InspectionMode
+from .wheelcache import WheelCache
+from .wheelfile import (
+    inspect_downloaded_wheel,
+    inspect_metadata,
+    inspect_remote_wheel,
+)
 
 log = logging.getLogger(__name__)
 
 
-def process_queue(max_wheel_size: int | None = None) -> None:
+@dataclass(frozen=True)
+class WheelJob:
     """
-    Process all of the wheels returned by `Wheel.to_process()` one by one and
-    store the results in the database.  If an error occurs, the traceback is
-    stored as a `ProcessingError` for the wheel.  The database session is
-    committed after each wheel in order to save memory.
+    The details of a `Wheel` needed in order to download & analyze it.  Unlike
+    a `Wheel`, a `WheelJob` can be safely passed to other threads & processes.
+    """
+
+    id: int
+    filename: str
+    url: str
+    size: int
+    md5: str
+    sha256: str
+
+    @classmethod
+    def from_wheel(cls, whl: Wheel) -> WheelJob:
+        return cls(
+            id=whl.id,
+            filename=whl.filename,
+            url=whl.url,
+            size=whl.size,
+            md5=whl.md5,
+            sha256=whl.sha256,
+        )
+
+
+@dataclass
+class WheelResult:
+    """The outcome of downloading & analyzing a wheel"""
+
+    job: WheelJob
+    #: The name of the thread that downloaded the wheel
+    worker: str
+    #: The number of seconds spent downloading & analyzing the wheel
+    elapsed: float
+    #: The return value of `process_wheel()`, if successful
+    about: dict | None = None
+    #: The formatted traceback of the error that occurred, if any
+    error: str | None = None
+    #: Whether the wheel was skipped because there was nothing to inspect
+    #: (i.e., it has no core metadata file)
+    skipped: bool = False
+    #: Whether the wheel was read from the wheel cache instead of downloaded
+    cached: bool = False
+    #: How the wheel was inspected
+    inspection: InspectionMode = InspectionMode.FULL
+    #: Whether the error (if any) is transient, i.e., one that may go away if
+    #: the wheel is processed again later
+    transient: bool = False
+    #: The time spent in each stage of processing the wheel
+    timings: StageTimings = field(default_factory=StageTimings)
+
+
+@dataclass
+class WorkerStats:
+    """Throughput statistics for a single download worker"""
+
+    wheels: int = 0
+    #: The number of bytes of wheels downloaded in full (not counting wheels
+    #: read from the wheel cache)
+    bytes: int = 0
+    #: The total time spent on all wheels, including inspection
+    busy: float = 0.0
+    #: The time spent receiving & verifying the wheels counted in ``bytes``
+    downloading: float = 0.0
+
+    def for_json(self) -> dict[str, Any]:
+        return {
+            "wheels": self.wheels,
+            "bytes": self.bytes,
+            "busy": round(self.busy, 3),
+            "downloading": round(self.downloading, 3),
+            "bytes_per_sec": (
+                round(self.bytes / self.downloading) if self.downloading else None
+            ),
+        }
+
+
+@dataclass
+class QueueStats:
+    """Running totals for a `process_queue()` run"""
+
+    wheels: int = 0
+    bytes: int = 0
+    errors: int = 0
+    #: The number of wheels inspected remotely rather than downloaded
+    remote_wheels: int = 0
+    #: The number of wheels skipped for lack of a core metadata file
+    skipped: int = 0
+    #: The number of wheels read from the wheel cache
+    cache_hits: int = 0
+    #: The number of wheels scheduled for retrying after a transient error
+    retries: int = 0
+    workers: dict[str, WorkerStats] = field(default_factory=dict)
+    stages: StageStats = field(default_factory=StageStats)
+
+    def record(self, res: WheelResult) -> None:
+        self.wheels += 1
+        if res.skipped:
+            self.skipped += 1
+        if res.cached:
+            self.cache_hits += 1
+        if res.inspection is InspectionMode.REMOTE:
+            self.remote_wheels += 1
+        elif res.inspection is InspectionMode.FULL:
+            self.bytes += res.job.size
+        w = self.workers.setdefault(res.worker, WorkerStats())
+        w.wheels += 1
+        if res.inspection is InspectionMode.FULL and not res.cached:
+            w.bytes += res.job.size
+            w.downloading += (res.timings.download or 0.0) + (
+                res.timings.digest or 0.0
+            )
+        w.busy += res.elapsed
+        self.stages.record(res.timings)
+
+    def for_json(self) -> dict[str, Any]:
+        return {
+            "wheels": self.wheels,
+            "bytes": self.bytes,
+            "errors": self.errors,
+            "remote_wheels": self.remote_wheels,
+            "skipped": self.skipped,
+            "cache_hits": self.cache_hits,
+            "retries": self.retries,
+            "workers": {name: w.for_json() for name, w in sorted(self.workers.items())},
+            "stages": self.stages.for_json(),
+        }
+
+
+def process_queue(
+    max_wheel_size: int | None = None,
+    workers: int = 1,
+    remote_oversized: bool = False,
+    metadata_only: bool = False,
+    commit_every: int = 1,
+    commit_interval: float | None = None,
+    order: Sequence[str] | None = None,
+    max_duration: float | None = None,
+    max_bytes: int | None = None,
+) -> None:
+    """
+    Process all of the wheels returned by `Wheel.to_process()` and store the
+    results in the database.  If an error occurs, the traceback is stored as a
+    `ProcessingError` for the wheel; errors that may go away on their own are
+    instead retried on a later run, up to ``WHEELODEX_MAX_RETRIES`` times.
+
+    The queue is fetched lazily in chunks, each of which is claimed with a
+    `Lease` so that multiple runs can process the queue at once without
+    processing any wheel twice.  Wheels are downloaded by up to ``workers``
+    threads and inspected in sandbox processes (see `InspectorPool`), but all
+    database operations take place in the calling thread.
+
+    If ``metadata_only`` is true, only the wheels' :pep:`658` core metadata
+    files are inspected, and the resulting data is replaced when the wheels
+    are later fully inspected.  Wheels without a usable core metadata file are
+    marked as such (see `Wheel.note_metadata_unavailable()`) rather than
+    having errors stored, leaving them in the queue for full processing.  See
+    the ``process-queue`` command in :mod:`wheelodex.__main__` for details on
+    the other options.
 
     This function requires a Flask application context with a database
     connection to be in effect.
 
     :param int max_wheel_size: If set, only wheels this size or smaller are
-        analyzed
+        downloaded & analyzed
+    :param int workers: the number of wheels to download & analyze
+        concurrently
+    :param bool remote_oversized: whether to inspect wheels larger than
+        ``max_wheel_size`` remotely instead of skipping them
+    :param bool metadata_only: whether to only inspect wheels' core metadata
+    :param int commit_every: the maximum number of wheels to store per
+        transaction
+    :param float commit_interval: if set, the maximum number of seconds
+        between commits
+    :param order: the names of the sort keys to order the queue by; defaults
+        to the ``WHEELODEX_QUEUE_ORDER`` config value
+    :param float max_duration: if set, the number of seconds after which to
+        stop starting new wheels
+    :param int max_bytes: if set, the number of bytes of wheels to download
+        after which to stop starting new wheels
     """
-    log.info("BEGIN process_queue")
+    if order is None:
+        order = current_app.config["WHEELODEX_QUEUE_ORDER"]
+    op = "process_metadata" if metadata_only else "process_queue"
+    log.info("BEGIN %s", op)
     start_time = datetime.now(timezone.utc)
-    wheels_processed = 0
-    bytes_processed = 0
-    errors = 0
-    with TemporaryDirectory() as tmpdir, requests.Session() as s:
-        s.headers["User-Agent"] = USER_AGENT
+    stats = QueueStats()
+    committer = Committer(every=commit_every, interval=commit_interval)
+    analyzer: Analyzer | None = None
+    budget = Budget(max_duration=max_duration, max_bytes=max_bytes)
+    retry = RetryPolicy(
+        max_retries=current_app.config["WHEELODEX_MAX_RETRIES"],
+        backoff=current_app.config["WHEELODEX_RETRY_BACKOFF"],
+    )
+    lease = Lease(duration=current_app.config["WHEELODEX_LEASE_DURATION"])
+    with TemporaryDirectory() as tmpdir:
         try:
-            for whl in Wheel.to_process(max_wheel_size=max_wheel_size):
-                fpath = Path(tmpdir, whl.filename)
-                try:
-                    log.info("Downloading %s from %s ...", whl.filename, whl.url)
-                    download(s, whl.url, fpath)
-                    about = process_wheel(
-                        path=fpath,
-                        size=whl.size,
-                        md5=whl.md5,
-                        sha256=whl.sha256,
-                    )
-                    whl.set_data(about)
-                    # Some errors in inserting data aren't raised until we
-                    # actually try to insert by calling commit(), so include
-                    # the commit() under the `try`.
-                    db.session.commit()
-                except Exception:
-                    # rollback() needs to be called before log.exception() or
-                    # else SQLAlchemy gets all complainy.
-                    db.session.rollback()
-                    log.exception("Error processing %s", whl.filename)
-                    whl.add_error(traceback.format_exc())
-                    db.session.commit()
-                    errors += 1
-                finally:
-                    fpath.unlink(missing_ok=True)
-                wheels_processed += 1
-                bytes_processed += whl.size
+            analyzer = make_analyzer(
+                Path(tmpdir),
+                max_wheel_size=max_wheel_size,
+                workers=workers,
+                remote_oversized=remote_oversized,
+                metadata_only=metadata_only,
+            )
+            if remote_oversized or metadata_only:
+                max_wheel_size = None
+            jobs = queued_jobs(
+                max_wheel_size=max_wheel_size,
+                metadata=metadata_only,
+                chunk_size=current_app.config["WHEELODEX_QUEUE_CHUNK_SIZE"],
+                order=order,
+                lease=lease,
+                committer=committer,
+            )
+            run_jobs(
+                analyzer,
+                budget.limit(analyzer, jobs),
+                workers,
+                stats,
+                committer,
+                retry=retry,
+                lease=lease,
+                trace=current_app.config["WHEELODEX_PROCESS_TRACE"],
+            )
         except Exception:
             ok = False
             raise
         else:
             ok = True
         finally:
+            lease.release_all(rollback=not ok)
             end_time = datetime.now(timezone.utc)
             emit_json_log(
                 "process_queue.log",
                 {
-                    "op": "process_queue",
+                    "op": op,
                     "start": str(start_time),
                     "end": str(end_time),
                     "duration": str(end_time - start_time),
-                    "wheels": wheels_processed,
-                    "bytes": bytes_processed,
-                    "errors": errors,
+                    **stats.for_json(),
+                    "commits": committer.commits,
+                    "downloads": (
+                        analyzer.download_stats() if analyzer is not None else None
+                    ),
+                    "budget_exhausted": budget.exhausted,
+                    "claimed": lease.claimed,
                     "success": ok,
                 },
             )
-            log.info("END process_queue")
+            log.info("END %s", op)
+
+
+def reprocess(
+    before: str | None = None,
+    after: str | None = None,
+    max_wheel_size: int | None = None,
+    workers: int = 1,
+    remote_oversized: bool = False,
+    batch_size: int = 1000,
+    commit_every: int = 1,
+    commit_interval: float | None = None,
+) -> None:
+    """
+    Re-analyze the wheels whose data was produced by a version of wheel-inspect
+    older than ``before`` (and, if ``after`` is set, at least as new as
+    ``after``), replacing their `WheelData` with the new results.  Wheels for
+    which only core metadata has been inspected are left to `process_queue()`.
+    If an error occurs, the traceback is stored as a `ProcessingError` for the
+    wheel, and its old data is left in place.
+
+    Wheels are selected & analyzed ``batch_size`` at a time in order of
+    increasing ID.  ``max_wheel_size``, ``workers``, ``remote_oversized``,
+    ``commit_every``, and ``commit_interval`` have the same meanings as for
+    `process_queue()`, and wheels are retrieved via the wheel cache, if one is
+    configured.  Throughput statistics are logged to :file:`reprocess.log`.
+
+    This function requires a Flask application context with a database
+    connection to be in effect.
+
+    :param str before: the wheel-inspect version before which data is
+        considered stale; defaults to the installed version
+    :param str after: if set, data from wheel-inspect versions older than this
+        is left alone
+    :param int batch_size: the number of wheels to select from the database at
+        a time
+    """
+    if before is None:
+        before = wheel_inspect_version
+    log.info("BEGIN reprocess")
+    start_time = datetime.now(timezone.utc)
+    stats = QueueStats()
+    committer = Committer(every=commit_every, interval=commit_interval)
+    analyzer: Analyzer | None = None
+    with TemporaryDirectory() as tmpdir:
+        try:
+            versions = stale_inspect_versions(before, after)
+            log.info(
+                "Reprocessing wheels with data from wheel-inspect versions: %s",
+                ", ".join(versions) or "none",
+            )
+            analyzer = make_analyzer(
+                Path(tmpdir),
+                max_wheel_size=max_wheel_size,
+                workers=workers,
+                remote_oversized=remote_oversized,
+            )
+            if remote_oversized:
+                max_wheel_size = None
+            after_id = 0
+            while versions:
+                jobs = [
+                    WheelJob.from_wheel(whl)
+                    for whl in Wheel.to_reprocess(
+                        versions,
+                        max_wheel_size=max_wheel_size,
+                        after_id=after_id,
+                        limit=batch_size,
+                    )
+                ]
+                if not jobs:
+                    break
+                log.info("Reprocessing batch of %d wheels", len(jobs))
+                after_id = jobs[-1].id
+                run_jobs(
+                    analyzer,
+                    jobs,
+                    workers,
+                    stats,
+                    committer,
+                    trace=current_app.config["WHEELODEX_PROCESS_TRACE"],
+                )
+        except Exception:
+            ok = False
+            raise
+        else:
+            ok = True
+        finally:
+            end_time = datetime.now(timezone.utc)
+            emit_json_log(
+                "reprocess.log",
+                {
+                    "op": "reprocess",
+                    "start": str(start_time),
+                    "end": str(end_time),
+                    "duration": str(end_time - start_time),
+                    "before": before,
+                    "after": after,
+                    **stats.for_json(),
+                    "commits": committer.commits,
+                    "downloads": (
+                        analyzer.download_stats() if analyzer is not None else None
+                    ),
+                    "success": ok,
+                },
+            )
+            log.info("END reprocess")
+
+
+def stale_inspect_versions(before: str, after: str | None = None) -> list[str]:
+    """
+    Return the values of `WheelData.wheel_inspect_version` in the database
+    that are less than ``before`` and, if ``after`` is set, not less than
+    ``after``.  Unparseable values are ignored.
+    """
+    upper = Version(before)
+    lower = Version(after) if after is not None else None
+    stale = []
+    for v in WheelData.inspect_versions():
+        try:
+            vobj = Version(v)
+        except InvalidVersion:
+            log.warning("Ignoring unparseable wheel-inspect version %r", v)
+            continue
+        if vobj < upper and (lower is None or vobj >= lower):
+            stale.append(v)
+    return stale
+
+
+def make_analyzer(
+    tmpdir: Path,
+    max_wheel_size: int | None,
+    workers: int = 1,
+    remote_oversized: bool = False,
+    metadata_only: bool = False,
+) -> Analyzer:
+    """
+    Construct an `Analyzer` for the given options using the configuration of
+    the current Flask application
+    """
+    cache_dir = current_app.config["WHEELODEX_WHEEL_CACHE_DIR"]
+    if cache_dir is not None and not metadata_only:
+        cache = WheelCache(cache_dir, current_app.config["WHEELODEX_WHEEL_CACHE_SIZE"])
+    else:
+        cache = None
+    return Analyzer(
+        tmpdir=tmpdir,
+        inmemory_size=current_app.config["WHEELODEX_INMEMORY_WHEEL_SIZE"],
+        cache=cache,
+        remote_size=max_wheel_size if remote_oversized else None,
+        metadata_only=metadata_only,
+        sandbox=SandboxLimits(
+            memory=current_app.config["WHEELODEX_INSPECT_MEMORY_LIMIT"],
+            cpu=current_app.config["WHEELODEX_INSPECT_CPU_LIMIT"],
+            timeout=current_app.config["WHEELODEX_INSPECT_TIMEOUT"],
+            max_tasks=current_app.config["WHEELODEX_INSPECT_MAX_TASKS"],
+        ),
+        downloads=DownloadScheduler(
+            max_concurrency=workers,
+            bandwidth=current_app.config["WHEELODEX_DOWNLOAD_BANDWIDTH"],
+        ),
+    )
+
+
+def queued_jobs(
+    max_wheel_size: int | None,
+    metadata: bool,
+    chunk_size: int,
+    lease: Lease,
+    committer: Committer,
+    order: Sequence[str] = (),
+) -> Iterator[WheelJob]:
+    """
+    Yield a `WheelJob` for each wheel returned by `Wheel.to_process_chunks()`.
+    Each chunk of wheels is converted to `WheelJob`\\s as soon as it's
+    fetched, so that the `Wheel` objects can be garbage-collected rather than
+    being expired & reloaded by later commits.  Each chunk is claimed with
+    ``lease`` before any of its jobs are yielded, which takes the wheels out
+    of the queue so that the next chunk can be fetched before they've been
+    processed.  The claims are committed via ``committer`` (which also commits
+    any results stored since its last commit), so that they're visible to
+    other runs and counted along with its other commits.
+    """
+    for chunk in Wheel.to_process_chunks(
+        max_wheel_size=max_wheel_size,
+        metadata=metadata,
+        chunk_size=chunk_size,
+        order=order,
+        lock=True,
+    ):
+        log.debug("Fetched chunk of %d wheels from queue", len(chunk))
+        jobs = [WheelJob.from_wheel(whl) for whl in chunk]
+        lease.claim([j.id for j in jobs])
+        committer.commit(force=True)
+        yield from jobs
+
+
+def run_jobs(
+    analyzer: Analyzer,
+    jobs: Iterable[WheelJob],
+    workers: int,
+    stats: QueueStats,
+    committer: Committer,
+    retry: RetryPolicy | None = None,
+    lease: Lease | None = None,
+    trace: bool = False,
+) -> None:
+    """
+    Analyze the wheels in ``jobs`` with ``analyzer`` using ``workers``
+    workers, store the results in the database, committing as dictated by
+    ``committer``, and update ``stats``.  If ``retry`` is set, wheels with
+    transient errors are scheduled for retrying as dictated by it instead of
+    having their errors stored.  If ``lease`` is set, each wheel's lease is
+    released along with storing its result, and the lease's remaining claims
+    are renewed whenever they're due.  If ``trace`` is true, each wheel's
+    outcome & stage timings are written to :file:`process_trace.log`.
+    """
+    if workers > 1:
+        results = analyze_concurrently(analyzer, jobs, workers)
+    else:
+        results = analyze_serially(analyzer, jobs)
+    for res in results:
+        if lease is not None:
+            lease.release(res.job.id)
+        if res.error is not None and retry is not None and retry.defer(res):
+            stats.retries += 1
+        elif not store_result(res) and not res.skipped:
+            stats.errors += 1
+        if (secs := committer.tick()) is not None:
+            res.timings.commit = secs
+        stats.record(res)
+        if trace:
+            emit_json_log("process_trace.log", trace_entry(res))
+        if lease is not None and lease.due():
+            lease.renew()
+            committer.commit(force=True)
+    committer.commit()
+
+
+def trace_entry(res: WheelResult) -> dict[str, Any]:
+    """
+    Returns the :file:`process_trace.log` entry describing the processing of
+    the wheel in ``res``
+    """
+    return {
+        "id": res.job.id,
+        "filename": res.job.filename,
+        "size": res.job.size,
+        "worker": res.worker,
+        "inspection": res.inspection.value,
+        "cached": res.cached,
+        "skipped": res.skipped,
+        "error": res.error is not None,
+        "transient": res.transient,
+        "elapsed": round(res.elapsed, 6),
+        "timings": res.timings.for_json(),
+    }
+
+
+@dataclass
+class Budget:
+    """
+    Limits on how long a run may keep starting new wheels and how many bytes
+    of wheels it may download
+    """
+
+    max_duration: float | None = None
+    max_bytes: int | None = None
+    start: float = field(default_factory=monotonic)
+    #: The number of bytes of wheels started so far
+    bytes: int = 0
+    #: Whether a limit has been reached
+    exhausted: bool = False
+
+    def admit(self, size: int) -> bool:
+        """
+        Returns true if a wheel that will download ``size`` bytes may be
+        started, in which case it is counted against the budget
+        """
+        if not self.exhausted:
+            if (
+                self.max_duration is not None
+                and monotonic() - self.start >= self.max_duration
+            ):
+                log.info("Time budget of %s seconds exhausted", self.max_duration)
+                self.exhausted = True
+            elif self.max_bytes is not None and self.bytes >= self.max_bytes:
+                log.info("Download budget of %d bytes exhausted", self.max_bytes)
+                self.exhausted = True
+        if self.exhausted:
+            return False
+        self.bytes += size
+        return True
+
+    def limit(self, analyzer: Analyzer, jobs: Iterable[WheelJob]) -> Iterator[WheelJob]:
+        """
+        Yield the jobs in ``jobs`` until the budget is exhausted.  The size of
+        each job is counted only if ``analyzer`` would download it in full.
+        """
+        for job in jobs:
+            if analyzer.inspection_for(job) is InspectionMode.FULL:
+                size = job.size
+            else:
+                size = 0
+            if not self.admit(size):
+                return
+            yield job
+
+
+@dataclass
+class RetryPolicy:
+    """
+    How to handle transient errors: a wheel that fails with a transient error
+    is excluded from the queue for ``backoff`` seconds, doubling with each
+    consecutive failure, until it has been retried ``max_retries`` times
+    """
+
+    max_retries: int = 5
+    backoff: float = 3600
+
+    def defer(self, res: WheelResult) -> bool:
+        """
+        If ``res`` is a transient failure and the corresponding `Wheel` has
+        retries remaining, schedule the wheel to be retried later and return
+        `True`.  Otherwise, return `False`, in which case the error should be
+        stored as usual.  The session is not committed.
+        """
+        if not res.transient:
+            return False
+        whl = db.session.get(Wheel, res.job.id)
+        assert whl is not None
+        if whl.retries >= self.max_retries:
+            log.info(
+                "%s has failed %d times; giving up on retrying",
+                res.job.filename,
+                whl.retries + 1,
+            )
+            return False
+        delay = timedelta(seconds=self.backoff * 2**whl.retries)
+        log.info("Will retry %s after %s", res.job.filename, delay)
+        whl.schedule_retry(delay)
+        return True
+
 
+def default_lease_owner() -> str:
+    """
+    Returns an identifier for the current process that is unique among the
+    hosts sharing a database
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"[:255]
+
+
+@dataclass
+class Lease:
+    """
+    Claims on wheels in the processing queue held by a single
+    `process_queue()` run, identified by ``owner``.  Claims expire
+    ``duration`` seconds after being made or renewed; `run_jobs()` renews them
+    every quarter of that, but only between wheels, so no single wheel may
+    take longer than ``duration`` to process.
+    """
+
+    duration: float
+    owner: str = field(default_factory=default_lease_owner)
+    #: The number of wheels claimed so far
+    claimed: int = 0
+    last_renewal: float = field(default_factory=monotonic)
+
+    @property
+    def delta(self) -> timedelta:
+        return timedelta(seconds=self.duration)
+
+    def claim(self, ids: Sequence[int]) -> None:
+        """
+        Lease the wheels with the given IDs.  The session is not committed;
+        the claims become visible to other runs once it is.
+        """
+        Wheel.claim(ids, self.owner, self.delta)
+        self.claimed += len(ids)
+        log.debug("Claimed %d wheels as %s", len(ids), self.owner)
+
+    def release(self, wheel_id: int) -> None:
+        """
+        Release the lease on the given wheel as part of the current transaction
+        """
+        whl = db.session.get(Wheel, wheel_id)
+        assert whl is not None
+        whl.release_lease()
+
+    def due(self) -> bool:
+        """Returns true if it's time to renew the claims"""
+        return monotonic() - self.last_renewal >= self.duration / 4
+
+    def renew(self) -> None:
+        """Extend all of the claims.  The session is not committed."""
+        qty = Wheel.renew_leases(self.owner, self.delta)
+        log.debug("Renewed %d leases held by %s", qty, self.owner)
+        self.last_renewal = monotonic()
 
-def process_wheel(path: Path, size: int, md5: str, sha256: str) -> dict:
+    def release_all(self, rollback: bool = False) -> None:
+        """
+        Release all remaining claims and commit.  If ``rollback`` is true, the
+        session is rolled back first, discarding any uncommitted changes.
+        Errors are logged rather than raised, as the claims will expire on
+        their own anyway.
+        """
+        try:
+            if rollback:
+                db.session.rollback()
+            Wheel.release_leases(self.owner)
+            db.session.commit()
+        except Exception:
+            log.exception("Error releasing leases held by %s", self.owner)
+            db.session.rollback()
+
+
+@dataclass
+class Committer:
+    """
+    Commits the database session once every ``every`` wheels or once
+    ``interval`` seconds have passed since the last commit, whichever comes
+    first
     """
-    Process the wheel at ``path``.  The wheel is analyzed with
-    `inspect_wheel()`, and its size & digests are checked against ``size``,
-    ``md5``, and ``sha256`` (provided by PyPI) to verify download integrity.
 
-    :return: the results of the call to `inspect_wheel()`
+    every: int = 1
+    interval: float | None = None
+    #: The number of wheels stored since the last commit
+    pending: int = 0
+    #: The number of commits made so far
+    commits: int = 0
+    last_commit: float = field(default_factory=monotonic)
+
+    def tick(self) -> float | None:
+        """
+        Note that a wheel has been stored and commit if it's time to.  Returns
+        the number of seconds spent committing, or `None` if no commit was
+        made.
+        """
+        self.pending += 1
+        if self.pending >= self.every or (
+            self.interval is not None
+            and monotonic() - self.last_commit >= self.interval
+        ):
+            return self.commit()
+        return None
+
+    def commit(self, force: bool = False) -> float | None:
+        """
+        Commit the session if any wheels have been stored since the last
+        commit or if ``force`` is true.  Returns the number of seconds spent
+        committing, or `None` if no commit was made.
+        """
+        start = monotonic()
+        elapsed: float | None = None
+        if self.pending or force:
+            db.session.commit()
+            self.commits += 1
+            self.pending = 0
+            elapsed = monotonic() - start
+        self.last_commit = monotonic()
+        return elapsed
+
+
+def store_result(res: WheelResult) -> bool:
     """
-    log.info("Inspecting %s ...", path.name)
-    about: dict[str, Any] = inspect_wheel(path)
-    if about["file"]["size"] != size:
-        log.error(
-            "Wheel %s: size mismatch: PyPI reports %d, got %d",
-            size,
-            about["file"]["size"],
+    Store the data or error in ``res`` in the database for the corresponding
+    `Wheel`.  The data is stored inside a savepoint so that, if storing it
+    fails, only this wheel's changes are rolled back, after which the error is
+    stored instead.  If ``res`` is from core metadata inspection, a missing
+    core metadata file or an error is recorded with
+    `Wheel.note_metadata_unavailable()` instead, so that the wheel is still
+    fully processed later.  The session is not committed.  Returns `True` if the
+    wheel's data was successfully stored, `False` otherwise.  The time taken to
+    build & flush the data is added to ``res.timings``.
+    """
+    whl = db.session.get(Wheel, res.job.id)
+    assert whl is not None
+    errmsg: str | None
+    if res.about is not None:
+        try:
+            # Some errors in inserting data aren't raised until the data is
+            # actually flushed, which happens when the savepoint is released,
+            # so the whole block is under the `try`.
+            with db.session.begin_nested():
+                with res.timings.measure("build"):
+                    whl.set_data(res.about, inspection=res.inspection)
+                flush_start = monotonic()
+            res.timings.add("flush", monotonic() - flush_start)
+        except Exception:
+            # The savepoint has already been rolled back by this point, which
+            # needs to happen before log.exception() or else SQLAlchemy gets
+            # all complainy.
+            log.exception("Error storing data for %s", res.job.filename)
+            errmsg = traceback.format_exc()
+        else:
+            return True
+    else:
+        assert res.error is not None or res.skipped
+        errmsg = res.error
+    if res.inspection is InspectionMode.METADATA:
+        whl.note_metadata_unavailable()
+    else:
+        assert errmsg is not None
+        whl.add_error(errmsg)
+    return False
+
+
+def analyze_serially(
+    analyzer: Analyzer, jobs: Iterable[WheelJob]
+) -> Iterator[WheelResult]:
+    """
+    Download & analyze each wheel in ``jobs`` in turn in the current thread.
+    If ``analyzer.sandbox`` is set, the wheels are inspected in a single
+    sandbox process; otherwise, they're inspected in the current process.
+    """
+    with requests.Session() as s:
+        s.headers["User-Agent"] = USER_AGENT
+        if analyzer.sandbox is not None:
+            with InspectorPool(1, analyzer.sandbox) as inspectors:
+                pooled = replace(analyzer, inspectors=inspectors)
+                for job in jobs:
+                    yield pooled.analyze(s, job)
+        else:
+            for job in jobs:
+                yield analyzer.analyze(s, job)
+
+
+def analyze_concurrently(
+    analyzer: Analyzer, jobs: Iterable[WheelJob], workers: int
+) -> Iterator[WheelResult]:
+    """
+    Download the wheels in ``jobs`` using a pool of ``workers`` threads and
+    analyze them using a pool of ``workers`` sandbox processes (subject to the
+    limits in ``analyzer.sandbox``, if any), yielding the results in the order
+    in which they complete.  At most ``2 * workers`` wheels are in flight at
+    any one time.
+    """
+    local = threading.local()
+    sessions: list[requests.Session] = []
+    lock = threading.Lock()
+
+    def work(job: WheelJob) -> WheelResult:
+        # `requests.Session` objects are not guaranteed to be thread-safe, so
+        # each thread gets its own.
+        s: requests.Session | None = getattr(local, "session", None)
+        if s is None:
+            s = local.session = requests.Session()
+            s.headers["User-Agent"] = USER_AGENT
+            with lock:
+                sessions.append(s)
+        return pooled.analyze(s, job)
+
+    # The inspector pool is closed last, as closing it waits for any
+    # in-progress inspections by download threads to finish.
+    with InspectorPool(
+        workers, analyzer.sandbox or SandboxLimits()
+    ) as inspectors, ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="download"
+    ) as downloaders:
+        pooled = replace(analyzer, inspectors=inspectors)
+        pending: set[Future[WheelResult]] = set()
+        try:
+            jobiter = iter(jobs)
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < 2 * workers:
+                    try:
+                        job = next(jobiter)
+                    except StopIteration:
+                        exhausted = True
+                    else:
+                        pending.add(downloaders.submit(work, job))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield fut.result()
+        finally:
+            for fut in pending:
+                fut.cancel()
+            for s in sessions:
+                s.close()
+
+
+@dataclass
+class Analyzer:
+    """Settings & resources for downloading & analyzing individual wheels"""
+
+    #: The directory in which to save wheels that are not kept in memory
+    tmpdir: Path
+    #: Wheels this size or smaller are downloaded into memory rather than to a
+    #: file in ``tmpdir`` when they are analyzed in the current process
+    inmemory_size: int | None = None
+    #: If set, wheels larger than this are inspected remotely via HTTP range
+    #: requests instead of being downloaded
+    remote_size: int | None = None
+    #: If true, only wheels' core metadata files are fetched & inspected
+    metadata_only: bool = False
+    #: If set, downloaded wheels are stored in & retrieved from this cache
+    cache: WheelCache | None = None
+    #: If set, wheels are analyzed in sandbox processes subject to these
+    #: limits rather than in the current process
+    sandbox: SandboxLimits | None = None
+    #: The pool of sandbox processes in which wheels are analyzed; set by
+    #: `analyze_serially()` and `analyze_concurrently()`
+    inspectors: InspectorPool | None = None
+    #: If set, downloads of whole wheels are throttled by this scheduler
+    downloads: DownloadScheduler | None = None
+
+    def analyze(self, s: requests.Session, job: WheelJob) -> WheelResult:
+        """
+        Download the wheel described by ``job`` and analyze it with
+        `process_wheel()`, or, if it is larger than ``remote_size``, analyze it
+        remotely.  If ``metadata_only`` is set, only the wheel's core metadata
+        is fetched & inspected.  Any errors that occur are captured in the
+        returned `WheelResult`.  The time spent in each stage is recorded in
+        the result's ``timings``.
+        """
+        worker = threading.current_thread().name
+        start = monotonic()
+        timings = StageTimings()
+        fpath = self.tmpdir / job.filename
+        inspection = self.inspection_for(job)
+        cached = False
+        try:
+            src: Path | BytesIO
+            if inspection is InspectionMode.METADATA:
+                log.info("Fetching core metadata for %s ...", job.filename)
+                with timings.measure("download"):
+                    metadata = fetch_metadata(s, job)
+                if metadata is None:
+                    log.info("%s has no core metadata file; skipping", job.filename)
+                    return WheelResult(
+                        job=job,
+                        worker=worker,
+                        elapsed=monotonic() - start,
+                        skipped=True,
+                        inspection=inspection,
+                        timings=timings,
+                    )
+                with timings.measure("inspect"):
+                    about = inspect_metadata(
+                        job.filename,
+                        metadata,
+                        size=job.size,
+                        md5=job.md5,
+                        sha256=job.sha256,
+                    )
+            elif inspection is InspectionMode.REMOTE:
+                # Remote inspection is mostly waiting on the network, so it's
+                # done in this thread rather than the process pool, and its
+                # time is counted as downloading.
+                log.info("Inspecting %s remotely at %s ...", job.filename, job.url)
+                with timings.measure("download"):
+                    about = inspect_remote_wheel(
+                        s,
+                        job.filename,
+                        job.url,
+                        size=job.size,
+                        md5=job.md5,
+                        sha256=job.sha256,
+                    )
+            else:
+                with ExitStack() as stack:
+                    if self.cache is not None and self.cache.fits(job.size):
+                        # Keep other threads from evicting the wheel from the
+                        # cache until we're done with it.  Cached wheels are
+                        # already on disk, so they're inspected in place
+                        # regardless of size.
+                        stack.enter_context(self.cache.pinned(job.sha256))
+                        src, cached = self.cached_download(s, job, timings)
+                    elif (
+                        self.inspectors is None
+                        and self.inmemory_size is not None
+                        and job.size <= self.inmemory_size
+                    ):
+                        # The buffer is inspected in place; handing it to a
+                        # sandbox process would mean pickling a copy of it,
+                        # so sandboxed wheels always go through ``tmpdir``.
+                        log.info("Downloading %s from %s ...", job.filename, job.url)
+                        src = BytesIO()
+                        download(s, job, src, self.downloads, timings)
+                    else:
+                        log.info("Downloading %s from %s ...", job.filename, job.url)
+                        with fpath.open("wb") as fp:
+                            download(s, job, fp, self.downloads, timings)
+                        src = fpath
+                    with timings.measure("inspect"):
+                        if self.inspectors is not None:
+                            about = self.inspectors.run(process_wheel, job, src)
+                        else:
+                            about = process_wheel(job, src)
+        except Exception as e:
+            log.exception("Error processing %s", job.filename)
+            return WheelResult(
+                job=job,
+                worker=worker,
+                elapsed=monotonic() - start,
+                error=traceback.format_exc(),
+                inspection=inspection,
+                cached=cached,
+                transient=is_transient(e),
+                timings=timings,
+            )
+        else:
+            return WheelResult(
+                job=job,
+                worker=worker,
+                elapsed=monotonic() - start,
+                about=about,
+                inspection=inspection,
+                cached=cached,
+                timings=timings,
+            )
+        finally:
+            fpath.unlink(missing_ok=True)
+
+    def download_stats(self) -> dict[str, Any] | None:
+        """
+        Returns the statistics of the download scheduler, if any, for inclusion
+        in stats logs
+        """
+        return self.downloads.for_json() if self.downloads is not None else None
+
+    def inspection_for(self, job: WheelJob) -> InspectionMode:
+        """Returns the manner in which `analyze()` will inspect ``job``"""
+        if self.metadata_only:
+            return InspectionMode.METADATA
+        elif self.remote_size is not None and job.size > self.remote_size:
+            return InspectionMode.REMOTE
+        else:
+            return InspectionMode.FULL
+
+    def cached_download(
+        self,
+        s: requests.Session,
+        job: WheelJob,
+        timings: StageTimings | None = None,
+    ) -> tuple[Path, bool]:
+        """
+        Return the path to a verified copy of the wheel described by ``job`` in
+        the wheel cache, downloading it into the cache if it is not already
+        present.  A cached file that fails verification is discarded & the
+        wheel downloaded anew.  The second element of the return value is
+        `True` iff the wheel was already in the cache.  If ``timings`` is set,
+        the time spent downloading & verifying is added to it.  The caller
+        should pin the wheel in the cache with `WheelCache.pinned()` for as long
+        as it uses the path.
+        """
+        assert self.cache is not None
+        path = self.cache.get(job.sha256)
+        if path is not None:
+            log.info("Verifying cached copy of %s ...", job.filename)
+            try:
+                with path.open("rb") as fp:
+                    verify(job, fp, timings)
+            except (OSError, ValueError):
+                log.warning(
+                    "Cached copy of %s failed verification; discarding",
+                    job.filename,
+                    exc_info=True,
+                )
+                self.cache.discard(job.sha256)
+            else:
+                return (path, True)
+        log.info("Downloading %s from %s ...", job.filename, job.url)
+        path = self.cache.add(
+            job.sha256,
+            job.size,
+            lambda fp: download(s, job, fp, self.downloads, timings),
         )
-        raise ValueError(
-            f'Size mismatch: PyPI reports {size}, got {about["file"]["size"]}'
+        return (path, False)
+
+
+def is_transient(e: Exception) -> bool:
+    """
+    Returns true if ``e`` is an error that may go away if the operation is
+    tried again later: a connection error, a timeout, a truncated response, or
+    an HTTP 408, 429, or 5xx response.  Other errors, such as digest
+    mismatches and invalid zipfiles, are considered permanent.
+    """
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and (
+            e.response.status_code == 408
+            or is_throttling_status(e.response.status_code)
         )
-    for alg, expected in [("md5", md5), ("sha256", sha256)]:
-        if expected != about["file"]["digests"][alg]:
+    return isinstance(
+        e,
+        (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ),
+    )
+
+
+def process_wheel(job: WheelJob, src: Path | BytesIO) -> dict:
+    """
+    Analyze the wheel described by ``job`` with wheel-inspect.  ``src`` is
+    either the path to which the wheel was downloaded or the in-memory buffer
+    it was downloaded into, which is read in place.
+    The wheel's size & digests must have already been verified against the
+    values in ``job`` (provided by PyPI) by `download()`; they are used as-is
+    in the results rather than being recomputed.
+
+    :return: the results of inspecting the wheel, in the same format as
+        returned by `inspect_wheel()`
+    """
+    log.info("Inspecting %s ...", job.filename)
+    about = inspect_downloaded_wheel(
+        job.filename, src, size=job.size, md5=job.md5, sha256=job.sha256
+    )
+    log.info("Finished inspecting %s", job.filename)
+    return about
+
+
+class WheelVerifier:
+    """
+    Computes the size & digests of a wheel as its contents are fed to
+    `update()` and checks them against the values reported by PyPI
+    """
+
+    def __init__(self, job: WheelJob) -> None:
+        self.job = job
+        self.received = 0
+        self.md5 = hashlib.md5()
+        self.sha256 = hashlib.sha256()
+        #: The number of seconds spent computing digests so far
+        self.elapsed = 0.0
+
+    def update(self, chunk: bytes) -> None:
+        """
+        Add ``chunk`` to the data seen so far.  If this makes the data larger
+        than the size reported by PyPI, a `ValueError` is raised.
+        """
+        self.received += len(chunk)
+        if self.received > self.job.size:
             log.error(
-                "Wheel %s: %s hash mismatch: PyPI reports %s, got %s",
-                alg,
-                expected,
-                about["file"]["digests"][alg],
+                "Wheel %s: size mismatch: PyPI reports %d, got more",
+                self.job.filename,
+                self.job.size,
             )
             raise ValueError(
-                f"{alg} hash mismatch: PyPI reports {expected},"
-                f' got {about["file"]["digests"][alg]}'
+                f"Size mismatch: PyPI reports {self.job.size}, got at least"
+                f" {self.received}"
             )
-    log.info("Finished inspecting %s", path.name)
-    return about
+        start = monotonic()
+        self.md5.update(chunk)
+        self.sha256.update(chunk)
+        self.elapsed += monotonic() - start
+
+    def check(self) -> None:
+        """
+        Raise a `ValueError` if the final size or either digest of the data
+        does not match the values reported by PyPI
+        """
+        start = monotonic()
+        try:
+            self._check()
+        finally:
+            self.elapsed += monotonic() - start
+
+    def _check(self) -> None:
+        job = self.job
+        if self.received != job.size:
+            log.error(
+                "Wheel %s: size mismatch: PyPI reports %d, got %d",
+                job.filename,
+                job.size,
+                self.received,
+            )
+            raise ValueError(
+                f"Size mismatch: PyPI reports {job.size}, got {self.received}"
+            )
+        for alg, expected, h in [
+            ("md5", job.md5, self.md5),
+            ("sha256", job.sha256, self.sha256),
+        ]:
+            if expected != h.hexdigest():
+                log.error(
+                    "Wheel %s: %s hash mismatch: PyPI reports %s, got %s",
+                    job.filename,
+                    alg,
+                    expected,
+                    h.hexdigest(),
+                )
+                raise ValueError(
+                    f"{alg} hash mismatch: PyPI reports {expected}, got"
+                    f" {h.hexdigest()}"
+                )
+
 
+def download(
+    s: requests.Session,
+    job: WheelJob,
+    fp: IO[bytes],
+    scheduler: DownloadScheduler | None = None,
+    timings: StageTimings | None = None,
+) -> None:
+    """
+    Download the wheel described by ``job`` to the binary filehandle ``fp``,
+    computing its size & digests as it is received.  If the wheel turns out to
+    be larger than the size reported by PyPI, the download is aborted as soon
+    as this is noticed.  If the final size or either digest does not match the
+    values reported by PyPI, a `ValueError` is raised.
 
-def download(s: requests.Session, url: str, path: Path) -> None:
-    r = s.get(url, stream=True)
-    r.raise_for_status()
-    with path.open("wb") as fp:
-        for chunk in r.iter_content(65535):
-            fp.write(chunk)
+    If ``scheduler`` is set, the download waits for a free slot in it, its
+    data is received no faster than its bandwidth cap allows, and the outcome
+    is reported to it so that it can adjust its concurrency.
+
+    If ``timings`` is set, the time spent computing & checking digests and the
+    rest of the time spent downloading are added to it.
+    """
+    verifier = WheelVerifier(job)
+    start = monotonic()
+    try:
+        with scheduler.slot() if scheduler is not None else nullcontext():
+            with s.get(job.url, stream=True) as r:
+                try:
+                    r.raise_for_status()
+                except requests.HTTPError as e:
+                    if (
+                        scheduler is not None
+                        and e.response is not None
+                        and is_throttling_status(e.response.status_code)
+                    ):
+                        scheduler.throttled()
+                    raise
+                for chunk in r.iter_content(65535):
+                    if scheduler is not None:
+                        scheduler.consume(len(chunk))
+                    verifier.update(chunk)
+                    fp.write(chunk)
+        verifier.check()
+    finally:
+        if timings is not None:
+            timings.add("download", monotonic() - start - verifier.elapsed)
+            timings.add("digest", verifier.elapsed)
+    if scheduler is not None:
+        scheduler.succeeded()
+
+
+def verify(
+    job: WheelJob, fp: IO[bytes], timings: StageTimings | None = None
+) -> None:
+    """
+    Read the binary filehandle ``fp`` to the end and check that its size &
+    digests match the values in ``job``, raising a `ValueError` if not.  If
+    ``timings`` is set, the time taken is added to its ``digest`` stage.
+    """
+    verifier = WheelVerifier(job)
+    start = monotonic()
+    try:
+        while chunk := fp.read(65535):
+            verifier.update(chunk)
+        verifier.check()
+    finally:
+        if timings is not None:
+            timings.add("digest", monotonic() - start)
+
+
+def fetch_metadata(s: requests.Session, job: WheelJob) -> bytes | None:
+    """
+    Fetch the :pep:`658` core metadata file for the wheel described by
+    ``job``.  Returns `None` if PyPI does not provide one for the wheel.
+    """
+    with s.get(job.url + ".metadata") as r:
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return r.content
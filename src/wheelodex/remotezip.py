@@ -0,0 +1,131 @@
+"""Random access to remote files via HTTP range requests"""
+
+from __future__ import annotations
+import io
+import logging
+import re
+import requests
+
+log = logging.getLogger(__name__)
+
+#: The number of bytes fetched per block by `HTTPRangeFile`
+BLOCK_SIZE = 64 * 1024
+
+
+class HTTPRangeFile(io.RawIOBase):
+    """
+    A read-only, seekable binary file object for a remote file of a known size
+    that is read via HTTP range requests.  Data is fetched in aligned blocks of
+    ``block_size`` bytes, which are cached for the lifetime of the object so
+    that small reads (such as those done by `zipfile` when parsing headers) do
+    not each result in a separate request.
+
+    Requesting a range from a server that does not support range requests
+    results in a `ValueError` rather than a download of the entire file.
+    """
+
+    def __init__(
+        self, s: requests.Session, url: str, size: int, block_size: int = BLOCK_SIZE
+    ) -> None:
+        super().__init__()
+        self.s = s
+        self.url = url
+        self.size = size
+        self.block_size = block_size
+        self.pos = 0
+        self.blocks: dict[int, bytes] = {}
+        #: The number of range requests made so far
+        self.requests = 0
+        #: The number of bytes fetched so far
+        self.bytes_fetched = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self.pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence!r}")
+        if pos < 0:
+            raise ValueError(f"Negative seek position {pos}")
+        self.pos = pos
+        return pos
+
+    def readinto(self, buf: bytearray | memoryview) -> int:  # type: ignore[override]
+        n = min(len(buf), self.size - self.pos)
+        if n <= 0:
+            return 0
+        first = self.pos // self.block_size
+        last = (self.pos + n - 1) // self.block_size
+        self._ensure_blocks(first, last)
+        data = b"".join(self.blocks[i] for i in range(first, last + 1))
+        start = self.pos - first * self.block_size
+        buf[:n] = data[start : start + n]
+        self.pos += n
+        return n
+
+    def _ensure_blocks(self, first: int, last: int) -> None:
+        """
+        Fetch any blocks in the range ``first`` through ``last`` (inclusive)
+        that are not already cached, coalescing runs of adjacent missing blocks
+        into single requests
+        """
+        i = first
+        while i <= last:
+            if i in self.blocks:
+                i += 1
+                continue
+            j = i
+            while j + 1 <= last and j + 1 not in self.blocks:
+                j += 1
+            data = self._fetch(
+                i * self.block_size,
+                min((j + 1) * self.block_size, self.size) - 1,
+            )
+            for k in range(i, j + 1):
+                offset = (k - i) * self.block_size
+                self.blocks[k] = data[offset : offset + self.block_size]
+            i = j + 1
+
+    def _fetch(self, start: int, end: int) -> bytes:
+        log.debug("Fetching bytes %d-%d of %s", start, end, self.url)
+        with self.s.get(
+            self.url, headers={"Range": f"bytes={start}-{end}"}, stream=True
+        ) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise ValueError(
+                    f"Server did not honor range request for {self.url}"
+                    f" (status {r.status_code})"
+                )
+            crange = r.headers.get("Content-Range", "")
+            m = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+|\*)", crange.strip())
+            if m is None or int(m[1]) != start or int(m[2]) != end:
+                raise ValueError(
+                    f"Unexpected Content-Range for {self.url}: {crange!r}"
+                    f" (requested {start}-{end})"
+                )
+            if m[3] != "*" and int(m[3]) != self.size:
+                raise ValueError(
+                    f"Size mismatch: PyPI reports {self.size}, got {m[3]}"
+                )
+            data = r.content
+        if len(data) != end - start + 1:
+            raise ValueError(
+                f"Short read from {self.url}: requested {end - start + 1} bytes,"
+                f" got {len(data)}"
+            )
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        return data
@@ -0,0 +1,268 @@
+"""Running wheel inspection in resource-limited, recyclable child processes"""
+
+from __future__ import annotations
+from collections.abc import Callable
+from dataclasses import dataclass
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+from multiprocessing.context import BaseContext
+from queue import LifoQueue
+import signal
+import traceback
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+
+class InspectionLimitError(Exception):
+    """
+    Raised when inspecting a wheel in a sandbox exceeds a memory, CPU, or time
+    limit
+    """
+
+
+class RemoteTraceback(Exception):
+    """
+    Used as the ``__cause__`` of an exception re-raised from a sandbox process
+    in order to display the traceback from the child
+    """
+
+    def __init__(self, tb: str) -> None:
+        super().__init__(tb)
+        self.tb = tb
+
+    def __str__(self) -> str:
+        return self.tb
+
+
+@dataclass(frozen=True)
+class SandboxLimits:
+    """Resource limits applied to each sandbox process"""
+
+    #: Maximum size in bytes of each process's address space (``RLIMIT_AS``)
+    memory: int | None = None
+    #: Maximum number of seconds of CPU time each process may use
+    #: (``RLIMIT_CPU``).  As this is cumulative over the life of a process,
+    #: it should be considered along with ``max_tasks``.
+    cpu: int | None = None
+    #: Maximum number of seconds of wall-clock time that a single task may take
+    timeout: float | None = None
+    #: If set, each process is replaced with a fresh one after running this
+    #: many tasks
+    max_tasks: int | None = None
+
+
+def sandbox_main(conn: Connection, limits: SandboxLimits) -> None:
+    """
+    The main loop of a sandbox process: apply ``limits``, then repeatedly
+    receive ``(func, args)`` pairs on ``conn``, call them, and send back the
+    outcomes until `None` or EOF is received
+    """
+    # Leave it to the parent process to handle Ctrl-C:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import resource
+
+    if limits.memory is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (limits.memory, limits.memory))
+    if limits.cpu is not None:
+        # The soft limit delivers SIGXCPU (fatal by default); the hard limit,
+        # one second later, delivers SIGKILL in case that's ignored.
+        resource.setrlimit(resource.RLIMIT_CPU, (limits.cpu, limits.cpu + 1))
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        func, args = msg
+        try:
+            reply: tuple[Any, ...] = ("ok", func(*args))
+        except MemoryError:
+            reply = ("memory", traceback.format_exc())
+        except Exception as e:
+            reply = ("error", e, traceback.format_exc())
+        try:
+            conn.send(reply)
+        except OSError:
+            # The parent has gone away
+            return
+        except Exception:
+            # The result or exception couldn't be pickled
+            try:
+                conn.send(("error", None, traceback.format_exc()))
+            except OSError:
+                return
+
+
+class SandboxProcess:
+    """A single sandbox process and the parent's end of its pipe"""
+
+    def __init__(self, ctx: BaseContext, limits: SandboxLimits) -> None:
+        self.limits = limits
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(  # type: ignore[attr-defined]
+            target=sandbox_main, args=(child_conn, limits), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        #: The number of tasks run by this process so far
+        self.tasks = 0
+        #: Whether the process is still usable
+        self.alive = True
+
+    def run(self, func: Callable[..., Any], args: tuple[Any, ...]) -> Any:
+        """
+        Run ``func(*args)`` in the process and return the result or re-raise
+        the exception.  If a limit is exceeded or the process has died, the
+        process is killed (if it isn't dead already) and an
+        `InspectionLimitError` is raised.
+        """
+        self.tasks += 1
+        try:
+            self.conn.send((func, args))
+        except OSError:
+            # The process died while idle (e.g., it was killed by the OOM
+            # killer), closing its end of the pipe.
+            self.kill()
+            raise InspectionLimitError(self.death_reason()) from None
+        if not self.conn.poll(self.limits.timeout):
+            self.kill()
+            raise InspectionLimitError(
+                f"Inspection exceeded time limit of {self.limits.timeout} seconds"
+            )
+        try:
+            status, *payload = self.conn.recv()
+        except EOFError:
+            self.kill()
+            raise InspectionLimitError(self.death_reason()) from None
+        if status == "ok":
+            return payload[0]
+        elif status == "memory":
+            # The process may be in a bad state after running out of memory,
+            # so don't reuse it.
+            self.close()
+            raise InspectionLimitError(
+                f"Inspection exceeded memory limit of {self.limits.memory} bytes"
+            ) from RemoteTraceback(payload[0])
+        else:
+            exc, tb = payload
+            if exc is None:
+                exc = RuntimeError("Unpicklable error in sandbox process")
+            raise exc from RemoteTraceback(tb)
+
+    def death_reason(self) -> str:
+        """
+        Describe why the process died unexpectedly, judging by its exit code
+        """
+        self.process.join()
+        code = self.process.exitcode
+        if code == -signal.SIGXCPU or (
+            code == -signal.SIGKILL and self.limits.cpu is not None
+        ):
+            return (
+                f"Inspection process killed by signal {-code}, likely for"
+                f" exceeding CPU time limit of {self.limits.cpu} seconds"
+            )
+        elif code is not None and code < 0:
+            return f"Inspection process killed by signal {-code}"
+        else:
+            return f"Inspection process died with exit code {code}"
+
+    def close(self) -> None:
+        """Shut down the process gracefully, killing it if that fails"""
+        if self.alive:
+            self.alive = False
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+            self.conn.close()
+
+    def kill(self) -> None:
+        """Kill the process"""
+        if self.alive:
+            self.alive = False
+            self.process.kill()
+            self.process.join()
+            self.conn.close()
+
+
+class InspectorPool:
+    """
+    A pool of up to ``size`` sandbox processes, each subject to ``limits``, in
+    which functions can be run from multiple threads at once.  Processes are
+    started on demand, replaced after running ``limits.max_tasks`` tasks, and
+    replaced after exceeding a limit.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        limits: SandboxLimits,
+        ctx: BaseContext | None = None,
+    ) -> None:
+        self.limits = limits
+        if ctx is None:
+            # Forking a process with threads running is unsafe, so use a fork
+            # server where possible.
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                ctx = multiprocessing.get_context("forkserver")
+            else:
+                ctx = multiprocessing.get_context()
+        self.ctx = ctx
+        #: Idle processes, or `None` placeholders for processes not yet started
+        self.idle: LifoQueue[SandboxProcess | None] = LifoQueue()
+        for _ in range(size):
+            self.idle.put(None)
+        self.size = size
+        #: The number of processes started so far
+        self.started = 0
+        #: The number of processes that exceeded a limit
+        self.limit_errors = 0
+
+    def __enter__(self) -> InspectorPool:
+        return self
+
+    def __exit__(self, *_exc: Any) -> None:
+        self.close()
+
+    def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run ``func(*args)`` in a sandbox process, waiting for one to become
+        free if necessary, and return the result.  Raises
+        `InspectionLimitError` if a limit is exceeded.
+        """
+        proc = self.idle.get()
+        try:
+            if proc is None:
+                proc = SandboxProcess(self.ctx, self.limits)
+                self.started += 1
+            try:
+                return proc.run(func, args)
+            except InspectionLimitError:
+                self.limit_errors += 1
+                raise
+        finally:
+            if proc is not None and (
+                not proc.alive
+                or (
+                    self.limits.max_tasks is not None
+                    and proc.tasks >= self.limits.max_tasks
+                )
+            ):
+                proc.close()
+                proc = None
+            self.idle.put(proc)
+
+    def close(self) -> None:
+        """Shut down all of the processes"""
+        for _ in range(self.size):
+            proc = self.idle.get()
+            if proc is not None:
+                proc.close()
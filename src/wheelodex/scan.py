@@ -127,7 +127,16 @@ def scan_changelog(since: int) -> None:
 
     try:
         ps = PyPISerial.ensure(since)
-        for event in pypi.changelog_since_serial(since):
+        events = pypi.changelog_since_serial(since)
+        # Look up or create all of the projects that the events below will
+        # `ensure()` in one go:
+        Project.ensure_many(
+            event.project
+            for event in events
+            if isinstance(event, (ProjectCreated, VersionCreated))
+            or (isinstance(event, FileCreated) and event.is_wheel())
+        )
+        for event in events:
             log.debug("Got event from changelog: %r", event)
             ps.serial = max(ps.serial, event.serial)
             match event:
@@ -0,0 +1,157 @@
+"""Adaptive limiting of concurrent downloads & download bandwidth"""
+
+from __future__ import annotations
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+import logging
+import threading
+import time
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+
+def is_throttling_status(status_code: int) -> bool:
+    """
+    Returns true if ``status_code`` is an HTTP status with which a server
+    tells us to back off: 429 (Too Many Requests) or any 5xx
+    """
+    return status_code == 429 or status_code >= 500
+
+
+class DownloadScheduler:
+    """
+    Limits the number of downloads in progress at once and, if ``bandwidth``
+    is set, the combined rate (in bytes per second) at which they receive
+    data.
+
+    The concurrency limit starts at 1 and is adjusted by additive increase,
+    multiplicative decrease (AIMD): after each window of ``limit`` consecutive
+    successful downloads, the limit is increased by one (up to
+    ``max_concurrency``), unless the bandwidth cap was hit during the window,
+    in which case more concurrent transfers wouldn't get more data through;
+    whenever a server responds with a throttling status (see
+    `is_throttling_status()`), the limit is halved.  Decreases are applied at
+    most once per ``cooldown`` seconds so that a burst of failures from
+    transfers that were already in flight counts as a single signal.
+
+    The bandwidth cap is enforced with a token bucket holding up to one
+    second's worth of bytes.
+
+    Instances are safe to use from multiple threads.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 1,
+        bandwidth: int | None = None,
+        cooldown: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Any] = time.sleep,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.bandwidth = bandwidth
+        self.cooldown = cooldown
+        self.clock = clock
+        self.sleep = sleep
+        self.cond = threading.Condition()
+        #: The current maximum number of concurrent downloads
+        self.limit = 1
+        #: The highest value that `limit` has reached
+        self.peak = 1
+        #: The number of downloads currently in progress
+        self.active = 0
+        #: The number of times that `limit` has been decreased
+        self.decreases = 0
+        #: The total number of seconds that downloads have spent waiting on
+        #: the bandwidth cap
+        self.throttled_secs = 0.0
+        self.successes = 0
+        self.saturated = False
+        self.last_decrease: float | None = None
+        self.tokens = float(bandwidth or 0)
+        self.last_refill = clock()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """
+        A context manager that waits until fewer than `limit` downloads are in
+        progress and then counts the calling thread as downloading until the
+        context is exited
+        """
+        with self.cond:
+            while self.active >= self.limit:
+                self.cond.wait()
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active -= 1
+                self.cond.notify()
+
+    def consume(self, nbytes: int) -> None:
+        """
+        Account for ``nbytes`` bytes having been received, sleeping as long as
+        necessary to keep within the bandwidth cap
+        """
+        if self.bandwidth is None:
+            return
+        with self.cond:
+            now = self.clock()
+            self.tokens = min(
+                float(self.bandwidth),
+                self.tokens + (now - self.last_refill) * self.bandwidth,
+            )
+            self.last_refill = now
+            self.tokens -= nbytes
+            if self.tokens < 0:
+                delay = -self.tokens / self.bandwidth
+                self.saturated = True
+                self.throttled_secs += delay
+            else:
+                delay = 0
+        # Sleep outside the lock; the bucket's deficit makes any other threads
+        # that receive data in the meantime wait their turn as well.
+        if delay > 0:
+            self.sleep(delay)
+
+    def succeeded(self) -> None:
+        """Note that a download completed successfully"""
+        with self.cond:
+            self.successes += 1
+            if self.successes < self.limit:
+                return
+            self.successes = 0
+            if self.saturated:
+                self.saturated = False
+            elif self.limit < self.max_concurrency:
+                self.limit += 1
+                self.peak = max(self.peak, self.limit)
+                log.debug("Increased download concurrency to %d", self.limit)
+                self.cond.notify()
+
+    def throttled(self) -> None:
+        """Note that a server responded with a throttling status"""
+        with self.cond:
+            now = self.clock()
+            if (
+                self.last_decrease is not None
+                and now - self.last_decrease < self.cooldown
+            ):
+                return
+            self.last_decrease = now
+            self.successes = 0
+            if self.limit > 1:
+                self.limit //= 2
+                self.decreases += 1
+                log.info("Decreased download concurrency to %d", self.limit)
+
+    def for_json(self) -> dict[str, Any]:
+        return {
+            "concurrency": self.limit,
+            "peak_concurrency": self.peak,
+            "concurrency_decreases": self.decreases,
+            "bandwidth": self.bandwidth,
+            "throttled_secs": round(self.throttled_secs, 3),
+        }
@@ -0,0 +1,153 @@
+"""Per-stage timing of wheel processing"""
+
+from __future__ import annotations
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import math
+from time import monotonic
+from typing import Any
+
+#: The stages of processing a wheel that are timed, in pipeline order:
+#:
+#: ``download``
+#:     receiving the wheel (or its core metadata, or, for remote inspection,
+#:     its central directory & metadata files) over the network, not counting
+#:     digest computation
+#: ``digest``
+#:     computing & checking the wheel's size & digests
+#: ``inspect``
+#:     analyzing the wheel with wheel-inspect, including any time spent
+#:     waiting for a free process in the inspection pool
+#: ``build``
+#:     constructing & inserting the `WheelData` and bulk-inserting its files,
+#:     modules, keywords, entry points, and dependencies
+#: ``flush``
+#:     writing the wheel's remaining changes to the database
+#: ``commit``
+#:     committing the transaction, if storing the wheel triggered a commit
+STAGES = ("download", "digest", "inspect", "build", "flush", "commit")
+
+
+@dataclass
+class StageTimings:
+    """
+    The number of seconds spent in each stage of processing a single wheel;
+    stages that the wheel did not go through are `None`
+    """
+
+    download: float | None = None
+    digest: float | None = None
+    inspect: float | None = None
+    build: float | None = None
+    flush: float | None = None
+    commit: float | None = None
+
+    def add(self, stage: str, secs: float) -> None:
+        """Add ``secs`` seconds to the time spent in ``stage``"""
+        setattr(self, stage, (getattr(self, stage) or 0.0) + secs)
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """
+        A context manager that adds the time spent inside it to ``stage``
+        """
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.add(stage, monotonic() - start)
+
+    def for_json(self) -> dict[str, float]:
+        return {
+            stage: round(secs, 6)
+            for stage in STAGES
+            if (secs := getattr(self, stage)) is not None
+        }
+
+
+class Histogram:
+    """
+    A constant-memory summary of a stream of durations that can report
+    approximate percentiles.  Values are counted in logarithmic buckets, each
+    `GROWTH` times as wide as the one before, so reported percentiles are
+    within about 5% of the true values.
+    """
+
+    #: The ratio between the bounds of each bucket
+    GROWTH = 2 ** (1 / 8)
+    #: Values at or below this many seconds are all counted in bucket 0
+    FLOOR = 1e-6
+
+    def __init__(self) -> None:
+        self.counts: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def bucket(cls, value: float) -> int:
+        if value <= cls.FLOOR:
+            return 0
+        return 1 + math.floor(math.log(value / cls.FLOOR, cls.GROWTH))
+
+    @classmethod
+    def midpoint(cls, bucket: int) -> float:
+        if bucket == 0:
+            return 0.0
+        return float(cls.FLOOR * cls.GROWTH ** (bucket - 0.5))
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        b = self.bucket(value)
+        self.counts[b] = self.counts.get(b, 0) + 1
+
+    def percentile(self, pct: float) -> float | None:
+        """
+        Returns an approximation of the ``pct``-th percentile of the values
+        seen so far, or `None` if there are none
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(pct / 100 * self.count))
+        seen = 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen >= rank:
+                return min(self.midpoint(b), self.max)
+        return self.max  # pragma: no cover
+
+    def for_json(self) -> dict[str, Any]:
+        def rnd(x: float | None) -> float | None:
+            return round(x, 6) if x is not None else None
+
+        return {
+            "count": self.count,
+            "total": rnd(self.total),
+            "p50": rnd(self.percentile(50)),
+            "p90": rnd(self.percentile(90)),
+            "p99": rnd(self.percentile(99)),
+            "max": rnd(self.max),
+        }
+
+
+@dataclass
+class StageStats:
+    """Per-stage timing distributions for a run"""
+
+    stages: dict[str, Histogram] = field(
+        default_factory=lambda: {stage: Histogram() for stage in STAGES}
+    )
+
+    def record(self, timings: StageTimings) -> None:
+        for stage, hist in self.stages.items():
+            secs = getattr(timings, stage)
+            if secs is not None:
+                hist.add(secs)
+
+    def for_json(self) -> dict[str, Any]:
+        return {
+            stage: hist.for_json() for stage, hist in self.stages.items() if hist.count
+        }
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from collections.abc import Iterable
 from datetime import datetime
+from enum import Enum
 import platform
 import re
 from typing import Any
@@ -20,6 +21,22 @@ USER_AGENT = "wheelodex/{} ({}) requests/{} {}/{}".format(
 )
 
 
+class InspectionMode(Enum):
+    """How a wheel's `WheelData` was obtained"""
+
+    #: The entire wheel was downloaded and inspected, including verification
+    #: of its contents against its RECORD
+    FULL = "full"
+
+    #: Only the wheel's zip central directory and ``*.dist-info`` files were
+    #: fetched via HTTP range requests; the RECORD was not verified
+    REMOTE = "remote"
+
+    #: Only the wheel's :pep:`658` core metadata file was fetched & inspected;
+    #: the wheel is still awaiting full inspection
+    METADATA = "metadata"
+
+
 class JsonWheelPyPI(BaseModel):
     filename: str
     url: str
@@ -34,6 +51,7 @@ class JsonWheelPyPI(BaseModel):
 class JsonWheelMeta(BaseModel):
     processed: datetime
     wheel_inspect_version: str
+    inspection: InspectionMode = InspectionMode.FULL
 
 
 class JsonWheel(BaseModel):
@@ -43,6 +61,17 @@ class JsonWheel(BaseModel):
     errored: bool = False
 
 
+def json_datetime(dt: datetime) -> str:
+    """
+    Format a `datetime` as a string the same way that pydantic does when
+    dumping a model in JSON mode
+    """
+    s = dt.isoformat()
+    if s.endswith("+00:00"):
+        s = s[: -len("+00:00")] + "Z"
+    return s
+
+
 def latest_version(versions: Iterable[str]) -> str | None:
     """
     Returns the latest version in ``versions`` in PEP 440 order, except that
@@ -62,6 +91,73 @@ def version_sort_key(v: str) -> tuple[bool, Version]:
     return (not vobj.is_prerelease, vobj)
 
 
+#: The byte values used to encode the prerelease phases in
+#: `version_sort_bytes()`
+PRE_PHASES = {"a": b"\x00", "b": b"\x01", "rc": b"\x02"}
+
+
+def version_sort_bytes(v: str) -> bytes:
+    """
+    Returns an encoding of ``version_sort_key(v)`` as a `bytes` object such
+    that comparing the encodings of two versions bytewise gives the same
+    result as comparing their `version_sort_key()`\\s.  This allows the keys
+    to be stored in the database & sorted on in SQL.  Raises
+    `packaging.version.InvalidVersion` if ``v`` is not a valid version.
+
+    Any change to this encoding requires a migration that recomputes all
+    stored `Version.sort_key` values.
+    """
+    vobj = Version(v)
+    # Each component's encoding is prefix-free, so comparing the
+    # concatenation compares the components in order.
+    key = bytearray(b"\x00" if vobj.is_prerelease else b"\x01")
+    key += sortable_int(vobj.epoch)
+    release = list(vobj.release)
+    while release and release[-1] == 0:
+        release.pop()
+    for n in release:
+        key += b"\x01" + sortable_int(n)
+    key += b"\x00"
+    # These cases mirror the infinities used in `packaging.version`:
+    if vobj.pre is not None:
+        phase, n = vobj.pre
+        key += b"\x01" + PRE_PHASES[phase] + sortable_int(n)
+    elif vobj.post is None and vobj.dev is not None:
+        # X.Y.devN sorts before X.YaN
+        key += b"\x00"
+    else:
+        key += b"\x02"
+    if vobj.post is None:
+        key += b"\x00"
+    else:
+        key += b"\x01" + sortable_int(vobj.post)
+    if vobj.dev is None:
+        key += b"\x02"
+    else:
+        key += b"\x01" + sortable_int(vobj.dev)
+    if vobj.local is None:
+        key += b"\x00"
+    else:
+        key += b"\x01"
+        for part in vobj.local.split("."):
+            # Numeric segments sort after alphanumeric ones.
+            if part.isdigit():
+                key += b"\x02" + sortable_int(int(part))
+            else:
+                key += b"\x01" + part.encode("ascii") + b"\x00"
+        key += b"\x00"
+    return bytes(key)
+
+
+def sortable_int(n: int) -> bytes:
+    """
+    Encode a nonnegative integer as a length byte followed by its big-endian
+    representation, so that the encodings compare bytewise in numeric order
+    """
+    bs = n.to_bytes((n.bit_length() + 7) // 8, "big")
+    return bytes([len(bs)]) + bs
+
+
 def like_escape(s: str) -> str:
     """
     Escape characters in ``s`` that have special meaning to SQL's ``LIKE``
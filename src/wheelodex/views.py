@@ -13,11 +13,11 @@ from flask import (
     url_for,
 )
 from packaging.utils import canonicalize_name as normalize
+from sqlalchemy.orm import joinedload
 from sqlalchemy.sql.functions import array_agg
 from werkzeug.exceptions import HTTPException
 from werkzeug.sansio.response import Response
 from .models import (
-    DependencyRelation,
     EntryPoint,
     EntryPointGroup,
     File,
@@ -105,13 +105,9 @@ def recent_wheels() -> ResponseValue:
 def rdepends_leaders() -> ResponseValue:
     qty = current_app.config["WHEELODEX_RDEPENDS_LEADERS_QTY"]
     q = db.session.execute(
-        db.select(
-            Project,
-            db.func.count(DependencyRelation.source_project_id.distinct()).label("qty"),
-        )
-        .join(DependencyRelation, Project.id == DependencyRelation.project_id)
-        .group_by(Project)
-        .order_by(db.desc("qty"))
+        db.select(Project, Project.rdepends_qty)
+        .where(Project.rdepends_qty > 0)
+        .order_by(Project.rdepends_qty.desc())
         .limit(qty)
     )
     return render_template("rdepends_leaders.html", leaders=q)
@@ -158,7 +154,11 @@ def wheel_data(project: str, wheel: str) -> ResponseValue:
     wheel is unknown, redirect to the project's main page.
     """
     p = resolve_project(project)
-    whl = db.session.scalars(db.select(Wheel).filter_by(filename=wheel)).one_or_none()
+    whl = db.session.scalars(
+        db.select(Wheel)
+        .filter_by(filename=wheel)
+        .options(joinedload(Wheel.data).undefer(WheelData.raw_data))
+    ).one_or_none()
     if whl is None:
         return redirect(url_for(".project", project=p.name), code=302)
     elif whl.project != p:
@@ -199,8 +199,8 @@ def entry_point_groups() -> ResponseValue:
         db.select(EntryPoint.group_id)
         .join(WheelData)
         .join(Wheel)
-        .join(Version)
-        .join(Project)
+        .join(Wheel.version)
+        .join(Version.project)
         .group_by(EntryPoint.group_id, EntryPoint.name, Project.id)
         .subquery()
     )
@@ -233,8 +233,8 @@ def entry_point(group: str) -> ResponseValue:
     ### data-having version of each project):
     project_eps = paginate_rows(
         db.select(Project, EntryPoint.name)
-        .join(Version)
-        .join(Wheel)
+        .join(Project.versions)
+        .join(Version.wheels)
         .join(WheelData)
         .join(EntryPoint)
         .filter(EntryPoint.group == ep_group)
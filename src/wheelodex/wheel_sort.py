@@ -6,6 +6,7 @@ from functools import total_ordering
 import re
 from typing import Any, ClassVar
 from wheel_filename import WheelFilename
+from .util import sortable_int
 
 PYTHON_PREFERENCES = defaultdict(
     lambda: -1,
@@ -58,6 +59,14 @@ class VersionNoDot:
     def __le__(self, other: VersionNoDot) -> bool:
         return self.vs[: len(other.vs)] == other.vs or self.vs < other.vs
 
+    def to_bytes(self) -> bytes:
+        """
+        Encode the `VersionNoDot` as a `bytes` object that compares bytewise
+        the same way as the `VersionNoDot`: the terminator sorts above every
+        component, so a string sorts below its prefixes.
+        """
+        return b"".join(b"\x01" + sortable_int(c) for c in self.vs) + b"\x02"
+
     def __repr__(self) -> str:
         if any(c >= 10 for c in self.vs):
             s = "_".join(map(str, self.vs))
@@ -86,6 +95,17 @@ class WheelSortKey:
                 assert other.data is not None
                 return self.data <= other.data
 
+    def to_bytes(self) -> bytes:
+        """
+        Encode the key as a `bytes` object such that comparing the encodings
+        of two keys bytewise gives the same result as comparing the keys
+        """
+        if self.filename is not None:
+            return b"\x00" + self.filename.encode("utf-8")
+        else:
+            assert self.data is not None
+            return b"\x01" + self.data.to_bytes()
+
     @classmethod
     def unparseable(cls, filename: str) -> WheelSortKey:
         return WheelSortKey(filename=filename, data=None)
@@ -103,6 +123,21 @@ class ParsedKey:
     tiebreaker: str
     build_rank: tuple[int, str]
 
+    def to_bytes(self) -> bytes:
+        # Each field's encoding is prefix-free, so comparing the concatenation
+        # compares the fields in order.
+        key = bytearray()
+        for imp, ver in self.pyver_rank:
+            key += b"\x01" + encode_int(imp) + ver.to_bytes()
+        key += b"\x00"
+        for rank, version, arch in self.platform_rank:
+            key += b"\x01" + encode_int(rank) + encode_int(version) + encode_int(arch)
+        key += b"\x00"
+        key += self.abi_rank.to_bytes()
+        key += encode_str(self.tiebreaker)
+        key += encode_int(self.build_rank[0]) + encode_str(self.build_rank[1])
+        return bytes(key)
+
 
 class AbiRankKind(IntEnum):
     UNPARSEABLE = -1
@@ -131,6 +166,14 @@ class AbiRank:
         else:
             return False
 
+    def to_bytes(self) -> bytes:
+        key = encode_int(self.kind)
+        if self.kind is AbiRankKind.BINARY:
+            assert self.data is not None
+            imp, ver, flags = self.data
+            key += encode_int(imp) + ver.to_bytes() + encode_str(flags)
+        return key
+
     @classmethod
     def binary(cls, data: tuple[int, VersionNoDot, str]) -> AbiRank:
         return cls(kind=AbiRankKind.BINARY, data=data)
@@ -140,6 +183,37 @@ AbiRank.UNPARSEABLE = AbiRank(kind=AbiRankKind.UNPARSEABLE, data=None)
 AbiRank.NONE = AbiRank(kind=AbiRankKind.NONE, data=None)
 
 
+def encode_int(n: int) -> bytes:
+    """
+    Encode an integer that is at least -1 (the value used by the preference
+    tables for "unknown") so that the encodings compare bytewise in numeric
+    order
+    """
+    if n < 0:
+        assert n == -1
+        return b"\x00"
+    return b"\x01" + sortable_int(n)
+
+
+def encode_str(s: str) -> bytes:
+    """
+    Encode a string so that the encodings compare bytewise in the same order
+    as the strings and no encoding is a prefix of another
+    """
+    return s.encode("utf-8") + b"\x00"
+
+
+def wheel_sort_bytes(filename: str) -> bytes:
+    """
+    Returns ``wheel_sort_key(filename)`` encoded as a `bytes` object that
+    compares bytewise the same way as the key, for storing in the database
+
+    Any change to this encoding or to `wheel_sort_key()` requires a migration
+    that recomputes all stored `Wheel.sort_key` values.
+    """
+    return wheel_sort_key(filename).to_bytes()
+
+
 def wheel_sort_key(filename: str) -> WheelSortKey:
     """
     Returns a sort key for the given wheel filename that will be used to select
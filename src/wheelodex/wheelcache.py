@@ -0,0 +1,160 @@
+"""A content-addressed on-disk cache of downloaded wheels"""
+
+from __future__ import annotations
+from collections import Counter, OrderedDict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+import logging
+import os
+from pathlib import Path
+import tempfile
+import threading
+from typing import IO
+
+log = logging.getLogger(__name__)
+
+
+class WheelCache:
+    """
+    A directory of wheel files keyed by their SHA256 digests, stored at
+    :file:`{directory}/{ab}/{cd}/{abcd...}`.  When adding a wheel would make
+    the total size of the cache exceed ``max_bytes``, the least recently used
+    wheels are deleted.  Recency of use is tracked via the files'
+    modification times so that it persists across runs.
+
+    The cache only knows about the files present when it was constructed plus
+    those added through it, so if multiple processes share a cache directory,
+    each one's view of its total size is approximate.
+
+    The cache does not verify the contents of the files it returns; that is
+    the caller's responsibility.  Instances are safe to use from multiple
+    threads, and a wheel that is in use by one thread can be protected from
+    eviction by another with `pinned()`.
+    """
+
+    def __init__(
+        self, directory: str | os.PathLike[str], max_bytes: int | None
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        #: Mapping from SHA256 digests to file sizes, ordered from least to
+        #: most recently used
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.total_bytes = 0
+        #: The number of `pinned()` contexts currently in effect for each
+        #: digest
+        self.pins: Counter[str] = Counter()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        found = []
+        for p in self.directory.glob("??/??/*"):
+            if p.name.startswith("."):
+                continue
+            st = p.stat()
+            found.append((st.st_mtime, p.name, st.st_size))
+        for _, sha256, size in sorted(found):
+            self.entries[sha256] = size
+            self.total_bytes += size
+        log.debug(
+            "Wheel cache at %s contains %d wheels totalling %d bytes",
+            self.directory,
+            len(self.entries),
+            self.total_bytes,
+        )
+
+    def path_for(self, sha256: str) -> Path:
+        """Returns the path at which the wheel with the given digest is stored"""
+        return self.directory / sha256[:2] / sha256[2:4] / sha256
+
+    def fits(self, size: int) -> bool:
+        """Returns true iff a wheel of the given size may be stored in the cache"""
+        return self.max_bytes is None or size <= self.max_bytes
+
+    def get(self, sha256: str) -> Path | None:
+        """
+        Return the path to the cached wheel with the given digest, marking it
+        as recently used, or return `None` if it is not in the cache
+        """
+        path = self.path_for(sha256)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self._forget(sha256)
+            return None
+        with self.lock:
+            if sha256 in self.entries:
+                self.entries.move_to_end(sha256)
+            else:
+                # Added by another process
+                size = path.stat().st_size
+                self.entries[sha256] = size
+                self.total_bytes += size
+        return path
+
+    def add(self, sha256: str, size: int, write: Callable[[IO[bytes]], None]) -> Path:
+        """
+        Store a wheel with the given digest & size in the cache by calling
+        ``write`` on a binary filehandle, and return the wheel's path.  The file
+        only appears in the cache once ``write`` returns successfully.  Enough
+        least recently used wheels are evicted beforehand to keep the cache
+        within its size limit.
+        """
+        path = self.path_for(sha256)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                write(fp)
+            with self.lock:
+                self._forget(sha256)
+                self._evict(size)
+                os.replace(tmpname, path)
+                self.entries[sha256] = size
+                self.total_bytes += size
+        except BaseException:
+            Path(tmpname).unlink(missing_ok=True)
+            raise
+        return path
+
+    @contextmanager
+    def pinned(self, sha256: str) -> Iterator[None]:
+        """
+        A context manager that keeps the wheel with the given digest from being
+        evicted while in effect, so that the path returned by `get()` or
+        `add()` remains usable.  The wheel need not be in the cache yet.  If
+        every wheel that could be evicted is pinned, the cache is allowed to
+        exceed its size limit.
+        """
+        with self.lock:
+            self.pins[sha256] += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.pins[sha256] -= 1
+                if not self.pins[sha256]:
+                    del self.pins[sha256]
+
+    def discard(self, sha256: str) -> None:
+        """Remove the wheel with the given digest from the cache, if present"""
+        with self.lock:
+            self._forget(sha256)
+            self.path_for(sha256).unlink(missing_ok=True)
+
+    def _forget(self, sha256: str) -> None:
+        size = self.entries.pop(sha256, None)
+        if size is not None:
+            self.total_bytes -= size
+
+    def _evict(self, incoming: int) -> None:
+        if self.max_bytes is None:
+            return
+        for sha256 in list(self.entries):
+            if self.total_bytes + incoming <= self.max_bytes:
+                break
+            if self.pins[sha256]:
+                continue
+            self._forget(sha256)
+            log.debug("Evicting %s from wheel cache", sha256)
+            self.path_for(sha256).unlink(missing_ok=True)
@@ -0,0 +1,264 @@
+"""Wheel access classes for use with wheel-inspect"""
+
+from __future__ import annotations
+from io import BytesIO
+import logging
+from pathlib import Path
+from typing import IO, Any
+from zipfile import ZipFile
+import requests
+from wheel_filename import WheelFilename
+from wheel_inspect.classes import DistInfoProvider, FileProvider
+from wheel_inspect.errors import MissingDistInfoFileError
+from wheel_inspect.inspecting import inspect
+from wheel_inspect.record import Record
+from wheel_inspect.util import digest_file, find_dist_info_dir
+from .remotezip import HTTPRangeFile
+
+log = logging.getLogger(__name__)
+
+
+class KnownWheel(DistInfoProvider):
+    """
+    Base class for wheels whose size & digests are known in advance (having
+    been reported by PyPI) and thus are taken as given rather than being
+    computed by reading the entire file
+    """
+
+    def __init__(self, filename: str, size: int, md5: str, sha256: str) -> None:
+        self.filename = filename
+        self.parsed_filename = WheelFilename.parse(filename)
+        self.size = size
+        self.digests = {"md5": md5, "sha256": sha256}
+
+    def basic_metadata(self) -> dict[str, Any]:
+        namebits = self.parsed_filename
+        return {
+            "filename": self.filename,
+            "project": namebits.project,
+            "version": namebits.version,
+            "buildver": namebits.build,
+            "pyver": namebits.python_tags,
+            "abi": namebits.abi_tags,
+            "arch": namebits.platform_tags,
+            "file": {
+                "size": self.size,
+                "digests": dict(self.digests),
+            },
+        }
+
+
+class ZipWheel(KnownWheel):
+    """
+    Base class for reading a wheel's :file:`*.dist-info` directory from a
+    zipfile.  This is the same as the `DistInfoProvider` parts of
+    wheel-inspect's ``WheelFile``, except for the handling of the file's size
+    & digests.
+
+    Subclasses must implement `open()`.
+    """
+
+    def __init__(self, filename: str, size: int, md5: str, sha256: str) -> None:
+        super().__init__(filename, size=size, md5=md5, sha256=sha256)
+        self.fp: IO[bytes] | None = None
+        self.zipfile: ZipFile | None = None
+        self._dist_info: str | None = None
+
+    def open(self) -> IO[bytes]:
+        """Open & return a seekable binary filehandle for the wheel"""
+        raise NotImplementedError
+
+    def __enter__(self) -> ZipWheel:
+        self.fp = self.open()
+        self.zipfile = ZipFile(self.fp)
+        return self
+
+    def __exit__(self, *_exc: Any) -> None:
+        assert self.zipfile is not None and self.fp is not None
+        self.zipfile.close()
+        self.fp.close()
+        self.zipfile = None
+        self.fp = None
+
+    @property
+    def dist_info(self) -> str:
+        if self._dist_info is None:
+            assert self.zipfile is not None
+            self._dist_info = find_dist_info_dir(
+                self.zipfile.namelist(),
+                self.parsed_filename.project,
+                self.parsed_filename.version,
+            )
+        return self._dist_info
+
+    def open_dist_info_file(self, path: str) -> IO[bytes]:
+        assert self.zipfile is not None
+        try:
+            zi = self.zipfile.getinfo(self.dist_info + "/" + path)
+        except KeyError:
+            raise MissingDistInfoFileError(path)
+        else:
+            return self.zipfile.open(zi)
+
+    def has_dist_info_file(self, path: str) -> bool:
+        assert self.zipfile is not None
+        try:
+            self.zipfile.getinfo(self.dist_info + "/" + path)
+        except KeyError:
+            return False
+        else:
+            return True
+
+
+class DownloadedWheel(ZipWheel, FileProvider):
+    """
+    A wheel whose size & digests have already been computed & verified (by
+    `wheelodex.process.download()`), stored either in a file or in the
+    in-memory buffer it was downloaded into.  As this is a ``FileProvider``,
+    wheel-inspect verifies the wheel's contents against its :file:`RECORD`.
+    """
+
+    def __init__(
+        self, filename: str, src: Path | BytesIO, size: int, md5: str, sha256: str
+    ) -> None:
+        super().__init__(filename, size=size, md5=md5, sha256=sha256)
+        self.src = src
+
+    def open(self) -> IO[bytes]:
+        if isinstance(self.src, BytesIO):
+            # Read the buffer in place rather than copying its contents
+            self.src.seek(0)
+            return self.src
+        else:
+            return self.src.open("rb")
+
+    def list_files(self) -> list[str]:
+        assert self.zipfile is not None
+        return [name for name in self.zipfile.namelist() if not name.endswith("/")]
+
+    def has_directory(self, path: str) -> bool:
+        assert self.zipfile is not None
+        return any(name.startswith(path) for name in self.zipfile.namelist())
+
+    def get_file_size(self, path: str) -> int:
+        assert self.zipfile is not None
+        return self.zipfile.getinfo(path).file_size
+
+    def get_file_hash(self, path: str, algorithm: str) -> str:
+        assert self.zipfile is not None
+        with self.zipfile.open(path) as fp:
+            digest: str = digest_file(fp, [algorithm])[algorithm]
+            return digest
+
+
+class RemoteWheel(ZipWheel):
+    """
+    A wheel that is read in place from a URL via HTTP range requests.  Only the
+    zipfile's end-of-central-directory record, its central directory, and the
+    :file:`*.dist-info` members that wheel-inspect asks for are fetched.
+
+    As this is not a ``FileProvider``, wheel-inspect does not verify the
+    wheel's contents against its :file:`RECORD` (which would require fetching
+    everything), and the size & digests in the results are the values reported
+    by PyPI rather than ones computed from the wheel.
+    """
+
+    def __init__(
+        self,
+        s: requests.Session,
+        filename: str,
+        url: str,
+        size: int,
+        md5: str,
+        sha256: str,
+    ) -> None:
+        super().__init__(filename, size=size, md5=md5, sha256=sha256)
+        self.s = s
+        self.url = url
+        self.rangefile: HTTPRangeFile | None = None
+
+    def open(self) -> IO[bytes]:
+        self.rangefile = HTTPRangeFile(self.s, self.url, self.size)
+        return self.rangefile  # type: ignore[return-value]
+
+
+class MetadataWheel(KnownWheel):
+    """
+    A wheel of which only the :file:`METADATA` file is available, as served
+    separately by PyPI per :pep:`658`.  The wheel's :file:`RECORD` is treated
+    as empty rather than missing, and its :file:`WHEEL` file is not inspected,
+    so that the validity of the results reflects only the :file:`METADATA`.
+    """
+
+    def __init__(
+        self, filename: str, metadata: bytes, size: int, md5: str, sha256: str
+    ) -> None:
+        super().__init__(filename, size=size, md5=md5, sha256=sha256)
+        self.metadata = metadata
+
+    def open_dist_info_file(self, path: str) -> IO[bytes]:
+        if path == "METADATA":
+            return BytesIO(self.metadata)
+        else:
+            raise MissingDistInfoFileError(path)
+
+    def has_dist_info_file(self, path: str) -> bool:
+        return path == "METADATA"
+
+    def get_record(self) -> Record:
+        return Record({})
+
+    def get_wheel_info(self) -> dict[str, Any]:
+        return {}
+
+
+def inspect_downloaded_wheel(
+    filename: str, src: Path | BytesIO, size: int, md5: str, sha256: str
+) -> dict:
+    """
+    Examine the verified wheel with the given filename, stored either at the
+    path or in the in-memory buffer ``src``, with wheel-inspect and return the
+    same structure as ``inspect_wheel()``.  An in-memory buffer is closed
+    afterwards.
+    """
+    with DownloadedWheel(filename, src, size=size, md5=md5, sha256=sha256) as whl:
+        about: dict[str, Any] = inspect(whl)
+        return about
+
+
+def inspect_remote_wheel(
+    s: requests.Session, filename: str, url: str, size: int, md5: str, sha256: str
+) -> dict:
+    """
+    Examine the :file:`*.dist-info` directory of the wheel at ``url`` via HTTP
+    range requests and return the same structure as ``inspect_wheel()``, minus
+    the results of :file:`RECORD` verification
+    """
+    whl = RemoteWheel(s, filename, url, size=size, md5=md5, sha256=sha256)
+    with whl:
+        about: dict[str, Any] = inspect(whl)
+        assert whl.rangefile is not None
+        log.info(
+            "Inspected %s remotely using %d range requests totalling %d bytes",
+            filename,
+            whl.rangefile.requests,
+            whl.rangefile.bytes_fetched,
+        )
+        return about
+
+
+def inspect_metadata(
+    filename: str, metadata: bytes, size: int, md5: str, sha256: str
+) -> dict:
+    """
+    Examine the :pep:`658` core metadata file ``metadata`` for the wheel with
+    the given filename and return the subset of the structure returned by
+    ``inspect_wheel()`` that can be derived from it.  In particular, the
+    results lack ``dist_info.record`` and ``dist_info.wheel``, and
+    ``derived.modules`` is always empty.
+    """
+    whl = MetadataWheel(filename, metadata, size=size, md5=md5, sha256=sha256)
+    about: dict[str, Any] = inspect(whl)
+    del about["dist_info"]["record"]
+    del about["dist_info"]["wheel"]
+    return about
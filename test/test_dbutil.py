@@ -1,13 +1,40 @@
 from __future__ import annotations
 from collections.abc import Iterable, Iterator, Sequence
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import TypedDict, TypeVar
 import pytest
 from sqlalchemy import text
 from sqlalchemy.orm import DeclarativeBase
 from wheelodex.app import create_app
 from wheelodex.dbutil import purge_old_versions, remove_wheel
-from wheelodex.models import OrphanWheel, Project, Version, Wheel, db
+from wheelodex.models import (
+    DependencyRelation,
+    EntryPoint,
+    EntryPointGroup,
+    File,
+    OrphanWheel,
+    Project,
+    Version,
+    Wheel,
+    WheelData,
+    db,
+)
+from wheelodex.process import (
+    Committer,
+    Lease,
+    RetryPolicy,
+    WheelJob,
+    WheelResult,
+    queued_jobs,
+    stale_inspect_versions,
+    store_result,
+)
+from wheelodex.util import (
+    InspectionMode,
+    JsonWheel,
+    JsonWheelMeta,
+    JsonWheelPyPI,
+)
 
 T = TypeVar("T", bound=DeclarativeBase)
 
@@ -27,6 +54,9 @@ def tmpdb(tmpdb_inited: None) -> Iterator[None]:  # noqa: U100
         yield
     finally:
         db.session.rollback()
+        # Objects loaded from rows inserted during the test are only expired
+        # by the rollback, and SQLite reuses their IDs in the next test.
+        db.session.expunge_all()
 
 
 def sort_versions(vs: Iterable[Version]) -> list[Version]:
@@ -191,6 +221,41 @@ def test_project_ensure_extant() -> None:
     assert p.latest_version is None
 
 
+def test_project_ensure_many() -> None:
+    Project.ensure("Glarch")
+    db.session.flush()
+    projects = Project.ensure_many(["FooBar", "glarch", "FOOBAR", "quux"])
+    assert list(projects) == ["foobar", "glarch", "quux"]
+    assert projects["foobar"].display_name == "FooBar"
+    assert projects["glarch"].display_name == "Glarch"
+    assert Project.ensure("FOOBAR") is projects["foobar"]
+    assert sorted(p.name for p in get_all(Project)) == ["foobar", "glarch", "quux"]
+
+
+def test_project_ensure_savepoint_rollback() -> None:
+    Project.ensure("FooBar")
+    db.session.flush()
+    with pytest.raises(RuntimeError):
+        with db.session.begin_nested():
+            Project.ensure("Glarch")
+            db.session.flush()
+            raise RuntimeError("Rollback")
+    # The Project created inside the savepoint must not be reused:
+    p = Project.ensure("glarch")
+    db.session.flush()
+    assert Project.get_or_none("glarch") is p
+    assert sorted(p.name for p in get_all(Project)) == ["foobar", "glarch"]
+
+
+def test_entry_point_group_ensure_many() -> None:
+    grp = EntryPointGroup.ensure("console_scripts")
+    groups = EntryPointGroup.ensure_many(["console_scripts", "foo.plugins"])
+    assert groups["console_scripts"] is grp
+    assert groups["foo.plugins"].name == "foo.plugins"
+    assert EntryPointGroup.ensure("foo.plugins") is groups["foo.plugins"]
+    assert len(get_all(EntryPointGroup)) == 2
+
+
 def test_project_get_or_none() -> None:
     assert get_all(Project) == []
     Project.ensure("FooBar")
@@ -248,6 +313,46 @@ def test_ensure_version_extant() -> None:
     assert p.latest_version == v
 
 
+def test_ensure_version_latest() -> None:
+    p = Project.ensure("FooBar")
+    v1 = p.ensure_version("1.0")
+    assert p.latest_version == v1
+    p.ensure_version("0.9")
+    assert p.latest_version == v1
+    p.ensure_version("2.0rc1")
+    assert p.latest_version == v1
+    v2 = p.ensure_version("1.10")
+    assert p.latest_version == v2
+    p.ensure_version("1.10.dev1")
+    assert p.latest_version == v2
+
+
+def test_ensure_wheel_preference() -> None:
+    p = Project.ensure("FooBar")
+    v1 = p.ensure_version("1.0")
+    wheels = {}
+    for filename in [
+        "FooBar-1.0-cp39-cp39-win32.whl",
+        "FooBar-1.0-py3-none-any.whl",
+        "FooBar-1.0-cp39-cp39-manylinux1_x86_64.whl",
+    ]:
+        args = FOOBAR_1_WHEEL.copy()
+        args["filename"] = filename
+        args["url"] = f"http://example.com/{filename}"
+        wheels[filename] = v1.ensure_wheel(**args)
+    assert p.best_wheel == wheels["FooBar-1.0-py3-none-any.whl"]
+    assert p.versions_wheels_grid() == [
+        (
+            "1.0",
+            [
+                (wheels["FooBar-1.0-py3-none-any.whl"], False),
+                (wheels["FooBar-1.0-cp39-cp39-manylinux1_x86_64.whl"], False),
+                (wheels["FooBar-1.0-cp39-cp39-win32.whl"], False),
+            ],
+        )
+    ]
+
+
 def test_get_version_or_none() -> None:
     assert get_all(Project) == []
     p = Project.ensure("FooBar")
@@ -293,6 +398,52 @@ def test_remove_version() -> None:
     assert p.has_wheels
 
 
+def test_preferred_wheel() -> None:
+    p = Project.ensure("FooBar")
+    v1 = p.ensure_version("1.0")
+    whl1 = v1.ensure_wheel(**FOOBAR_1_WHEEL)
+    whl1b = v1.ensure_wheel(**FOOBAR_1_WHEEL2)
+    v2 = p.ensure_version("2.0")
+    whl2 = v2.ensure_wheel(**FOOBAR_2_WHEEL)
+    assert p.latest_version == v2
+    assert p.preferred_wheel_id is None
+    assert p.best_wheel == whl2
+    whl1b.set_data(FOOBAR_1_DATA)
+    assert p.preferred_wheel == whl1b
+    assert p.best_wheel == whl1b
+    whl1.set_data(FOOBAR_1_DATA)
+    assert p.preferred_wheel == whl1
+    whl1b.set_data(FOOBAR_1_DATA)
+    assert p.preferred_wheel == whl1
+    whl2.set_data(FOOBAR_2_DATA)
+    assert p.preferred_wheel == whl2
+    p.remove_version("2.0")
+    assert p.latest_version == v1
+    assert p.preferred_wheel == whl1
+    remove_wheel(whl1.filename)
+    assert p.preferred_wheel == whl1b
+    db.session.flush()
+    db.session.expire(p)
+    assert p.latest_version == v1
+    assert p.preferred_wheel == whl1b
+    p.remove()
+    db.session.flush()
+    assert p.latest_version_id is None
+    assert p.preferred_wheel_id is None
+    assert p.best_wheel is None
+
+
+def test_purge_old_versions_updates_latest() -> None:
+    p = Project.ensure("foobar")
+    v1 = p.ensure_version("1.0")
+    v1.ensure_wheel(**FOOBAR_1_WHEEL)
+    p.ensure_version("2.0")
+    assert p.latest_version is not None
+    assert p.latest_version.name == "2"
+    purge_old_versions()
+    assert p.latest_version == v1
+
+
 def test_purge_old_versions_one_version() -> None:
     v1 = Project.ensure("foobar").ensure_version("1.0")
     purge_old_versions()
@@ -490,6 +641,35 @@ def test_preferred_wheel_higher_data() -> None:
     assert p.best_wheel == whl2
 
 
+def test_preferred_wheel_metadata_only() -> None:
+    p = Project.ensure("FooBar")
+    v1 = p.ensure_version("1.0")
+    whl1 = v1.ensure_wheel(**FOOBAR_1_WHEEL)
+    whl1.set_data(FOOBAR_1_DATA)
+    v2 = p.ensure_version("2.0")
+    whl2 = v2.ensure_wheel(**FOOBAR_2_WHEEL)
+    whl2.set_data(FOOBAR_2_DATA, inspection=InspectionMode.METADATA)
+    assert p.preferred_wheel == whl1
+    p.update_latest()
+    assert p.preferred_wheel == whl1
+    whl2.set_data(FOOBAR_2_DATA)
+    assert p.preferred_wheel == whl2
+
+
+def test_purge_old_versions_latest_has_metadata_plus_data() -> None:
+    p = Project.ensure("foobar")
+    v1 = p.ensure_version("1.0")
+    whl1 = v1.ensure_wheel(**FOOBAR_1_WHEEL)
+    whl1.set_data(FOOBAR_1_DATA)
+    p.ensure_version("1.5")
+    v2 = p.ensure_version("2.0")
+    whl2 = v2.ensure_wheel(**FOOBAR_2_WHEEL)
+    whl2.set_data(FOOBAR_2_DATA, inspection=InspectionMode.METADATA)
+    purge_old_versions()
+    assert sort_versions(get_all(Version)) == [v1, v2]
+    assert p.preferred_wheel == whl1
+
+
 def test_to_process_skip_data() -> None:
     assert Wheel.to_process() == []
     p = Project.ensure("FooBar")
@@ -500,6 +680,198 @@ def test_to_process_skip_data() -> None:
     assert Wheel.to_process() == []
 
 
+def test_to_process_metadata() -> None:
+    assert Wheel.to_process(metadata=True) == []
+    p = Project.ensure("FooBar")
+    v1 = p.ensure_version("1.0")
+    whl1 = v1.ensure_wheel(**FOOBAR_1_WHEEL)
+    assert Wheel.to_process(metadata=True) == [whl1]
+    whl1.set_data(FOOBAR_1_DATA, inspection=InspectionMode.METADATA)
+    assert Wheel.to_process(metadata=True) == []
+    assert Wheel.to_process() == [whl1]
+    whl1.set_data(FOOBAR_1_DATA)
+    assert Wheel.to_process() == []
+
+
+def test_set_data_replace() -> None:
+    p = Project.ensure("FooBar")
+    v1 = p.ensure_version("1.0")
+    whl1 = v1.ensure_wheel(**FOOBAR_1_WHEEL)
+    whl1.set_data(
+        {
+            **FOOBAR_1_DATA,
+            "derived": {"dependencies": ["quux"], "keywords": ["foo"], "modules": []},
+        },
+        inspection=InspectionMode.METADATA,
+    )
+    db.session.flush()
+    whl1.set_data(
+        {
+            **FOOBAR_1_DATA,
+            "derived": {
+                "dependencies": ["glarch"],
+                "keywords": ["bar"],
+                "modules": ["foobar"],
+            },
+        }
+    )
+    db.session.flush()
+    assert whl1.data is not None
+    assert whl1.data.inspection is InspectionMode.FULL
+    assert [proj.name for proj in whl1.data.dependencies] == ["glarch"]
+    assert [kw.name for kw in whl1.data.keywords] == ["bar"]
+    assert len(get_all(WheelData)) == 1
+
+
+def test_to_process_chunks() -> None:
+    assert list(Wheel.to_process_chunks(chunk_size=2)) == []
+    wheels = []
+    for i in range(5):
+        p = Project.ensure(f"proj{i}")
+        args = FOOBAR_1_WHEEL.copy()
+        args["filename"] = f"proj{i}-1.0-py3-none-any.whl"
+        args["url"] = f"http://example.com/proj{i}-1.0-py3-none-any.whl"
+        wheels.append(p.ensure_version("1.0").ensure_wheel(**args))
+    db.session.flush()
+    chunks = Wheel.to_process_chunks(chunk_size=2)
+    assert next(chunks) == wheels[:2]
+    # Each chunk is fetched from the head of the queue, so wheels that are
+    # still queued are returned again:
+    assert next(chunks) == wheels[:2]
+    wheels[0].add_error("Testing")
+    Wheel.claim([wheels[1].id], "test", timedelta(hours=1))
+    wheels[3].add_error("Testing")
+    assert next(chunks) == [wheels[2], wheels[4]]
+    wheels[2].add_error("Testing")
+    wheels[4].add_error("Testing")
+    assert list(chunks) == []
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 10])
+def test_to_process_chunks_order(chunk_size: int) -> None:
+    def mkwheel(name: str, size: int, uploaded: int) -> Wheel:
+        return (
+            Project.ensure(name)
+            .ensure_version("1.0")
+            .ensure_wheel(
+                filename=f"{name}-1.0-py3-none-any.whl",
+                url=f"http://example.com/{name}-1.0-py3-none-any.whl",
+                size=size,
+                md5="1234567890abcdef1234567890abcdef",
+                sha256="1234567890abcdef1234567890abcdef1234567890abcdef1234567890abcdef",
+                uploaded=unixts(uploaded),
+            )
+        )
+
+    old_small = mkwheel("old_small", 100, 1000)
+    old_big = mkwheel("old_big", 200, 1000)
+    new_big = mkwheel("new_big", 200, 2000)
+    new_big2 = mkwheel("new_big2", 200, 2000)
+    popular = mkwheel("popular", 300, 500)
+    # A wheel with data that depends on `popular`:
+    user = Project.ensure("user").ensure_version("1.0").ensure_wheel(**QUUX_1_5_WHEEL)
+    user.set_data(
+        {
+            **FOOBAR_1_DATA,
+            "project": "user",
+            "derived": {"dependencies": ["popular"], "keywords": [], "modules": []},
+        }
+    )
+    db.session.flush()
+
+    def queue(order: list[str]) -> list[Wheel]:
+        wheels: list[Wheel] = []
+        for chunk in Wheel.to_process_chunks(chunk_size=chunk_size, order=order):
+            Wheel.claim([whl.id for whl in chunk], "test", timedelta(hours=1))
+            wheels.extend(chunk)
+        Wheel.release_leases("test")
+        return wheels
+
+    assert queue([]) == [old_small, old_big, new_big, new_big2, popular]
+    assert queue(["size"]) == [old_small, old_big, new_big, new_big2, popular]
+    assert queue(["recent", "size"]) == [
+        new_big,
+        new_big2,
+        old_small,
+        old_big,
+        popular,
+    ]
+    assert queue(["rdepends", "recent", "size"]) == [
+        popular,
+        new_big,
+        new_big2,
+        old_small,
+        old_big,
+    ]
+
+
+def test_to_process_chunks_rdepends_changes() -> None:
+    def mkwheel(name: str) -> Wheel:
+        args = FOOBAR_1_WHEEL.copy()
+        args["filename"] = f"{name}-1.0-py3-none-any.whl"
+        args["url"] = f"http://example.com/{name}-1.0-py3-none-any.whl"
+        return Project.ensure(name).ensure_version("1.0").ensure_wheel(**args)
+
+    def user_data(dependency: str) -> dict:
+        derived = {"dependencies": [dependency], "keywords": [], "modules": []}
+        return {**FOOBAR_1_DATA, "project": "user", "derived": derived}
+
+    a, b, c = mkwheel("a"), mkwheel("b"), mkwheel("c")
+    user = Project.ensure("user").ensure_version("1.0").ensure_wheel(**QUUX_1_5_WHEEL)
+    user.set_data(user_data("quux"))
+    db.session.flush()
+    chunks = Wheel.to_process_chunks(chunk_size=1, order=["rdepends"])
+
+    def take() -> list[Wheel]:
+        chunk = next(chunks)
+        Wheel.claim([whl.id for whl in chunk], "test", timedelta(hours=1))
+        return list(chunk)
+
+    assert take() == [a]
+    # Gaining a reverse dependency moves `c` ahead of `b` ...
+    user.set_data(user_data("c"))
+    assert take() == [c]
+    # ... and losing it to `b` moves it back:
+    Wheel.release_leases("test")
+    user.set_data(user_data("b"))
+    assert take() == [b]
+    assert take() == [a]
+    assert take() == [c]
+    assert list(chunks) == []
+
+
+def test_to_process_chunks_bad_order() -> None:
+    with pytest.raises(ValueError):
+        next(Wheel.to_process_chunks(order=["bogus"]))
+
+
+def test_to_reprocess() -> None:
+    p = Project.ensure("FooBar")
+    whl1 = p.ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL)
+    whl1b = p.ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL2)
+    whl2 = p.ensure_version("2.0").ensure_wheel(**FOOBAR_2_WHEEL)
+    for whl, v in [(whl1, "1.6.0"), (whl1b, "1.7.1"), (whl2, "1.8.0")]:
+        whl.set_data(FOOBAR_1_DATA)
+        assert whl.data is not None
+        whl.data.wheel_inspect_version = v
+    db.session.flush()
+    assert sorted(WheelData.inspect_versions()) == ["1.6.0", "1.7.1", "1.8.0"]
+    assert sorted(stale_inspect_versions("1.8.0")) == ["1.6.0", "1.7.1"]
+    assert stale_inspect_versions("1.8.0", after="1.7") == ["1.7.1"]
+    ids = sorted([whl1.id, whl1b.id])
+    assert Wheel.to_reprocess(["1.6.0", "1.7.1"]) == [
+        db.session.get(Wheel, i) for i in ids
+    ]
+    assert Wheel.to_reprocess(["1.6.0", "1.7.1"], limit=1) == [
+        db.session.get(Wheel, ids[0])
+    ]
+    assert Wheel.to_reprocess(["1.6.0", "1.7.1"], after_id=ids[0]) == [
+        db.session.get(Wheel, ids[1])
+    ]
+    assert Wheel.to_reprocess(["1.6.0", "1.7.1"], max_wheel_size=65500) == [whl1b]
+    assert Wheel.to_reprocess(["1.8.0"]) == [whl2]
+
+
 def test_to_process_skip_error() -> None:
     assert Wheel.to_process() == []
     p = Project.ensure("FooBar")
@@ -646,11 +1018,303 @@ def test_set_data_with_dependency() -> None:
     assert whl1.data.dependencies == [p2]
 
 
+def test_set_data_related_rows() -> None:
+    p = Project.ensure("foobar")
+    whl1 = p.ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL)
+    data = {
+        "project": "FooBar",
+        "version": "1.0",
+        "valid": True,
+        "dist_info": {
+            "record": [
+                {"path": "foobar/__init__.py"},
+                {"path": "foobar/cli.py"},
+                {"path": "foobar/__init__.py"},
+            ],
+            "entry_points": {
+                "console_scripts": {"foobar": {}, "fb": {}},
+                "foobar.plugins": {"core": {}},
+            },
+        },
+        "derived": {
+            "dependencies": ["glarch", "quux"],
+            "keywords": ["foo", "bar"],
+            "modules": ["foobar", "foobar.cli"],
+        },
+    }
+    whl1.set_data(data)
+    assert whl1.data is not None
+    assert sorted(f.path for f in whl1.data.files) == [
+        "foobar/__init__.py",
+        "foobar/cli.py",
+    ]
+    assert sorted(m.name for m in whl1.data.modules) == ["foobar", "foobar.cli"]
+    assert sorted(kw.name for kw in whl1.data.keywords) == ["bar", "foo"]
+    assert sorted((ep.group.name, ep.name) for ep in whl1.data.entry_points) == [
+        ("console_scripts", "fb"),
+        ("console_scripts", "foobar"),
+        ("foobar.plugins", "core"),
+    ]
+    assert sorted(proj.name for proj in whl1.data.dependencies) == ["glarch", "quux"]
+    assert {rel.source_project_id for rel in whl1.data.dependency_rels} == {p.id}
+    # Replacing the data replaces the related rows:
+    whl1.set_data(FOOBAR_1_DATA)
+    assert whl1.data.files == []
+    assert whl1.data.entry_points == []
+    assert whl1.data.dependencies == []
+    # Deleting the old WheelData deleted its related rows but not its Wheel:
+    for model in (File, EntryPoint, DependencyRelation):
+        assert db.session.scalar(db.select(db.func.count()).select_from(model)) == 0
+    assert get_all(Wheel) == [whl1]
+
+
+def test_store_result_savepoint() -> None:
+    p = Project.ensure("FooBar")
+    whl1 = p.ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL)
+    whl2 = p.ensure_version("2.0").ensure_wheel(**FOOBAR_2_WHEEL)
+    db.session.flush()
+    res1 = WheelResult(
+        job=WheelJob.from_wheel(whl1), worker="test", elapsed=0, about=FOOBAR_1_DATA
+    )
+    assert store_result(res1)
+    assert set(res1.timings.for_json()) == {"build", "flush"}
+    bad_data = {
+        **FOOBAR_2_DATA,
+        # Duplicate dependencies violate the primary key of `dependency_tbl`
+        "derived": {"dependencies": ["quux", "quux"], "keywords": [], "modules": []},
+    }
+    assert not store_result(
+        WheelResult(
+            job=WheelJob.from_wheel(whl2), worker="test", elapsed=0, about=bad_data
+        )
+    )
+    db.session.flush()
+    assert whl1.data is not None
+    assert whl2.data is None
+    assert len(whl2.errors) == 1
+    assert Project.get_or_none("quux") is None
+
+
+def test_retry_policy() -> None:
+    p = Project.ensure("FooBar")
+    whl = p.ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL)
+    db.session.flush()
+    assert Wheel.to_process() == [whl]
+    retry = RetryPolicy(max_retries=2, backoff=60)
+    res = WheelResult(
+        job=WheelJob.from_wheel(whl),
+        worker="test",
+        elapsed=0,
+        error="Traceback ...",
+        transient=True,
+    )
+    before = datetime.now(timezone.utc)
+    assert retry.defer(res)
+    assert whl.retries == 1
+    assert whl.retry_after is not None
+    assert before + timedelta(seconds=60) <= whl.retry_after
+    assert whl.errors == []
+    assert Wheel.to_process() == []
+    assert retry.defer(res)
+    assert whl.retries == 2
+    assert whl.retry_after >= before + timedelta(seconds=120)
+    # Retries exhausted:
+    assert not retry.defer(res)
+    assert whl.retries == 2
+    # The wheel reenters the queue once its retry time arrives:
+    whl.retry_after = before
+    db.session.flush()
+    assert Wheel.to_process() == [whl]
+    whl.set_data(FOOBAR_1_DATA)
+    assert whl.retries == 0
+    assert whl.retry_after is None
+
+
+def test_retry_policy_permanent() -> None:
+    p = Project.ensure("FooBar")
+    whl = p.ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL)
+    db.session.flush()
+    res = WheelResult(
+        job=WheelJob.from_wheel(whl), worker="test", elapsed=0, error="Traceback ..."
+    )
+    assert not RetryPolicy().defer(res)
+    assert whl.retries == 0
+    assert whl.retry_after is None
+
+
+def leased_by(whl: Wheel) -> str | None:
+    r = db.session.scalar(db.select(Wheel.leased_by).where(Wheel.id == whl.id))
+    assert r is None or isinstance(r, str)
+    return r
+
+
+def test_wheel_leases() -> None:
+    p = Project.ensure("FooBar")
+    whl1 = p.ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL)
+    whl2 = p.ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL2)
+    db.session.flush()
+    assert sort_wheels(Wheel.to_process()) == [whl2, whl1]
+    Wheel.claim([whl1.id], "host-a:1", timedelta(hours=1))
+    assert leased_by(whl1) == "host-a:1"
+    assert Wheel.to_process() == [whl2]
+    Wheel.claim([whl2.id], "host-b:2", timedelta(hours=1))
+    assert Wheel.to_process() == []
+    # An expired lease returns the wheel to the queue:
+    whl2.lease_expires = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.session.flush()
+    assert Wheel.to_process() == [whl2]
+    assert Wheel.renew_leases("host-b:2", timedelta(hours=1)) == 1
+    db.session.expire_all()
+    assert Wheel.to_process() == []
+    Wheel.release_leases("host-a:1")
+    assert leased_by(whl1) is None
+    assert Wheel.to_process() == [whl1]
+    whl2.release_lease()
+    db.session.flush()
+    assert sort_wheels(Wheel.to_process()) == [whl2, whl1]
+
+
+def test_queued_jobs_lease() -> None:
+    p = Project.ensure("FooBar")
+    whl1 = p.ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL)
+    whl2 = p.ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL2)
+    db.session.flush()
+    lease = Lease(duration=3600, owner="host-a:1")
+    committer = Committer(every=10)
+    jobs = queued_jobs(
+        max_wheel_size=None,
+        metadata=False,
+        chunk_size=1,
+        lease=lease,
+        committer=committer,
+    )
+    job = next(jobs)
+    assert job.id == whl1.id
+    assert lease.claimed == 1
+    assert committer.commits == 1
+    assert leased_by(whl1) == "host-a:1"
+    assert leased_by(whl2) is None
+    # Another run sees only the unclaimed wheel:
+    assert [w.id for w in next(Wheel.to_process_chunks(chunk_size=2, lock=True))] == [
+        whl2.id
+    ]
+    lease.release_all()
+    assert leased_by(whl1) is None
+    assert len(Wheel.to_process()) == 2
+    # Clean up the committed data:
+    db.session.delete(p)
+    db.session.commit()
+
+
+def test_raw_data_deferred() -> None:
+    whl = Project.ensure("foobar").ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL)
+    whl.set_data(FOOBAR_1_DATA)
+    db.session.flush()
+    db.session.expire_all()
+    wd = db.session.scalars(db.select(WheelData)).one()
+    assert "raw_data" not in wd.__dict__
+    assert wd.raw_data == FOOBAR_1_DATA
+
+
+def test_dependency_graph() -> None:
+    def data_with_deps(project: str, deps: list[str]) -> dict:
+        derived = {"dependencies": deps, "keywords": [], "modules": []}
+        return {**FOOBAR_1_DATA, "project": project, "derived": derived}
+
+    def rdepends(name: str) -> tuple[int, list[str]]:
+        p = Project.get_or_none(name)
+        assert p is not None
+        names = [q.name for q in db.session.scalars(p.rdepends_query())]
+        assert p.rdepends_count() == len(names)
+        return (p.rdepends_qty, names)
+
+    foo = Project.ensure("FooBar")
+    whl1 = foo.ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL)
+    whl1b = foo.ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL2)
+    whl1.set_data(data_with_deps("FooBar", ["glarch", "quux"]))
+    whl1b.set_data(data_with_deps("FooBar", ["glarch"]))
+    assert rdepends("glarch") == (1, ["foobar"])
+    assert rdepends("quux") == (1, ["foobar"])
+    bar_args = FOOBAR_1_WHEEL.copy()
+    bar_args["filename"] = "bar-1.0-py3-none-any.whl"
+    bar = Project.ensure("bar")
+    bar.ensure_version("1.0").ensure_wheel(**bar_args).set_data(
+        data_with_deps("bar", ["glarch"])
+    )
+    assert rdepends("glarch") == (2, ["bar", "foobar"])
+    # Replacing data drops edges it alone supported:
+    whl1.set_data(data_with_deps("FooBar", ["glarch"]))
+    assert rdepends("quux") == (0, [])
+    assert rdepends("glarch") == (2, ["bar", "foobar"])
+    remove_wheel(whl1.filename)
+    assert rdepends("glarch") == (2, ["bar", "foobar"])
+    foo.remove_version("1.0")
+    assert rdepends("glarch") == (1, ["bar"])
+    bar.remove()
+    assert rdepends("glarch") == (0, [])
+
+
+def test_change_dependencies_existing_edges() -> None:
+    # Edges that already exist (e.g., because a concurrent transaction added
+    # them) are not counted twice, nor are already-removed edges uncounted:
+    foo = Project.ensure("foobar")
+    glarch = Project.ensure("glarch")
+    foo.change_dependencies(added={glarch.id}, removed=set())
+    foo.change_dependencies(added={glarch.id}, removed=set())
+    assert glarch.rdepends_qty == 1
+    foo.change_dependencies(added=set(), removed={glarch.id})
+    foo.change_dependencies(added=set(), removed={glarch.id})
+    assert glarch.rdepends_qty == 0
+
+
+@pytest.mark.parametrize("with_data", [False, True])
+def test_as_json(with_data: bool) -> None:
+    whl = Project.ensure("FooBar").ensure_version("1.0").ensure_wheel(**FOOBAR_1_WHEEL)
+    whl.add_error("Boom")
+    meta = None
+    if with_data:
+        whl.set_data(FOOBAR_1_DATA, inspection=InspectionMode.REMOTE)
+        assert whl.data is not None
+        whl.data.processed = datetime(2018, 10, 4, 2, 3, 4, tzinfo=timezone.utc)
+        meta = JsonWheelMeta(
+            processed=whl.data.processed,
+            wheel_inspect_version=whl.data.wheel_inspect_version,
+            inspection=InspectionMode.REMOTE,
+        )
+    expected = JsonWheel(
+        pypi=JsonWheelPyPI(project="FooBar", version="1.0", **FOOBAR_1_WHEEL),
+        data=FOOBAR_1_DATA if with_data else None,
+        wheelodex=meta,
+        errored=True,
+    ).model_dump(mode="json")
+    assert whl.as_json() == expected
+    assert list(whl.as_json()) == list(expected)
+
+
+def test_dump_chunks() -> None:
+    p = Project.ensure("FooBar")
+    wheels = []
+    for i in range(5):
+        args = FOOBAR_1_WHEEL.copy()
+        args["filename"] = f"FooBar-1.{i}-py3-none-any.whl"
+        whl = p.ensure_version(f"1.{i}").ensure_wheel(**args)
+        if i != 2:
+            whl.set_data(FOOBAR_1_DATA)
+        wheels.append(whl)
+    db.session.flush()
+    chunks = list(Wheel.dump_chunks(chunk_size=2))
+    assert chunks == [[wheels[0], wheels[1]], [wheels[3], wheels[4]]]
+    chunks = list(Wheel.dump_chunks(dump_all=True, chunk_size=2))
+    assert chunks == [wheels[:2], wheels[2:4], wheels[4:]]
+
+
+def test_create_app_unsupported_backend() -> None:
+    # Upserts are only available on PostgreSQL & SQLite, so other backends are
+    # rejected up front rather than failing when a row is first registered.
+    with pytest.raises(ValueError, match="Unsupported database backend 'mysql'"):
+        create_app(SQLALCHEMY_DATABASE_URI="mysql://localhost/wheelodex")
+
+
 ### TODO: TO TEST:
-# Adding WheelData with (more) dependencies, entry points, etc.
 # `wheel.data = None` deletes the WheelData entry
 # Deleting a Wheel deletes its WheelData
-# Deleting a WheelData deletes its dependencies and entry points
-# Deleting a WheelData doesn't affect its Wheel
-# Version.ordering?
-# Project.preferred_wheel and Project.best_wheel when the highest version has multiple wheels with data
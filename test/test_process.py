@@ -0,0 +1,893 @@
+from __future__ import annotations
+from base64 import urlsafe_b64encode
+from collections.abc import Iterator
+from dataclasses import replace
+from datetime import datetime, timezone
+import hashlib
+from io import SEEK_END, BytesIO
+import json
+from pathlib import Path
+import pickle
+import tracemalloc
+from typing import Any, cast
+from zipfile import BadZipFile, ZipFile
+import pytest
+import requests
+from click.testing import CliRunner
+from flask import current_app
+from sqlalchemy import text
+from wheel_inspect import __version__ as wheel_inspect_version
+from wheel_inspect import inspect_wheel
+from wheelodex.__main__ import main
+from wheelodex.app import create_app
+from wheelodex.models import File, Keyword, Module, Project, Wheel, WheelData, db
+import wheelodex.process
+from wheelodex.process import (
+    Analyzer,
+    Budget,
+    Committer,
+    QueueStats,
+    WheelJob,
+    WheelResult,
+    download,
+    is_transient,
+    process_queue,
+    process_wheel,
+)
+from wheelodex.remotezip import HTTPRangeFile
+from wheelodex.sandbox import InspectorPool, SandboxLimits
+from wheelodex.throttle import DownloadScheduler
+from wheelodex.timing import StageTimings
+from wheelodex.wheelcache import WheelCache
+from wheelodex.wheelfile import inspect_metadata, inspect_remote_wheel
+
+WHEEL_FILES = {
+    "foo/__init__.py": b"print('Hello, world!')\n",
+    "foo-1.0.dist-info/METADATA": (
+        b"Metadata-Version: 2.1\n"
+        b"Name: foo\n"
+        b"Version: 1.0\n"
+        b"Summary: A test wheel\n"
+        b"Requires-Dist: bar\n"
+    ),
+    "foo-1.0.dist-info/WHEEL": (
+        b"Wheel-Version: 1.0\n"
+        b"Generator: handmade\n"
+        b"Root-Is-Purelib: true\n"
+        b"Tag: py3-none-any\n"
+    ),
+    "foo-1.0.dist-info/entry_points.txt": b"[console_scripts]\nfoo = foo:main\n",
+}
+
+
+def make_wheel(
+    path: Path, project: str = "foo", extra: dict[str, bytes] | None = None
+) -> bytes:
+    record = []
+    with ZipFile(path, "w") as zf:
+        for name, data in {**WHEEL_FILES, **(extra or {})}.items():
+            name = name.replace("foo", project)
+            data = data.replace(b"foo", project.encode())
+            zf.writestr(name, data)
+            digest = urlsafe_b64encode(hashlib.sha256(data).digest()).decode()
+            digest = digest.rstrip("=")
+            record.append(f"{name},sha256={digest},{len(data)}\n")
+        record.append(f"{project}-1.0.dist-info/RECORD,,\n")
+        zf.writestr(f"{project}-1.0.dist-info/RECORD", "".join(record))
+    return path.read_bytes()
+
+
+def mkjob(data: bytes, **kwargs: Any) -> WheelJob:
+    job = WheelJob(
+        id=1,
+        filename="foo-1.0-py3-none-any.whl",
+        url="https://example.com/foo-1.0-py3-none-any.whl",
+        size=len(data),
+        md5=hashlib.md5(data).hexdigest(),
+        sha256=hashlib.sha256(data).hexdigest(),
+    )
+    return replace(job, **kwargs)
+
+
+class FakeResponse:
+    def __init__(self, data: bytes, chunk_size: int, status_code: int = 200) -> None:
+        self.data = data
+        self.chunk_size = chunk_size
+        self.chunks_read = 0
+        self.status_code = status_code
+
+    def __enter__(self) -> FakeResponse:
+        return self
+
+    def __exit__(self, *_exc: Any) -> None:
+        pass
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def iter_content(self, _chunk_size: int) -> Iterator[bytes]:
+        for i in range(0, len(self.data), self.chunk_size):
+            self.chunks_read += 1
+            yield self.data[i : i + self.chunk_size]
+
+
+class FakeSession:
+    def __init__(self, data: bytes, chunk_size: int = 1024) -> None:
+        self.response = FakeResponse(data, chunk_size)
+        self.urls: list[str] = []
+
+    def get(self, url: str, **_kwargs: Any) -> FakeResponse:
+        self.urls.append(url)
+        return self.response
+
+
+def as_session(s: FakeSession | FakeRangeSession) -> requests.Session:
+    return s  # type: ignore[return-value]
+
+
+def test_download(tmp_path: Path) -> None:
+    data = make_wheel(tmp_path / "src.whl")
+    job = mkjob(data)
+    s = FakeSession(data)
+    buf = BytesIO()
+    download(as_session(s), job, buf)
+    assert s.urls == [job.url]
+    assert buf.getvalue() == data
+
+
+def test_download_oversized_aborts_early() -> None:
+    data = bytes(range(256)) * 64
+    job = mkjob(data, size=1000)
+    s = FakeSession(data, chunk_size=512)
+    with pytest.raises(ValueError, match="Size mismatch"):
+        download(as_session(s), job, BytesIO())
+    assert s.response.chunks_read == 2
+
+
+def test_download_truncated() -> None:
+    data = bytes(range(256)) * 64
+    job = mkjob(data, size=len(data) + 1)
+    with pytest.raises(ValueError, match="Size mismatch"):
+        download(as_session(FakeSession(data)), job, BytesIO())
+
+
+@pytest.mark.parametrize("alg", ["md5", "sha256"])
+def test_download_digest_mismatch(alg: str) -> None:
+    data = bytes(range(256)) * 64
+    job = mkjob(data, **{alg: "0123456789abcdef"})
+    with pytest.raises(ValueError, match=f"{alg} hash mismatch"):
+        download(as_session(FakeSession(data)), job, BytesIO())
+
+
+@pytest.mark.parametrize("inmemory", [False, True])
+def test_process_wheel_matches_inspect_wheel(tmp_path: Path, inmemory: bool) -> None:
+    path = tmp_path / "foo-1.0-py3-none-any.whl"
+    data = make_wheel(path)
+    job = mkjob(data)
+    about = process_wheel(job, BytesIO(data) if inmemory else path)
+    assert about == inspect_wheel(path)
+    assert about["valid"]
+    assert about["derived"]["dependencies"] == ["bar"]
+
+
+class FakeRangeResponse:
+    def __init__(self, data: bytes, rangespec: str | None) -> None:
+        self.headers: dict[str, str] = {}
+        if rangespec is None:
+            self.status_code = 200
+            self.content = data
+        else:
+            start, _, end = rangespec.removeprefix("bytes=").partition("-")
+            self.status_code = 206
+            self.content = data[int(start) : int(end) + 1]
+            self.headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+
+    def __enter__(self) -> FakeRangeResponse:
+        return self
+
+    def __exit__(self, *_exc: Any) -> None:
+        pass
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+class FakeRangeSession:
+    def __init__(self, data: bytes, honor_ranges: bool = True) -> None:
+        self.data = data
+        self.honor_ranges = honor_ranges
+        self.ranges: list[str] = []
+
+    def get(
+        self, _url: str, headers: dict[str, str] | None = None, **_kwargs: Any
+    ) -> FakeRangeResponse:
+        rangespec = (headers or {}).get("Range")
+        if rangespec is not None:
+            self.ranges.append(rangespec)
+        if not self.honor_ranges:
+            rangespec = None
+        return FakeRangeResponse(self.data, rangespec)
+
+
+def test_http_range_file() -> None:
+    data = bytes(range(256)) * 64
+    s = FakeRangeSession(data)
+    fp = HTTPRangeFile(as_session(s), "https://example.com/x", len(data), 1024)
+    fp.seek(-10, SEEK_END)
+    assert fp.read() == data[-10:]
+    fp.seek(1000)
+    assert fp.read(3000) == data[1000:4000]
+    fp.seek(1020)
+    assert fp.read(10) == data[1020:1030]
+    # The last read is served entirely from cached blocks:
+    assert s.ranges == ["bytes=15360-16383", "bytes=0-4095"]
+    assert fp.requests == 2
+    assert fp.bytes_fetched == 5120
+
+
+def test_http_range_file_no_range_support() -> None:
+    data = bytes(range(256)) * 64
+    s = FakeRangeSession(data, honor_ranges=False)
+    fp = HTTPRangeFile(as_session(s), "https://example.com/x", len(data))
+    with pytest.raises(ValueError, match="did not honor range request"):
+        fp.read(10)
+
+
+def test_http_range_file_size_mismatch() -> None:
+    data = bytes(range(256)) * 64
+    s = FakeRangeSession(data)
+    fp = HTTPRangeFile(as_session(s), "https://example.com/x", len(data) - 1)
+    with pytest.raises(ValueError, match="Size mismatch"):
+        fp.read(10)
+
+
+def test_inspect_remote_wheel(tmp_path: Path) -> None:
+    path = tmp_path / "foo-1.0-py3-none-any.whl"
+    data = make_wheel(path)
+    # Pad the wheel with a large uncompressed member that should never be
+    # fetched
+    with ZipFile(path, "a") as zf:
+        zf.writestr("foo/data.bin", bytes(1 << 20))
+    data = path.read_bytes()
+    job = mkjob(data)
+    s = FakeRangeSession(data)
+    about = inspect_remote_wheel(
+        as_session(s),
+        job.filename,
+        job.url,
+        size=job.size,
+        md5=job.md5,
+        sha256=job.sha256,
+    )
+    expected = inspect_wheel(path)
+    # The padding isn't in the RECORD, so full inspection fails verification:
+    assert not expected["valid"]
+    assert about["valid"]
+    for key in ["filename", "project", "version", "file", "dist_info", "derived"]:
+        assert about[key] == expected[key]
+    fetched = sum(
+        int(end) - int(start) + 1
+        for start, _, end in (r.removeprefix("bytes=").partition("-") for r in s.ranges)
+    )
+    assert fetched < len(data) // 4
+
+
+def test_inspect_metadata() -> None:
+    metadata = WHEEL_FILES["foo-1.0.dist-info/METADATA"]
+    about = inspect_metadata(
+        "foo-1.0-py3-none-any.whl",
+        metadata,
+        size=1234,
+        md5="0123456789abcdef",
+        sha256="fedcba9876543210",
+    )
+    assert about["valid"]
+    assert about["file"] == {
+        "size": 1234,
+        "digests": {"md5": "0123456789abcdef", "sha256": "fedcba9876543210"},
+    }
+    assert about["dist_info"]["metadata"]["summary"] == "A test wheel"
+    assert "record" not in about["dist_info"]
+    assert "wheel" not in about["dist_info"]
+    assert about["derived"]["dependencies"] == ["bar"]
+    assert about["derived"]["modules"] == []
+
+
+def test_cached_download(tmp_path: Path) -> None:
+    data = bytes(range(256)) * 64
+    job = mkjob(data)
+    analyzer = Analyzer(tmpdir=tmp_path, cache=WheelCache(tmp_path / "cache", None))
+    s = FakeSession(data)
+    path, cached = analyzer.cached_download(as_session(s), job)
+    assert not cached
+    assert path.read_bytes() == data
+    path2, cached = analyzer.cached_download(as_session(s), job)
+    assert cached
+    assert path2 == path
+    assert s.urls == [job.url]
+
+
+def test_cached_download_corrupt(tmp_path: Path) -> None:
+    data = bytes(range(256)) * 64
+    job = mkjob(data)
+    analyzer = Analyzer(tmpdir=tmp_path, cache=WheelCache(tmp_path / "cache", None))
+    s = FakeSession(data)
+    path, _ = analyzer.cached_download(as_session(s), job)
+    path.write_bytes(data[:-1] + b"\0")
+    path2, cached = analyzer.cached_download(as_session(s), job)
+    assert not cached
+    assert path2.read_bytes() == data
+    assert s.urls == [job.url, job.url]
+
+
+def test_analyze_cached_in_place(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    data = make_wheel(tmp_path / "src.whl")
+    job = mkjob(data)
+    analyzer = Analyzer(
+        tmpdir=tmp_path,
+        inmemory_size=len(data),
+        cache=WheelCache(tmp_path / "cache", None),
+    )
+    sources: list[Path | BytesIO] = []
+
+    def spy(job: WheelJob, src: Path | BytesIO) -> dict:
+        sources.append(src)
+        return process_wheel(job, src)
+
+    monkeypatch.setattr(wheelodex.process, "process_wheel", spy)
+    s = FakeSession(data)
+    assert not analyzer.analyze(as_session(s), job).cached
+    res = analyzer.analyze(as_session(s), job)
+    assert res.cached
+    assert res.error is None
+    assert s.urls == [job.url]
+    # Wheels in the cache are inspected in place rather than read into memory
+    # even if they are small enough to download into memory:
+    assert len(sources) == 2
+    assert all(isinstance(src, Path) for src in sources)
+
+
+def test_analyze_inmemory_no_copy(tmp_path: Path) -> None:
+    # Pad the wheel with an uncompressed file so that a second copy of it
+    # would dwarf everything else allocated during analysis
+    data = make_wheel(
+        tmp_path / "src.whl", extra={"foo/blob.bin": bytes(range(256)) * 8192}
+    )
+    job = mkjob(data)
+    analyzer = Analyzer(tmpdir=tmp_path / "tmp", inmemory_size=len(data))
+    s = FakeSession(data, 65536)
+    tracemalloc.start()
+    try:
+        res = analyzer.analyze(as_session(s), job)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert res.error is None
+    assert res.about is not None
+    assert res.about["valid"]
+    # The download buffer over-allocates as it grows, but it is inspected in
+    # place rather than being copied:
+    assert peak < 1.5 * len(data)
+
+
+def test_analyze_sandboxed_inmemory_uses_file(tmp_path: Path) -> None:
+    data = make_wheel(
+        tmp_path / "src.whl", extra={"foo/blob.bin": bytes(range(256)) * 8192}
+    )
+    job = mkjob(data)
+    sources: list[Path | BytesIO] = []
+
+    class FakePool:
+        def run(self, func: Any, job: WheelJob, src: Path | BytesIO) -> Any:
+            # Arguments reach sandbox processes pickled over a pipe
+            job, src = pickle.loads(pickle.dumps((job, src)))
+            sources.append(src)
+            return func(job, src)
+
+    analyzer = Analyzer(
+        tmpdir=tmp_path / "tmp",
+        inmemory_size=len(data),
+        inspectors=cast(InspectorPool, FakePool()),
+    )
+    analyzer.tmpdir.mkdir()
+    s = FakeSession(data, 65536)
+    tracemalloc.start()
+    try:
+        res = analyzer.analyze(as_session(s), job)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert res.error is None
+    # Sandbox processes are handed the path to a temporary file rather than
+    # a copy of the wheel's contents:
+    assert sources == [analyzer.tmpdir / job.filename]
+    assert peak < 0.5 * len(data)
+    assert not any(analyzer.tmpdir.iterdir())
+
+
+def test_budget_max_bytes(tmp_path: Path) -> None:
+    jobs = [mkjob(bytes(100), id=i) for i in range(5)]
+    budget = Budget(max_bytes=250)
+    assert list(budget.limit(Analyzer(tmpdir=tmp_path), jobs)) == jobs[:3]
+    assert budget.exhausted
+
+
+def test_budget_ignores_remote(tmp_path: Path) -> None:
+    jobs = [mkjob(bytes(100), id=i) for i in range(5)]
+    budget = Budget(max_bytes=50)
+    analyzer = Analyzer(tmpdir=tmp_path, remote_size=50)
+    assert list(budget.limit(analyzer, jobs)) == jobs
+    assert not budget.exhausted
+
+
+def test_budget_max_duration(tmp_path: Path) -> None:
+    jobs = [mkjob(bytes(100), id=i) for i in range(5)]
+    budget = Budget(max_duration=60)
+    limited = budget.limit(Analyzer(tmpdir=tmp_path), jobs)
+    assert next(limited) == jobs[0]
+    budget.start -= 60
+    assert list(limited) == []
+    assert budget.exhausted
+
+
+def http_error(status: int) -> requests.HTTPError:
+    r = requests.Response()
+    r.status_code = status
+    return requests.HTTPError(f"{status} Error", response=r)
+
+
+@pytest.mark.parametrize(
+    "e,transient",
+    [
+        (requests.ConnectionError("Connection reset"), True),
+        (requests.ReadTimeout("Read timed out"), True),
+        (requests.exceptions.ChunkedEncodingError("Connection broken"), True),
+        (http_error(503), True),
+        (http_error(429), True),
+        (http_error(404), False),
+        (ValueError("sha256 hash mismatch"), False),
+        (BadZipFile("File is not a zip file"), False),
+    ],
+)
+def test_is_transient(e: Exception, transient: bool) -> None:
+    assert is_transient(e) is transient
+
+
+def test_analyze_transient_error(tmp_path: Path) -> None:
+    class FailingSession:
+        def get(self, url: str, **_kwargs: Any) -> FakeResponse:
+            raise requests.ConnectionError(f"Could not connect to {url}")
+
+    job = mkjob(make_wheel(tmp_path / "src.whl"))
+    res = Analyzer(tmpdir=tmp_path).analyze(
+        cast(requests.Session, FailingSession()), job
+    )
+    assert res.error is not None
+    assert res.transient
+
+
+def test_worker_stats_download_throughput() -> None:
+    stats = QueueStats()
+    job = mkjob(bytes(1000))
+    stats.record(
+        WheelResult(
+            job=job,
+            worker="download_0",
+            elapsed=10.0,
+            timings=StageTimings(download=1.5, digest=0.5, inspect=8.0),
+        )
+    )
+    # Cached wheels aren't downloaded and so don't count towards throughput:
+    stats.record(
+        WheelResult(
+            job=job,
+            worker="download_0",
+            elapsed=5.0,
+            cached=True,
+            timings=StageTimings(digest=0.5, inspect=4.5),
+        )
+    )
+    assert stats.for_json()["workers"]["download_0"] == {
+        "wheels": 2,
+        "bytes": 1000,
+        "busy": 15.0,
+        "downloading": 2.0,
+        "bytes_per_sec": 500,
+    }
+
+
+def test_download_scheduler() -> None:
+    data = b"x" * 4096
+    sched = DownloadScheduler(max_concurrency=2)
+    download(as_session(FakeSession(data)), mkjob(data), BytesIO(), sched)
+    assert sched.limit == 2
+    assert sched.active == 0
+
+
+def test_download_throttled() -> None:
+    class ThrottledResponse(FakeResponse):
+        def raise_for_status(self) -> None:
+            raise http_error(503)
+
+    data = b"x" * 4096
+    s = FakeSession(data)
+    s.response = ThrottledResponse(data, 1024)
+    sched = DownloadScheduler(max_concurrency=4)
+    sched.limit = 4
+    with pytest.raises(requests.HTTPError):
+        download(as_session(s), mkjob(data), BytesIO(), sched)
+    assert sched.limit == 2
+    assert sched.active == 0
+
+
+def test_download_timings() -> None:
+    data = b"x" * 4096
+    timings = StageTimings()
+    download(as_session(FakeSession(data)), mkjob(data), BytesIO(), timings=timings)
+    assert timings.download is not None and timings.download >= 0
+    assert timings.digest is not None and timings.digest > 0
+    assert timings.inspect is None
+
+
+def test_analyze_timings(tmp_path: Path) -> None:
+    data = make_wheel(tmp_path / "src.whl")
+    job = mkjob(data)
+    res = Analyzer(tmpdir=tmp_path).analyze(as_session(FakeSession(data)), job)
+    assert res.error is None
+    assert set(res.timings.for_json()) == {"download", "digest", "inspect"}
+
+
+def test_analyze_sandboxed(tmp_path: Path) -> None:
+    data = make_wheel(tmp_path / "src.whl")
+    job = mkjob(data)
+    with InspectorPool(1, SandboxLimits()) as pool:
+        res = Analyzer(tmpdir=tmp_path, inspectors=pool).analyze(
+            as_session(FakeSession(data)), job
+        )
+    assert res.error is None
+    assert res.about == process_wheel(job, BytesIO(data))
+
+
+def test_analyze_sandbox_limit(tmp_path: Path) -> None:
+    data = make_wheel(tmp_path / "src.whl")
+    job = mkjob(data)
+    with InspectorPool(1, SandboxLimits(timeout=0)) as pool:
+        res = Analyzer(tmpdir=tmp_path, inspectors=pool).analyze(
+            as_session(FakeSession(data)), job
+        )
+    assert res.error is not None
+    assert "InspectionLimitError" in res.error
+    assert not res.transient
+
+
+@pytest.fixture
+def appdb() -> Iterator[None]:
+    # A fresh in-memory database for each test, as `process_queue()` commits
+    with create_app(WHEELODEX_QUEUE_CHUNK_SIZE=3).app_context():
+        db.session.execute(text("PRAGMA foreign_keys=ON"))
+        db.create_all()
+        yield
+
+
+class WheelServer:
+    """
+    Registers wheels in the database and serves them to `requests`.  Requests
+    for URLs in ``failures`` raise the given exceptions, and requests for
+    unknown URLs (such as those of core metadata files) get 404 responses.
+    """
+
+    def __init__(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        self.tmp_path = tmp_path
+        self.wheels: dict[str, bytes] = {}
+        self.failures: dict[str, Exception] = {}
+        self.stored: list[int] = []
+
+        def get(_self: requests.Session, url: str, **_kwargs: Any) -> FakeResponse:
+            if url in self.failures:
+                raise self.failures[url]
+            elif url in self.wheels:
+                return FakeResponse(self.wheels[url], 1024)
+            else:
+                return FakeResponse(b"", 1024, status_code=404)
+
+        def store_result(res: WheelResult) -> bool:
+            self.stored.append(res.job.id)
+            return real_store_result(res)
+
+        real_store_result = wheelodex.process.store_result
+        monkeypatch.setattr(requests.Session, "get", get)
+        monkeypatch.setattr(wheelodex.process, "store_result", store_result)
+
+    def about(self, whl: Wheel) -> dict:
+        """Return the result of inspecting ``whl``"""
+        job = WheelJob.from_wheel(whl)
+        return process_wheel(job, BytesIO(self.wheels[whl.url]))
+
+    def add(
+        self, project: str, corrupt: bool = False, uploaded: datetime | None = None
+    ) -> Wheel:
+        filename = f"{project}-1.0-py3-none-any.whl"
+        url = f"https://example.com/{filename}"
+        data = make_wheel(self.tmp_path / filename, project)
+        self.wheels[url] = data
+        return (
+            Project.ensure(project)
+            .ensure_version("1.0")
+            .ensure_wheel(
+                filename=filename,
+                url=url,
+                size=len(data),
+                md5=hashlib.md5(data).hexdigest(),
+                sha256="0" * 64 if corrupt else hashlib.sha256(data).hexdigest(),
+                uploaded=uploaded or datetime.now(timezone.utc),
+            )
+        )
+
+
+@pytest.mark.usefixtures("appdb")
+def test_process_queue_workers(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    server = WheelServer(tmp_path, monkeypatch)
+    wheels = [server.add(f"proj{i}", corrupt=i % 4 == 0) for i in range(10)]
+    ids = [whl.id for whl in wheels]
+    db.session.commit()
+    process_queue(workers=3)
+    db.session.expire_all()
+    assert sorted(server.stored) == sorted(ids)
+    for i, whl in enumerate(wheels):
+        if i % 4 == 0:
+            assert whl.data is None
+            assert len(whl.errors) == 1
+            assert "sha256 hash mismatch" in whl.errors[0].errmsg
+        else:
+            assert whl.data is not None
+            assert whl.version.project.summary == "A test wheel"
+            assert whl.errors == []
+    assert Wheel.to_process() == []
+
+
+@pytest.mark.usefixtures("appdb")
+def test_process_queue_commit_every_across_chunks(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    server = WheelServer(tmp_path, monkeypatch)
+    for i in range(7):
+        server.add(f"proj{i}")
+    db.session.commit()
+    commits: list[int] = []
+    real_commit = db.session.commit
+
+    def commit() -> None:
+        # Record how many wheels had been stored as of each commit
+        commits.append(len(server.stored))
+        real_commit()
+
+    monkeypatch.setattr(db.session, "commit", commit)
+    logs: list[dict] = []
+    monkeypatch.setattr(
+        wheelodex.process, "emit_json_log", lambda _name, data: logs.append(data)
+    )
+    process_queue(commit_every=2)
+    # Claiming each chunk of three commits the wheel left over from the
+    # previous batch of two, and that commit is counted; the only commit that
+    # the stats don't count is releasing the leases at the end.
+    assert commits == [0, 2, 3, 5, 6, 7, 7]
+    assert logs[0]["commits"] == len(commits) - 1
+    assert logs[0]["claimed"] == 7
+
+
+@pytest.mark.usefixtures("appdb")
+def test_process_queue_priority_changes(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    server = WheelServer(tmp_path, monkeypatch)
+    # `bar` starts at the back of the queue, but every `foo` depends on it, so
+    # it moves to the front once the first chunk of `foo`s has been processed.
+    bar = server.add("bar", uploaded=datetime(2020, 1, 1, tzinfo=timezone.utc))
+    foos = [server.add(f"foo{i}") for i in range(6)]
+    db.session.commit()
+    order = ["rdepends", "recent"]
+    assert next(Wheel.to_process_chunks(chunk_size=7, order=order))[-1] == bar
+    process_queue(order=order)
+    assert server.stored[:3] == [whl.id for whl in reversed(foos[3:])]
+    assert server.stored[3] == bar.id
+    assert sorted(server.stored) == sorted([bar.id, *(whl.id for whl in foos)])
+    db.session.expire_all()
+    assert bar.data is not None
+    assert bar.errors == []
+    assert Wheel.to_process() == []
+
+
+@pytest.mark.usefixtures("appdb")
+def test_process_metadata_missing(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    server = WheelServer(tmp_path, monkeypatch)
+    wheels = [server.add(f"proj{i}") for i in range(5)]
+    db.session.commit()
+    logs: list[dict] = []
+    monkeypatch.setattr(
+        wheelodex.process, "emit_json_log", lambda _name, data: logs.append(data)
+    )
+    process_queue(metadata_only=True)
+    assert logs[0]["wheels"] == 5
+    assert logs[0]["skipped"] == 5
+    assert logs[0]["errors"] == 0
+    assert sorted(server.stored) == sorted(whl.id for whl in wheels)
+    db.session.expire_all()
+    for whl in wheels:
+        assert whl.metadata_unavailable
+        assert whl.data is None
+        assert whl.errors == []
+    # The wheels are out of the metadata queue but still queued for full
+    # processing:
+    assert Wheel.to_process(metadata=True) == []
+    assert len(Wheel.to_process()) == 5
+    process_queue(metadata_only=True)
+    assert logs[1]["wheels"] == 0
+
+
+@pytest.mark.usefixtures("appdb")
+def test_process_metadata_errors(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    server = WheelServer(tmp_path, monkeypatch)
+    flaky = [server.add(f"flaky{i}") for i in range(2)]
+    broken = [server.add(f"broken{i}") for i in range(2)]
+    for whl in flaky:
+        server.failures[whl.url + ".metadata"] = requests.ConnectionError("Reset")
+    for whl in broken:
+        server.failures[whl.url + ".metadata"] = http_error(403)
+    db.session.commit()
+    logs: list[dict] = []
+    monkeypatch.setattr(
+        wheelodex.process, "emit_json_log", lambda _name, data: logs.append(data)
+    )
+    process_queue(metadata_only=True)
+    assert logs[0]["wheels"] == 4
+    assert logs[0]["retries"] == 2
+    assert logs[0]["errors"] == 2
+    db.session.expire_all()
+    for whl in flaky:
+        assert whl.retries == 1
+        assert whl.retry_after is not None
+        assert not whl.metadata_unavailable
+    for whl in broken:
+        assert whl.metadata_unavailable
+        assert whl.retries == 0
+    # Metadata errors are never stored, as they'd keep the wheels from being
+    # fully processed:
+    assert all(whl.errors == [] for whl in flaky + broken)
+    assert Wheel.to_process(metadata=True) == []
+    assert sorted(Wheel.to_process(), key=lambda w: w.id) == broken
+    # Once the flaky wheels run out of retries, they're given up on as well:
+    current_app.config["WHEELODEX_MAX_RETRIES"] = 1
+    for whl in flaky:
+        whl.retry_after = None
+    db.session.commit()
+    process_queue(metadata_only=True)
+    assert logs[1]["wheels"] == 2
+    assert logs[1]["retries"] == 0
+    assert logs[1]["errors"] == 2
+    db.session.expire_all()
+    for whl in flaky:
+        assert whl.metadata_unavailable
+        assert whl.retries == 0
+        assert whl.retry_after is None
+        assert whl.errors == []
+    assert Wheel.to_process(metadata=True) == []
+    assert len(Wheel.to_process()) == 4
+
+
+@pytest.mark.usefixtures("appdb")
+def test_reprocess_replaces_data(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    server = WheelServer(tmp_path, monkeypatch)
+    whl = server.add("proj")
+    stale = json.loads(json.dumps(server.about(whl)))
+    stale["derived"] = {
+        "dependencies": ["olddep"],
+        "keywords": ["oldkw"],
+        "modules": ["oldmod"],
+    }
+    stale["dist_info"]["record"] = [{"path": "old.py"}]
+    whl.set_data(stale)
+    assert whl.data is not None
+    whl.data.wheel_inspect_version = "0.1.0"
+    whl_id = whl.id
+    db.session.commit()
+    r = CliRunner().invoke(main, ["reprocess"], standalone_mode=False)
+    assert r.exit_code == 0, r.output
+    # The command closes the session, detaching `whl`.
+    whl2 = db.session.get(Wheel, whl_id)
+    assert whl2 is not None
+    assert whl2.data is not None
+    assert whl2.data.wheel_inspect_version == wheel_inspect_version
+    assert [p.name for p in whl2.data.dependencies] == ["bar"]
+    assert [m.name for m in whl2.data.modules] == ["proj"]
+    assert whl2.errors == []
+    # The old data's related rows are gone:
+    assert db.session.scalars(db.select(WheelData.id)).all() == [whl2.data.id]
+    assert db.session.scalars(db.select(Module.name)).all() == ["proj"]
+    assert db.session.scalars(db.select(Keyword.name)).all() == []
+    assert "old.py" not in db.session.scalars(db.select(File.path)).all()
+    olddep = Project.get_or_none("olddep")
+    assert olddep is not None
+    assert olddep.rdepends_qty == 0
+    assert olddep.rdepends_count() == 0
+    assert server.stored == [whl_id]
+
+
+@pytest.mark.usefixtures("appdb")
+def test_committer_every() -> None:
+    committer = Committer(every=3)
+    assert [committer.tick() is not None for _ in range(7)] == [
+        False,
+        False,
+        True,
+        False,
+        False,
+        True,
+        False,
+    ]
+    assert committer.commits == 2
+    assert committer.pending == 1
+    assert committer.commit() is not None
+    assert committer.commits == 3
+    assert committer.commit() is None
+    assert committer.commits == 3
+
+
+@pytest.mark.usefixtures("appdb")
+def test_committer_interval(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = 1000.0
+    monkeypatch.setattr(wheelodex.process, "monotonic", lambda: now)
+    committer = Committer(every=100, interval=60, last_commit=now)
+    assert committer.tick() is None
+    now += 30
+    assert committer.tick() is None
+    now += 30
+    assert committer.tick() is not None
+    assert committer.commits == 1
+    assert committer.pending == 0
+    assert committer.last_commit == now
+
+
+@pytest.mark.usefixtures("appdb")
+def test_process_queue_commit_every(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    server = WheelServer(tmp_path, monkeypatch)
+    wheels = [server.add(f"proj{i}") for i in range(7)]
+    ids = [whl.id for whl in wheels]
+    db.session.commit()
+    real_set_data = Wheel.set_data
+
+    def set_data(self: Wheel, raw_data: dict, **kwargs: Any) -> None:
+        real_set_data(self, raw_data, **kwargs)
+        if self.id == ids[4]:
+            raise RuntimeError("Simulated failure after storing data")
+
+    monkeypatch.setattr(Wheel, "set_data", set_data)
+    logs: list[dict] = []
+    monkeypatch.setattr(
+        wheelodex.process, "emit_json_log", lambda _name, data: logs.append(data)
+    )
+    process_queue(commit_every=3)
+    # One commit per claimed chunk, plus two full batches and the final partial
+    # batch:
+    assert logs[0]["commits"] == 6
+    db.session.rollback()
+    for wheel_id in ids:
+        whl = db.session.get(Wheel, wheel_id)
+        assert whl is not None
+        if wheel_id == ids[4]:
+            # Only the failed wheel's savepoint was rolled back:
+            assert whl.data is None
+            assert len(whl.errors) == 1
+            assert "Simulated failure" in whl.errors[0].errmsg
+        else:
+            assert whl.data is not None
+            assert whl.errors == []
@@ -0,0 +1,96 @@
+from __future__ import annotations
+import multiprocessing
+import os
+import time
+import pytest
+from wheelodex.sandbox import (
+    InspectionLimitError,
+    InspectorPool,
+    SandboxLimits,
+    SandboxProcess,
+)
+
+
+def add(x: int, y: int) -> int:
+    return x + y
+
+
+def getpid() -> int:
+    return os.getpid()
+
+
+def fail(msg: str) -> None:
+    raise ValueError(msg)
+
+
+def hang() -> None:
+    time.sleep(60)
+
+
+def hog_memory() -> int:
+    return len(bytearray(512 * 1024 * 1024))
+
+
+def die() -> None:
+    os._exit(3)
+
+
+def test_run() -> None:
+    with InspectorPool(1, SandboxLimits()) as pool:
+        assert pool.run(add, 1, 2) == 3
+        assert pool.run(getpid) != os.getpid()
+
+
+def test_error() -> None:
+    with InspectorPool(1, SandboxLimits()) as pool:
+        with pytest.raises(ValueError, match="^Boom$") as excinfo:
+            pool.run(fail, "Boom")
+        assert "in fail" in str(excinfo.value.__cause__)
+        # The process is still usable:
+        assert pool.run(add, 2, 3) == 5
+        assert pool.started == 1
+
+
+def test_timeout() -> None:
+    with InspectorPool(1, SandboxLimits(timeout=0.5)) as pool:
+        with pytest.raises(InspectionLimitError, match="time limit"):
+            pool.run(hang)
+        assert pool.limit_errors == 1
+        assert pool.run(add, 1, 1) == 2
+        assert pool.started == 2
+
+
+def test_memory_limit() -> None:
+    with InspectorPool(1, SandboxLimits(memory=256 * 1024 * 1024)) as pool:
+        with pytest.raises(InspectionLimitError, match="memory limit"):
+            pool.run(hog_memory)
+        assert pool.run(add, 1, 1) == 2
+
+
+def test_process_death() -> None:
+    with InspectorPool(1, SandboxLimits()) as pool:
+        with pytest.raises(InspectionLimitError, match="exit code 3"):
+            pool.run(die)
+        assert pool.run(add, 1, 1) == 2
+
+
+def test_process_killed_between_tasks() -> None:
+    proc = SandboxProcess(multiprocessing.get_context(), SandboxLimits())
+    try:
+        assert proc.run(add, (1, 1)) == 2
+        proc.process.kill()
+        proc.process.join()
+        with pytest.raises(InspectionLimitError, match="killed by signal"):
+            proc.run(add, (1, 1))
+        assert not proc.alive
+    finally:
+        proc.close()
+
+
+def test_max_tasks() -> None:
+    with InspectorPool(1, SandboxLimits(max_tasks=2)) as pool:
+        pid1 = pool.run(getpid)
+        assert pool.run(getpid) == pid1
+        pid2 = pool.run(getpid)
+        assert pid2 != pid1
+        assert pool.started == 2
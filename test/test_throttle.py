@@ -0,0 +1,114 @@
+from __future__ import annotations
+import threading
+import pytest
+from wheelodex.throttle import DownloadScheduler, is_throttling_status
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, secs: float) -> None:
+        self.sleeps.append(secs)
+        self.now += secs
+
+
+@pytest.mark.parametrize(
+    "status,throttling",
+    [(200, False), (404, False), (408, False), (429, True), (500, True), (503, True)],
+)
+def test_is_throttling_status(status: int, throttling: bool) -> None:
+    assert is_throttling_status(status) is throttling
+
+
+def test_additive_increase() -> None:
+    sched = DownloadScheduler(max_concurrency=3)
+    assert sched.limit == 1
+    sched.succeeded()
+    assert sched.limit == 2
+    sched.succeeded()
+    assert sched.limit == 2
+    sched.succeeded()
+    assert sched.limit == 3
+    for _ in range(6):
+        sched.succeeded()
+    assert sched.limit == 3
+    assert sched.peak == 3
+
+
+def test_multiplicative_decrease() -> None:
+    clock = FakeClock()
+    sched = DownloadScheduler(max_concurrency=8, cooldown=1.0, clock=clock)
+    sched.limit = 8
+    sched.throttled()
+    assert sched.limit == 4
+    # Further signals within the cooldown are ignored:
+    sched.throttled()
+    assert sched.limit == 4
+    clock.now += 1
+    sched.throttled()
+    assert sched.limit == 2
+    clock.now += 1
+    sched.throttled()
+    clock.now += 1
+    sched.throttled()
+    assert sched.limit == 1
+    assert sched.decreases == 3
+
+
+def test_bandwidth_cap() -> None:
+    clock = FakeClock()
+    sched = DownloadScheduler(bandwidth=1000, clock=clock, sleep=clock.sleep)
+    # The bucket starts out full:
+    sched.consume(1000)
+    assert clock.sleeps == []
+    sched.consume(500)
+    assert clock.sleeps == [0.5]
+    sched.consume(2000)
+    assert clock.sleeps == [0.5, 2.0]
+    assert sched.throttled_secs == 2.5
+    assert clock.now == 2.5
+
+
+def test_no_bandwidth_cap() -> None:
+    clock = FakeClock()
+    sched = DownloadScheduler(clock=clock, sleep=clock.sleep)
+    sched.consume(10**9)
+    assert clock.sleeps == []
+
+
+def test_saturation_blocks_increase() -> None:
+    clock = FakeClock()
+    sched = DownloadScheduler(
+        max_concurrency=4, bandwidth=1000, clock=clock, sleep=clock.sleep
+    )
+    sched.consume(2000)
+    sched.succeeded()
+    assert sched.limit == 1
+    # Once the pipe is no longer full, the limit can grow again:
+    clock.now += 10
+    sched.consume(100)
+    sched.succeeded()
+    assert sched.limit == 2
+
+
+def test_slot_limits_concurrency() -> None:
+    sched = DownloadScheduler(max_concurrency=2)
+    entered = threading.Event()
+
+    def other() -> None:
+        with sched.slot():
+            entered.set()
+
+    with sched.slot():
+        assert sched.active == 1
+        t = threading.Thread(target=other)
+        t.start()
+        assert not entered.wait(0.1)
+    assert entered.wait(5)
+    t.join()
+    assert sched.active == 0
@@ -0,0 +1,59 @@
+from __future__ import annotations
+import pytest
+from wheelodex.timing import Histogram, StageStats, StageTimings
+
+
+def test_stage_timings() -> None:
+    timings = StageTimings()
+    assert timings.for_json() == {}
+    timings.add("download", 1.5)
+    timings.add("download", 0.25)
+    with timings.measure("inspect"):
+        pass
+    assert timings.download == 1.75
+    assert timings.inspect is not None
+    assert list(timings.for_json()) == ["download", "inspect"]
+
+
+def test_histogram_empty() -> None:
+    hist = Histogram()
+    assert hist.percentile(50) is None
+    assert hist.for_json() == {
+        "count": 0,
+        "total": 0.0,
+        "p50": None,
+        "p90": None,
+        "p99": None,
+        "max": 0.0,
+    }
+
+
+@pytest.mark.parametrize("pct", [1, 25, 50, 90, 99])
+def test_histogram_percentiles(pct: int) -> None:
+    hist = Histogram()
+    for i in range(1, 1001):
+        hist.add(i / 100)
+    assert hist.count == 1000
+    assert hist.max == 10.0
+    p = hist.percentile(pct)
+    assert p is not None
+    assert p == pytest.approx(pct / 10, rel=0.05)
+
+
+def test_histogram_tiny_values() -> None:
+    hist = Histogram()
+    hist.add(0.0)
+    hist.add(1e-9)
+    assert hist.percentile(100) == 0.0
+
+
+def test_stage_stats() -> None:
+    stats = StageStats()
+    stats.record(StageTimings(download=1.0, digest=0.5))
+    stats.record(StageTimings(download=3.0))
+    data = stats.for_json()
+    assert list(data) == ["download", "digest"]
+    assert data["download"]["count"] == 2
+    assert data["download"]["total"] == 4.0
+    assert data["download"]["max"] == 3.0
+    assert data["digest"]["count"] == 1
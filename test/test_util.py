@@ -1,7 +1,15 @@
 from __future__ import annotations
+from datetime import datetime, timedelta, timezone
 import pytest
-from wheelodex.util import glob2like, latest_version
-from wheelodex.wheel_sort import VersionNoDot, wheel_sort_key
+from wheelodex.util import (
+    JsonWheelMeta,
+    glob2like,
+    json_datetime,
+    latest_version,
+    version_sort_bytes,
+    version_sort_key,
+)
+from wheelodex.wheel_sort import VersionNoDot, wheel_sort_bytes, wheel_sort_key
 
 
 @pytest.mark.parametrize(
@@ -18,6 +26,62 @@ def test_latest_version(versions: list[str], latest: str) -> None:
     assert latest_version(versions) == latest
 
 
+# In ascending order of `version_sort_key()`
+VERSION_ORDER = [
+    "1.0.dev0",
+    "1.0a1.dev1",
+    "1.0a1",
+    "1.0a1.post1",
+    "1.0a2",
+    "1.0b1",
+    "1.0rc1.dev3",
+    "1.0rc1",
+    "1.0rc1.post1",
+    "2.0.dev1",
+    "1!0.1a1",
+    "0",
+    "0.0.0.1",
+    "0.0.1",
+    "0.1",
+    "1.0",
+    "1.0+abc",
+    "1.0+abc.1",
+    "1.0+abc.2",
+    "1.0+abcd",
+    "1.0+1",
+    "1.0+1.abc",
+    "1.0+1.2",
+    "1.0+2",
+    "1.0.post0",
+    "1.0.post1",
+    "1.0.post256",
+    "1.0.1",
+    "1.2",
+    "1.10",
+    "255",
+    "256",
+    "65536",
+    "1!0.1",
+    "2!0",
+]
+
+
+@pytest.mark.parametrize(
+    "lower,higher",
+    list(zip(VERSION_ORDER, VERSION_ORDER[1:])),
+)
+def test_version_sort_bytes(lower: str, higher: str) -> None:
+    assert version_sort_key(lower) < version_sort_key(higher)
+    assert version_sort_bytes(lower) < version_sort_bytes(higher)
+
+
+@pytest.mark.parametrize(
+    "v1,v2", [("1.0", "1"), ("1.0.0", "1"), ("1.0+ABC", "1.0+abc"), ("1.0-1", "1.0.post1")]
+)
+def test_version_sort_bytes_equal(v1: str, v2: str) -> None:
+    assert version_sort_bytes(v1) == version_sort_bytes(v2)
+
+
 # In ascending order
 WHEEL_PREFERENCES = [
     "foo-1.0-nonsense-nonsense-nonsense.whl",
@@ -85,6 +149,7 @@ WHEEL_PREFERENCES = [
 )
 def test_wheel_sort_key(lower: str, higher: str) -> None:
     assert wheel_sort_key(lower) < wheel_sort_key(higher)
+    assert wheel_sort_bytes(lower) < wheel_sort_bytes(higher)
 
 
 VERSIONS_NO_DOTS = [
@@ -117,6 +182,7 @@ VERSIONS_NO_DOTS = [
 )
 def test_version_no_dot(lower: str, higher: str) -> None:
     assert VersionNoDot(lower) < VersionNoDot(higher)
+    assert VersionNoDot(lower).to_bytes() < VersionNoDot(higher).to_bytes()
 
 
 @pytest.mark.parametrize(
@@ -136,3 +202,18 @@ def test_version_no_dot(lower: str, higher: str) -> None:
 )
 def test_glob2like(glob: str, like: str) -> None:
     assert glob2like(glob) == like
+
+
+@pytest.mark.parametrize(
+    "dt",
+    [
+        datetime(2018, 9, 26, 15, 12, 54, tzinfo=timezone.utc),
+        datetime(2018, 10, 3, 11, 27, 17, 234567, tzinfo=timezone.utc),
+        datetime(2018, 10, 3, 11, 27, 17, 230000, tzinfo=timezone.utc),
+        datetime(2018, 10, 3, 11, 27, 17, tzinfo=timezone(timedelta(hours=-4))),
+        datetime(2018, 10, 3, 11, 27, 17),
+    ],
+)
+def test_json_datetime(dt: datetime) -> None:
+    meta = JsonWheelMeta(processed=dt, wheel_inspect_version="1.7.1")
+    assert json_datetime(dt) == meta.model_dump(mode="json")["processed"]
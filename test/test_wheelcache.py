@@ -0,0 +1,94 @@
+from __future__ import annotations
+import hashlib
+import os
+from pathlib import Path
+from typing import IO
+import pytest
+from wheelodex.wheelcache import WheelCache
+
+
+def put(cache: WheelCache, data: bytes) -> str:
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    def write(fp: IO[bytes]) -> None:
+        fp.write(data)
+
+    cache.add(sha256, len(data), write)
+    return sha256
+
+
+def test_add_get(tmp_path: Path) -> None:
+    cache = WheelCache(tmp_path, None)
+    sha256 = put(cache, b"foo")
+    path = cache.get(sha256)
+    assert path == tmp_path / sha256[:2] / sha256[2:4] / sha256
+    assert path.read_bytes() == b"foo"
+    assert cache.total_bytes == 3
+    assert cache.get("0" * 64) is None
+
+
+def test_add_failure(tmp_path: Path) -> None:
+    cache = WheelCache(tmp_path, None)
+
+    def write(fp: IO[bytes]) -> None:
+        fp.write(b"partial")
+        raise ValueError("Download failed")
+
+    with pytest.raises(ValueError):
+        cache.add("0" * 64, 7, write)
+    assert cache.get("0" * 64) is None
+    assert cache.total_bytes == 0
+    assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
+
+
+def test_lru_eviction(tmp_path: Path) -> None:
+    cache = WheelCache(tmp_path, 10)
+    a = put(cache, b"aaaa")
+    b = put(cache, b"bbbb")
+    assert cache.get(a) is not None
+    c = put(cache, b"cccc")
+    assert cache.get(b) is None
+    assert cache.get(a) is not None
+    assert cache.get(c) is not None
+    assert cache.total_bytes == 8
+
+
+def test_pinned_not_evicted(tmp_path: Path) -> None:
+    cache = WheelCache(tmp_path, 10)
+    a = put(cache, b"aaaa")
+    b = put(cache, b"bbbb")
+    with cache.pinned(a):
+        c = put(cache, b"cccc")
+        assert cache.get(a) is not None
+        assert cache.get(b) is None
+        # With nothing left to evict, the cache exceeds its limit:
+        with cache.pinned(c):
+            d = put(cache, b"dddd")
+        assert cache.total_bytes == 12
+    assert cache.pins == {}
+    put(cache, b"eeee")
+    assert cache.get(a) is None
+    assert cache.get(c) is None
+    assert cache.get(d) is not None
+    assert cache.total_bytes == 8
+
+
+def test_discard(tmp_path: Path) -> None:
+    cache = WheelCache(tmp_path, None)
+    sha256 = put(cache, b"foo")
+    cache.discard(sha256)
+    assert cache.get(sha256) is None
+    assert cache.total_bytes == 0
+
+
+def test_reload_preserves_recency(tmp_path: Path) -> None:
+    cache = WheelCache(tmp_path, None)
+    a = put(cache, b"aaaa")
+    b = put(cache, b"bbbb")
+    os.utime(cache.path_for(a), (1000, 2000))
+    os.utime(cache.path_for(b), (1000, 1000))
+    cache2 = WheelCache(tmp_path, 10)
+    assert cache2.total_bytes == 8
+    put(cache2, b"cccc")
+    assert cache2.get(a) is not None
+    assert cache2.get(b) is None